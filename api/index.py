@@ -1,18 +1,52 @@
 import os
+import sys
+
+# Make the shared modules in the project root importable
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# Time every import made during startup; reported by /debug/size
+from startup import ImportProfiler, STARTUP_STAGES, mark_stage
+IMPORT_PROFILER = ImportProfiler().install()
+
 import json
-from flask import Flask, request, jsonify, render_template
-import openai
+import logging
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 import tempfile
+import traceback
 from datetime import datetime
-import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Initialize Flask app with correct template folder path
 # For Vercel deployment, we need to use absolute paths
 template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'templates'))
 app = Flask(__name__, template_folder=template_dir)
 
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from bm25_index import load_or_build
+from data_store import DataStore
+from policy_sections import index_sections
+from flight_feed import start_flight_feed
+from streaming import EscalationFilter, sse_event
+from session_store import ConversationSession, create_session_store
+from batch_chat import BatchRunner
+from response_cache import create_response_cache, is_faq_question, mentions_loyalty_tiers
+from intent_router import IntentRouter, intent_router_enabled
+from llm_backend import get_backend
+from embedding_client import EmbeddingClient, create_embedding_store
+from history_budget import PromptBudget, build_history_summary_prompt, history_summary_max_tokens
+from escalation import ESCALATION_LATENCY, build_combined_instructions, get_escalation_mode, parse_combined_output
+from observability import (PROMETHEUS_CONTENT_TYPE, configure_logging, finish_trace, record_span, render_metrics,
+                           set_path, span, start_trace)
+
+# Log level comes from LOG_LEVEL (see observability.py)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Chat completions and embeddings come from the backend selected by LLM_BACKEND: the
+# OpenAI API (the SDK is imported on first use) or an in-process mock (see llm_backend.py)
+BACKEND = get_backend()
 
 # Create a temporary directory for files - with error handling
 temp_dir = tempfile.gettempdir()
@@ -50,7 +84,7 @@ try:
             with open(file_path, 'w') as f:
                 f.write(content)
 except Exception as e:
-    print(f"Error creating policy files: {e}")
+    logger.error("Error creating policy files: %s", e)
 
 # Sample data
 FLIGHTS_DATA = [
@@ -65,14 +99,19 @@ CUSTOMERS_DATA = [
     {"customer_id": "C003", "name": "Alice Brown", "email": "alice@example.com", "flight_id": "FL003", "loyalty_tier": "Standard"}
 ]
 
-# Write to temp directory
+# Write to temp directory, keeping files that are already there so updates survive cold starts
 try:
-    with open(os.path.join(DATA_DIR, 'flights.json'), 'w') as f:
-        json.dump(FLIGHTS_DATA, f)
-    with open(os.path.join(DATA_DIR, 'customers.json'), 'w') as f:
-        json.dump(CUSTOMERS_DATA, f)
+    if not os.path.exists(os.path.join(DATA_DIR, 'flights.json')):
+        with open(os.path.join(DATA_DIR, 'flights.json'), 'w') as f:
+            json.dump(FLIGHTS_DATA, f)
+    if not os.path.exists(os.path.join(DATA_DIR, 'customers.json')):
+        with open(os.path.join(DATA_DIR, 'customers.json'), 'w') as f:
+            json.dump(CUSTOMERS_DATA, f)
 except Exception as e:
-    print(f"Error writing data files: {e}")
+    logger.error("Error writing data files: %s", e)
+
+# Corpus embeddings are deduplicated, batched, retried and kept in the embedding store (see embedding_client.py)
+EMBEDDING_CLIENT = EmbeddingClient(BACKEND, store=create_embedding_store())
 
 # Policy retriever using OpenAI embeddings and FAISS
 class PolicyRetriever:
@@ -90,22 +129,13 @@ class PolicyRetriever:
         self.index.add(np.array(self.embeddings).astype('float32'))
     
     def _get_embeddings(self, texts):
-        """Get embeddings for a list of texts using OpenAI API"""
-        try:
-            response = openai.embeddings.create(
-                model="text-embedding-3-small",
-                input=texts
-            )
-            return [item.embedding for item in response.data]
-        except Exception as e:
-            print(f"Error getting embeddings: {e}")
-            # Return zero embeddings as fallback
-            return [[0.0] * 1536 for _ in texts]  # 1536 is the dimension of text-embedding-3-small
+        """Get embeddings for a list of texts; raises EmbeddingError rather than returning placeholders"""
+        return EMBEDDING_CLIENT.embed_documents(texts)
     
     def get_relevant_policies(self, query, top_n=2):
         """Find the most relevant policies for a query"""
         # Get embedding for the query
-        query_embedding = self._get_embeddings([query])[0]
+        query_embedding = EMBEDDING_CLIENT.embed_query(query)
         
         # Search the FAISS index
         D, I = self.index.search(np.array([query_embedding]).astype('float32'), top_n)
@@ -136,34 +166,22 @@ class PolicyRetriever:
 
 # Make sure this class is defined BEFORE you try to use it
 class SimplePolicyRetriever:
-    def __init__(self, policies):
+    """Keyword retriever backed by a BM25 inverted index over policy sections; the no-embeddings fallback."""
+    def __init__(self, policies, index_path=None):
         self.policies = policies
-        self.policy_texts = list(policies.values())
-        self.policy_names = list(policies.keys())
+        # One BM25 document per markdown section, so answers quote the matching section rather than the whole policy
+        self.sections = index_sections(policies)
+        # Load prebuilt postings when available instead of re-tokenizing on cold start
+        self.index = load_or_build({chunk_id: section.text for chunk_id, section in self.sections.items()}, index_path)
+        # Identifies the policy text served; conversations only reuse retrievals made under the same key
+        self.index_key = self.index.content_hash
     
     def get_relevant_policies(self, query, top_n=2):
-        """Find the most relevant policies for a query using keyword matching"""
-        # Simple keyword matching
-        query_words = set(query.lower().split())
-        scores = []
-        
-        for i, policy_text in enumerate(self.policy_texts):
-            policy_words = set(policy_text.lower().split())
-            # Count matching words
-            matching_words = query_words.intersection(policy_words)
-            score = len(matching_words)
-            scores.append((i, score))
-        
-        # Sort by score (highest first)
-        scores.sort(key=lambda x: x[1], reverse=True)
-        
-        # Return top N results
+        """Find the most relevant policy sections for a query using BM25 ranking"""
         results = []
-        for i, score in scores[:top_n]:
-            if score > 0:  # Only include if there's at least one matching word
-                policy_name = self.policy_names[i]
-                policy_text = self.policy_texts[i]
-                results.append((policy_name, policy_text))
+        for doc_id, score in self.index.search(query, top_n):
+            section = self.sections[self.index.doc_names[doc_id]]
+            results.append((section.source, section.text))
         
         return results
     
@@ -182,36 +200,31 @@ class SimplePolicyRetriever:
         return formatted_text
 
 # Then initialize it AFTER the class is defined
-policy_retriever = SimplePolicyRetriever(POLICIES)
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(DATA_DIR, 'policy_bm25.json'))
+policy_retriever = SimplePolicyRetriever(POLICIES, index_path=BM25_INDEX_PATH)
+
+# Runs speculative escalation summaries alongside the main reply
+SPECULATIVE_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATIVE_SUMMARY_WORKERS", "8")))
+
+# Indexed in-memory store shared with app.py
+DATA_STORE = DataStore.from_json_files(DATA_DIR)
+
+# Live flight status updates tailed from an append-only JSONL feed (see flight_feed.py)
+FLIGHT_STATUS_FEED = os.getenv("FLIGHT_STATUS_FEED", os.path.join(DATA_DIR, 'flight_status_events.jsonl'))
+FLIGHT_BOARD, FLIGHT_FEED_TAILER = start_flight_feed(FLIGHT_STATUS_FEED)
 
 # Function to get flight status
 def get_flight_status(flight_id):
-    for flight in FLIGHTS_DATA:
-        if flight["flight_id"] == flight_id:
-            return flight
-    return None
+    return FLIGHT_BOARD.overlay(flight_id, DATA_STORE.get_flight_status(flight_id))
 
 # Function to get customer details
 def get_customer_details(customer_id):
-    for customer in CUSTOMERS_DATA:
-        if customer["customer_id"] == customer_id:
-            customer_data = customer.copy()
-            flight_data = get_flight_status(customer_data["flight_id"])
-            if flight_data:
-                customer_data["flight"] = flight_data
-            return customer_data
-    return None
+    customer_data = DATA_STORE.get_customer_details(customer_id)
+    if customer_data and customer_data.get("flight_id"):
+        customer_data["flight"] = FLIGHT_BOARD.overlay(customer_data["flight_id"], customer_data["flight"])
+    return customer_data
 
-# Process chat messages
-def process_chat(customer_id, user_message, chat_history):
-    # Get customer details for personalization
-    customer_details = get_customer_details(customer_id) if customer_id else None
-    
-    # Get relevant policy information based on user message
-    policy_info = policy_retriever.format_for_prompt(user_message)
-    
-    # Prepare system prompt
-    system_prompt = """
+SYSTEM_PROMPT = """
     You are an airline customer service chatbot for SkyWay Airlines. Your role is to assist customers with 
     flight inquiries, booking issues, and general travel questions.
     
@@ -225,18 +238,12 @@ def process_chat(customer_id, user_message, chat_history):
     For flight status inquiries, provide the exact status and any relevant details like gate changes.
     For loyalty program questions, explain benefits based on the customer's tier when available.
     """
-    
-    # Combine system prompt with policy information
-    if policy_info:
-        system_prompt += f"\n\nReference the following policy information in your responses when relevant:\n\n{policy_info}"
-    
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ]
-    
-    # Add customer context if available
-    if customer_details and "flight" in customer_details:
-        context = f"""
+
+# Format the customer context block for the prompt
+def build_customer_context(customer_details):
+    if not customer_details or not customer_details.get("flight"):
+        return None
+    return f"""
         Customer Information:
         - Name: {customer_details['name']}
         - Email: {customer_details['email']}
@@ -248,70 +255,399 @@ def process_chat(customer_id, user_message, chat_history):
         When responding, personalize your answers using the customer's name and loyalty tier.
         For flight-related questions, reference their specific flight details.
         """
+
+# Token budget shared by policy information and chat history (see history_budget.py)
+PROMPT_BUDGET = PromptBudget()
+
+# Fold older turns into the conversation's rolling summary
+def summarize_history(previous_summary, messages):
+    max_tokens = history_summary_max_tokens()
+    prompt = build_history_summary_prompt(previous_summary, messages, max_tokens)
+    with span("history_summary"):
+        return BACKEND.chat([{"role": "user", "content": prompt}], max_tokens=max_tokens)
+
+# Build the message list sent to the chat model; returns (messages, per-section token counts)
+def build_chat_messages(customer_id, user_message, chat_history, session=None):
+    """
+    Policy information and history are packed into PROMPT_BUDGET tokens.
+    With a session, the cached customer context and earlier retrievals are reused,
+    turns that no longer fit are folded into the rolling summary, and the prompt keeps
+    a stable prefix (system prompt, customer context, summary, history) with the
+    per-turn policy information last, so provider-side prompt caching can hit.
+    """
+    # Get customer details for personalization
+    with span("customer_lookup"):
+        customer_details = get_customer_details(customer_id) if customer_id else None
+    
+    # Get relevant policy information based on user message
+    if session is None:
+        with span("retrieval"):
+            policy_info = policy_retriever.format_for_prompt(user_message)
+        context = build_customer_context(customer_details)
+    else:
+        with span("retrieval"):
+            policy_info = session.get_policy_info(user_message, policy_retriever.format_for_prompt,
+                                                  policy_retriever.index_key)
+        context = session.get_customer_context(customer_details, build_customer_context)
+    return assemble_chat_messages(context, policy_info, user_message, chat_history, session)
+
+# Assemble the prompt from the customer context block and policy information
+def assemble_chat_messages(context, policy_info, user_message, chat_history, session=None):
+    # Folding the history is timed as its own history_summary span inside prompt_assembly
+    with span("prompt_assembly"):
+        return _assemble_chat_messages(context, policy_info, user_message, chat_history, session)
+
+def _assemble_chat_messages(context, policy_info, user_message, chat_history, session):
+    policy_prompt = f"Reference the following policy information in your responses when relevant:\n\n{policy_info}" if policy_info else None
+    
+    fixed_sections = {"system": SYSTEM_PROMPT, "customer_context": context, "user_message": user_message}
+    if session is None:
+        plan = PROMPT_BUDGET.plan(fixed_sections, policy_prompt, chat_history)
+    else:
+        plan = PROMPT_BUDGET.plan_session(session, fixed_sections, policy_prompt, summarize_history)
+    policy_prompt = plan.policy_info
+    
+    # Prepare system prompt
+    system_prompt = SYSTEM_PROMPT
+    
+    # Combine system prompt with policy information
+    if policy_prompt and session is None:
+        system_prompt += "\n\n" + policy_prompt
+    
+    messages = [
+        {"role": "system", "content": system_prompt}
+    ]
+    
+    # Add customer context if available
+    if context:
         messages.append({"role": "system", "content": context})
     
-    # Add chat history (limited to last 5 messages)
-    recent_history = chat_history[-5:] if len(chat_history) > 5 else chat_history
-    for message in recent_history:
+    if plan.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{plan.summary}"})
+    
+    # Add the most recent chat history that fits the token budget
+    for message in plan.history:
         messages.append({"role": message["role"], "content": message["content"]})
     
+    if policy_prompt and session is not None:
+        messages.append({"role": "system", "content": policy_prompt})
+    
     # Add current user message
     messages.append({"role": "user", "content": user_message})
     
-    try:
-        # Get response from OpenAI using the new API format
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        ai_response = response.choices[0].message.content
-        
-        # Check if the issue needs escalation
-        if "ESCALATE" in ai_response:
-            # Generate a structured summary for the agent
-            summary_prompt = f"""
-            Generate a structured summary for a human agent based on the following conversation:
-            {json.dumps(chat_history)}
-            User's last message: {user_message}
-            
-            Format:
-            - Customer ID: {customer_id if customer_id else "Unknown"}
-            - Problem Summary:
-            - Attempted Solutions:
-            - Recommended Next Steps:
-            """
-            
-            # Use the new API format for the summary response
-            summary_response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": summary_prompt}],
-                max_tokens=300
-            )
-            
-            structured_summary = summary_response.choices[0].message.content
-            
-            return {
-                "response": ai_response.replace("ESCALATE", ""),
-                "needs_escalation": True,
-                "structured_summary": structured_summary
-            }
-        
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Number of messages: %d, prompt tokens: %s", len(messages), plan.token_counts)
+    return messages, plan.token_counts
+
+# Build the prompt asking for a structured summary for a human agent
+def build_summary_prompt(customer_id, user_message, chat_history):
+    return f"""
+    Generate a structured summary for a human agent based on the following conversation:
+    {json.dumps(chat_history)}
+    User's last message: {user_message}
+    
+    Format:
+    - Customer ID: {customer_id if customer_id else "Unknown"}
+    - Problem Summary:
+    - Attempted Solutions:
+    - Recommended Next Steps:
+    """
+
+# Generate the structured summary for a human agent
+def generate_escalation_summary(customer_id, user_message, chat_history):
+    summary_prompt = build_summary_prompt(customer_id, user_message, chat_history)
+    
+    return BACKEND.chat([{"role": "user", "content": summary_prompt}], max_tokens=300)
+
+# Request a chat completion for the given messages
+def create_completion(messages, json_mode=False):
+    return BACKEND.chat(messages, json_mode=json_mode, max_tokens=500)
+
+# Build the final result for a reply that needs a human agent
+def escalated_result(ai_response, structured_summary):
+    return {
+        "response": ai_response.replace("ESCALATE", ""),
+        "needs_escalation": True,
+        "structured_summary": structured_summary
+    }
+
+# Escalation modes (see escalation.py); each returns the chat result
+def reply_sequential(messages, customer_id, user_message, chat_history):
+    with span("llm"):
+        ai_response = create_completion(messages)
+    logger.debug("Raw AI response: %s", ai_response)
+    
+    # Check if the issue needs escalation
+    if "ESCALATE" in ai_response:
+        # Generate a structured summary for the agent
+        with span("escalation_summary"):
+            structured_summary = generate_escalation_summary(customer_id, user_message, chat_history)
+        return escalated_result(ai_response, structured_summary)
+    
+    return {
+        "response": ai_response,
+        "needs_escalation": False
+    }
+
+def reply_combined(messages, customer_id, user_message, chat_history):
+    # Insert the combined-output instructions just before the current user message
+    combined_messages = messages[:-1] + [{"role": "system", "content": build_combined_instructions(customer_id)}] + messages[-1:]
+    with span("llm"):
+        content = create_completion(combined_messages, json_mode=True)
+    logger.debug("Raw AI response: %s", content)
+    
+    parsed = parse_combined_output(content)
+    if parsed is None:
+        # Not valid JSON; treat it as a plain reply
+        parsed = (content.replace("ESCALATE", ""), "ESCALATE" in content, None)
+    ai_response, needs_escalation, structured_summary = parsed
+    
+    if not needs_escalation:
         return {
             "response": ai_response,
             "needs_escalation": False
         }
+    if structured_summary is None:
+        with span("escalation_summary"):
+            structured_summary = generate_escalation_summary(customer_id, user_message, chat_history)
+    return escalated_result(ai_response, structured_summary)
+
+def reply_speculative(messages, customer_id, user_message, chat_history):
+    # The summary prompt does not depend on the reply, so generate both at once
+    summary_future = SPECULATIVE_EXECUTOR.submit(generate_escalation_summary, customer_id, user_message, chat_history)
+    try:
+        with span("llm"):
+            ai_response = create_completion(messages)
+    except Exception:
+        summary_future.cancel()
+        raise
+    logger.debug("Raw AI response: %s", ai_response)
+    
+    if "ESCALATE" in ai_response:
+        # Only the wait beyond the reply shows up; the rest overlapped with it
+        with span("escalation_summary"):
+            structured_summary = summary_future.result()
+        return escalated_result(ai_response, structured_summary)
+    
+    # Not needed; cancel it if it has not started, otherwise let it finish and drop the result
+    summary_future.cancel()
+    return {
+        "response": ai_response,
+        "needs_escalation": False
+    }
+
+REPLY_STRATEGIES = {
+    "sequential": reply_sequential,
+    "combined": reply_combined,
+    "speculative": reply_speculative,
+}
+
+# Opt-in cache of answers to general policy questions (see response_cache.py)
+RESPONSE_CACHE = create_response_cache(POLICIES_DIR)
+
+# Customer context for cached answers: only the loyalty tier, so the answer suits anyone on that tier
+def build_tier_context(loyalty_tier):
+    return f"""
+        Customer Information:
+        - Loyalty Tier: {loyalty_tier}
+        
+        When responding, explain benefits based on this loyalty tier. Do not address the customer by name.
+        """
+
+# Structured questions (flight status, gate, delay, departure time, seat, booking reference) are answered
+# from templates over the data store without calling the model (see intent_router.py).
+# scikit-learn is not deployed here, so routing uses the keyword patterns only.
+INTENT_ROUTER = (IntentRouter(get_customer_details, get_flight_status=get_flight_status)
+                 if intent_router_enabled() else None)
+
+# Return a templated result for a structured question, or None if the model should answer
+def route_chat(customer_id, user_message):
+    if INTENT_ROUTER is None:
+        return None
+    with span("intent_routing"):
+        routed = INTENT_ROUTER.route(customer_id, user_message)
+    if routed is not None:
+        set_path("template")
+    return routed
+
+# Generate the reply for one message; raises on failure
+def run_chat(customer_id, user_message, chat_history, session=None):
+    routed = route_chat(customer_id, user_message)
+    if routed is not None:
+        return routed
+    
+    cache_key = None
+    if RESPONSE_CACHE is not None and not chat_history and is_faq_question(user_message):
+        # First-turn policy questions are answered from the cache when the same
+        # question retrieved the same policy text for the same tier before
+        start = time.perf_counter()
+        with span("customer_lookup"):
+            customer_details = get_customer_details(customer_id) if customer_id else None
+        with span("retrieval"):
+            if session is None:
+                policy_info = policy_retriever.format_for_prompt(user_message)
+            else:
+                policy_info = session.get_policy_info(user_message, policy_retriever.format_for_prompt,
+                                                      policy_retriever.index_key)
+        loyalty_tier = None
+        if customer_details and mentions_loyalty_tiers(policy_info):
+            loyalty_tier = customer_details.get('loyalty_tier')
+        with span("response_cache"):
+            cache_key = RESPONSE_CACHE.key(user_message, policy_info, loyalty_tier)
+            result = RESPONSE_CACHE.get(cache_key)
+        if result is not None:
+            set_path("cache")
+            result["cached"] = True
+            result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            return result
+        context = build_tier_context(loyalty_tier) if loyalty_tier else None
+        messages, prompt_tokens = assemble_chat_messages(context, policy_info, user_message, chat_history, session)
+    else:
+        messages, prompt_tokens = build_chat_messages(customer_id, user_message, chat_history, session)
+    mode = get_escalation_mode()
+    start = time.perf_counter()
+    
+    # Get response from OpenAI using the configured escalation mode
+    result = REPLY_STRATEGIES[mode](messages, customer_id, user_message, chat_history)
+    
+    # Record how long the escalation strategy took
+    latency_ms = (time.perf_counter() - start) * 1000
+    ESCALATION_LATENCY.record(mode, "escalated" if result["needs_escalation"] else "resolved", latency_ms)
+    result["escalation_mode"] = mode
+    result["latency_ms"] = round(latency_ms, 1)
+    result["prompt_tokens"] = prompt_tokens
+    if cache_key is not None:
+        # Escalations include a per-customer summary, so only resolved answers are cached
+        if not result["needs_escalation"]:
+            RESPONSE_CACHE.put(cache_key, result)
+        result["cached"] = False
+    return result
+
+# Process chat messages
+def process_chat(customer_id, user_message, chat_history, session=None):
+    try:
+        return run_chat(customer_id, user_message, chat_history, session)
     
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("Error processing chat: %s", e)
+        set_path("error")
         return {
             "response": "I'm having trouble processing your request. Please try again later.",
             "needs_escalation": True,
             "structured_summary": f"System error occurred: {str(e)}"
         }
 
+# Batch replay of stored conversations (see batch_chat.py); BM25 retrieval needs no embedding prefetch
+def run_batch_row(row):
+    trace, token = start_trace("batch")
+    try:
+        return run_chat(row.get('customer_id'), row['message'], row.get('history') or row.get('chat_history') or [])
+    except Exception:
+        set_path("error")
+        raise
+    finally:
+        finish_trace(trace, token)
+
+BATCH_RUNNER = BatchRunner(run_batch_row)
+
+# Stream the chat response as Server-Sent Events
+def stream_chat(customer_id, user_message, chat_history, session=None):
+    """
+    Yields "token" events while the reply is generated, an "escalation" event as soon
+    as the marker is seen, and a final "done" event with the full result.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    summary_future = None
+    escalation_filter = EscalationFilter()
+    response_parts = []
+    trace, trace_token = start_trace("stream")
+    
+    try:
+        routed = route_chat(customer_id, user_message)
+        if routed is not None:
+            yield sse_event("token", {"content": routed["response"]})
+            finish_session_turn(session, user_message, routed)
+            yield sse_event("done", routed)
+            return
+        
+        messages, prompt_tokens = build_chat_messages(customer_id, user_message, chat_history, session)
+        # Includes the time the client takes to read each token event
+        stream_start = time.perf_counter()
+        for piece in BACKEND.stream(messages, max_tokens=500):
+            text = escalation_filter.feed(piece)
+            if escalation_filter.detected and summary_future is None:
+                # The summary only depends on the conversation, so start it while the reply finishes
+                summary_future = executor.submit(generate_escalation_summary, customer_id, user_message, chat_history)
+                yield sse_event("escalation", {"needs_escalation": True})
+            if text:
+                response_parts.append(text)
+                yield sse_event("token", {"content": text})
+        
+        text = escalation_filter.flush()
+        if text:
+            response_parts.append(text)
+            yield sse_event("token", {"content": text})
+        record_span("llm", time.perf_counter() - stream_start)
+        
+        result = {
+            "response": "".join(response_parts),
+            "needs_escalation": escalation_filter.detected,
+            "prompt_tokens": prompt_tokens
+        }
+        if summary_future is not None:
+            with span("escalation_summary"):
+                result["structured_summary"] = summary_future.result()
+        finish_session_turn(session, user_message, result)
+        yield sse_event("done", result)
+    
+    except Exception as e:
+        logger.exception("Error streaming chat: %s", e)
+        set_path("error")
+        yield sse_event("done", {
+            "response": "".join(response_parts) or "I'm having trouble processing your request. Please try again later.",
+            "needs_escalation": True,
+            "structured_summary": f"System error occurred: {str(e)}"
+        })
+    finally:
+        executor.shutdown(wait=False)
+        finish_trace(trace, trace_token)
+
+# Server-side conversation sessions (see session_store.py)
+SESSION_STORE = create_session_store()
+
+# Load the session for a request that carries a conversation_id
+def load_session(data, customer_id):
+    conversation_id = data.get('conversation_id')
+    if not conversation_id:
+        return None
+    session = SESSION_STORE.load_or_create(str(conversation_id), customer_id)
+    if session.customer_id != customer_id:
+        # The conversation switched customers; start it over
+        session = ConversationSession(str(conversation_id), customer_id)
+    # Sessions are per instance; a cold instance restores the conversation from the full
+    # history the client sends when asked (history_required)
+    session.sync_history(data.get('chat_history'))
+    return session
+
+# The client sends only the new message and the history_marker of the last reply it received.
+# When the session does not end there (a new instance, an evicted session, a reply the client
+# never got) the client is asked to resend with its full chat_history
+def history_required(session, data):
+    if session is None or 'history_marker' not in data or 'chat_history' in data:
+        return None
+    if data['history_marker'] == session.history_marker():
+        return None
+    return {"history_required": True, "conversation_id": session.conversation_id}
+
+# Append the turn to the session history and persist it
+def finish_session_turn(session, user_message, result):
+    if session is None:
+        return
+    session.record_turn(user_message, result["response"])
+    SESSION_STORE.save(session)
+    result["conversation_id"] = session.conversation_id
+    result["history_marker"] = session.history_marker()
+
 # Add error handling for the root route
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -320,13 +656,18 @@ def catch_all(path):
         return render_template('index.html')
     except Exception as e:
         error_message = f"Error rendering template: {str(e)}\n{traceback.format_exc()}"
-        print(error_message)
+        logger.error(error_message)
         return jsonify({"error": error_message}), 500
 
 # Add a simple health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "ok", "environment": os.environ.get("VERCEL_ENV", "unknown")})
+    return jsonify({
+        "status": "ok",
+        "environment": os.environ.get("VERCEL_ENV", "unknown"),
+        "flight_feed": FLIGHT_BOARD.stats(),
+        "intent_router": INTENT_ROUTER.stats() if INTENT_ROUTER is not None else None
+    })
 
 # API route for chat
 @app.route('/api/chat', methods=['POST'])
@@ -336,9 +677,60 @@ def chat():
     user_message = data.get('message')
     chat_history = data.get('chat_history', [])
     
-    result = process_chat(customer_id, user_message, chat_history)
+    # With a conversation_id the server keeps the history, seeded from chat_history when it has none
+    session = load_session(data, customer_id)
+    required = history_required(session, data)
+    if required is not None:
+        return jsonify(required), 409
+    if session is not None:
+        chat_history = session.history
+    
+    trace, token = start_trace("chat")
+    try:
+        result = process_chat(customer_id, user_message, chat_history, session)
+        finish_session_turn(session, user_message, result)
+        with span("serialization"):
+            return jsonify(result)
+    finally:
+        finish_trace(trace, token)
+
+# Request counts and per-stage latency histograms in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# Latency per escalation mode and path, to compare strategies
+@app.route('/api/escalation/latency', methods=['GET'])
+def escalation_latency():
+    return jsonify({"mode": get_escalation_mode(), "latency": ESCALATION_LATENCY.summary()})
+
+# API route for streaming chat
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json
+    customer_id = data.get('customer_id')
+    user_message = data.get('message')
+    chat_history = data.get('chat_history', [])
+    
+    session = load_session(data, customer_id)
+    required = history_required(session, data)
+    if required is not None:
+        return jsonify(required), 409
+    if session is not None:
+        chat_history = session.history
     
-    return jsonify(result)
+    return Response(
+        stream_with_context(stream_chat(customer_id, user_message, chat_history, session)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# API route for batch replay; the body is JSONL of {customer_id, message, history} rows
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    lines = request.get_data().splitlines()
+    records = (json.dumps(record) + "\n" for record in BATCH_RUNNER.run(lines))
+    return Response(stream_with_context(records), mimetype='application/x-ndjson')
 
 # Modify the debug endpoint to not use pkg_resources
 @app.route('/debug/size', methods=['GET'])
@@ -369,8 +761,15 @@ def debug_size():
     return jsonify({
         "top_modules": readable_modules,
         # Remove the packages section that used pkg_resources
+        # Per-module import durations and startup stage timings (ms since process start)
+        "import_times": IMPORT_PROFILER.report(),
+        "startup_stages": STARTUP_STAGES
     })
 
+# Startup is complete; stop timing imports
+IMPORT_PROFILER.uninstall()
+mark_stage("app_ready")
+
 # For local development
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,14 +1,33 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 import os
 import json
-import pandas as pd
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage, AIMessage
-from policy_retrieval_langchain import PolicyRetrieverLangChain
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from startup import Deferred, mark_stage
+import prefork
+from snapshot import open_data_store
+from flight_feed import start_flight_feed
+from streaming import EscalationFilter, sse_event
+from session_store import ConversationSession, create_session_store
+from batch_chat import BatchRunner
+from response_cache import create_response_cache, is_faq_question, mentions_loyalty_tiers
+from intent_router import IntentClassifier, IntentRouter, intent_router_enabled
+from llm_backend import get_backend
+from history_budget import PromptBudget, build_history_summary_prompt, history_summary_max_tokens
+from escalation import ESCALATION_LATENCY, build_combined_instructions, get_escalation_mode, parse_combined_output
+from observability import (PROMETHEUS_CONTENT_TYPE, configure_logging, finish_trace, record_span, render_metrics,
+                           set_path, span, start_trace, timed)
 import tempfile
 
+# Log level comes from LOG_LEVEL (see observability.py)
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Create a temporary directory for files if we're in a serverless environment
 if not os.path.exists('data') or not os.access('data', os.W_OK):
     temp_dir = tempfile.gettempdir()
@@ -49,61 +68,72 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 
+# How heavy startup work is scheduled:
+#   eager   - build the policy retriever at import (the default)
+#   lazy    - build it on the first request that needs it
+#   prewarm - build it in a background thread right after import
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager").strip().lower()
+
+# Chat completions and embeddings come from the backend selected by LLM_BACKEND:
+# the OpenAI API, or an in-process mock for load testing (see llm_backend.py)
+BACKEND = get_backend()
+
+# The retriever pulls in FAISS and the text splitters, so they are only imported when it is built
+def create_policy_retriever():
+    from hybrid_retrieval import HybridPolicyRetriever
+    from policy_retrieval_langchain import BackendEmbeddings, PolicyRetrieverLangChain
+    # BM25 and vector search fused by rank; RETRIEVAL_MODE=vector keeps vector search alone
+    retriever = PolicyRetrieverLangChain(embeddings=BackendEmbeddings(BACKEND))
+    if os.getenv("RETRIEVAL_MODE", "hybrid").strip().lower() == "vector":
+        return retriever
+    return HybridPolicyRetriever(retriever)
+
 # Initialize policy retriever
-policy_retriever = PolicyRetrieverLangChain()
+policy_retriever = Deferred(create_policy_retriever, name="policy_retriever")
+if STARTUP_MODE == "prewarm":
+    policy_retriever.prewarm()
+elif STARTUP_MODE != "lazy":
+    policy_retriever.get()
 
-# Load data from JSON files
-def load_data():
-    try:
-        with open(os.path.join(DATA_DIR, 'flights.json'), 'r') as f:
-            flights = json.load(f)
-        
-        with open(os.path.join(DATA_DIR, 'customers.json'), 'r') as f:
-            customers = json.load(f)
-        
-        return flights, customers
-    except FileNotFoundError:
-        # If files don't exist yet, return empty lists
-        return [], []
+# Runs speculative escalation summaries alongside the main reply
+SPECULATIVE_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATIVE_SUMMARY_WORKERS", "8")))
+
+# Open the memory-mapped data snapshot (see snapshot.py), or load the JSON files
+# into the indexed in-memory store when no up-to-date snapshot has been built
+DATA_SNAPSHOT_PATH = os.getenv("DATA_SNAPSHOT_PATH", os.path.join(DATA_DIR, 'snapshot.bin'))
+DATA_STORE = open_data_store(DATA_DIR, DATA_SNAPSHOT_PATH)
+
+# Live flight status updates tailed from an append-only JSONL feed (see flight_feed.py)
+FLIGHT_STATUS_FEED = os.getenv("FLIGHT_STATUS_FEED", os.path.join(DATA_DIR, 'flight_status_events.jsonl'))
+FLIGHT_BOARD, FLIGHT_FEED_TAILER = start_flight_feed(FLIGHT_STATUS_FEED)
+
+# Preforked serving (gunicorn.conf.py, see prefork.py): the master finishes building the
+# shared state and stops its threads before forking; each worker restarts them
+prefork.on_master_ready(policy_retriever.get)
+if FLIGHT_FEED_TAILER is not None:
+    prefork.on_master_ready(FLIGHT_FEED_TAILER.stop)
+    prefork.on_worker_start(FLIGHT_FEED_TAILER.start)
 
-# Load data and convert to pandas DataFrames
-FLIGHTS_DATA, CUSTOMERS_DATA = load_data()
-FLIGHTS_DB = pd.DataFrame(FLIGHTS_DATA)
-CUSTOMERS_DB = pd.DataFrame(CUSTOMERS_DATA)
+# On reload (SIGHUP to the master) re-index the edited policy files, embedding only the
+# changed chunks, and reopen the data tables; the replacement workers inherit both
+@prefork.on_reload
+def reload_shared_state():
+    global DATA_STORE
+    policy_retriever.refresh()
+    DATA_STORE = open_data_store(DATA_DIR, DATA_SNAPSHOT_PATH)
 
 # Function to get flight status
 def get_flight_status(flight_id):
-    flight = FLIGHTS_DB[FLIGHTS_DB["flight_id"] == flight_id]
-    if flight.empty:
-        return None
-    return flight.iloc[0].to_dict()
+    return FLIGHT_BOARD.overlay(flight_id, DATA_STORE.get_flight_status(flight_id))
 
 # Function to get customer details
 def get_customer_details(customer_id):
-    customer = CUSTOMERS_DB[CUSTOMERS_DB["customer_id"] == customer_id]
-    if customer.empty:
-        return None
-    customer_data = customer.iloc[0].to_dict()
-    flight_data = get_flight_status(customer_data["flight_id"])
-    return {**customer_data, "flight": flight_data}
+    customer_data = DATA_STORE.get_customer_details(customer_id)
+    if customer_data and customer_data.get("flight_id"):
+        customer_data["flight"] = FLIGHT_BOARD.overlay(customer_data["flight_id"], customer_data["flight"])
+    return customer_data
 
-# Function to process chat with AI
-def process_chat(customer_id, user_message, chat_history):
-    # Get customer details for personalization
-    customer_details = get_customer_details(customer_id) if customer_id else None
-    
-    # Get relevant policy information based on user message
-    policy_info = policy_retriever.format_for_prompt(user_message)
-    
-    # Debug: Print policy info to console
-    print(f"Policy info retrieved: {policy_info}")
-    
-    # Initialize LangChain chat model
-    chat_model = ChatOpenAI(temperature=0.7)
-    
-    # Prepare system messages
-    system_messages = [
-        SystemMessage(content="""
+SYSTEM_PROMPT = """
         You are an airline customer service chatbot for SkyWay Airlines. Your role is to assist customers with 
         flight inquiries, booking issues, and general travel questions.
         
@@ -116,16 +146,46 @@ def process_chat(customer_id, user_message, chat_history):
         
         For flight status inquiries, provide the exact status and any relevant details like gate changes.
         For loyalty program questions, explain benefits based on the customer's tier when available.
-        """)
-    ]
+        """
+
+# Build the full message list sent to the chat model; returns (messages, per-section token counts)
+def build_chat_messages(customer_id, user_message, chat_history, session=None):
+    # Get customer details for personalization
+    with span("customer_lookup"):
+        customer_details = get_customer_details(customer_id) if customer_id else None
     
-    # Add policy information if available
-    if policy_info:
-        system_messages.append(SystemMessage(content=f"Reference the following policy information in your responses when relevant:\n\n{policy_info}"))
+    with span("retrieval"):
+        policy_info = retrieve_policy_info(user_message, customer_details, session)
+    if session is None:
+        customer_context = build_customer_context(customer_details) if customer_details else None
+        return assemble_chat_messages(customer_context, policy_info, user_message, chat_history)
     
-    # Add customer context if available
-    if customer_details:
-        context = f"""
+    # Reuse the conversation's cached customer context
+    customer_context = session.get_customer_context(customer_details, build_customer_context)
+    return assemble_chat_messages(customer_context, policy_info, user_message, chat_history, session)
+
+# Policy text naming the customer's loyalty tier ranks higher; nothing is filtered out, since
+# sections about other tiers still answer "do I get ...?" (see hybrid_retrieval.py)
+def preferred_tier(customer_details):
+    return customer_details.get('loyalty_tier') if customer_details else None
+
+# Get relevant policy information based on user message, reusing the conversation's earlier retrievals
+def retrieve_policy_info(user_message, customer_details, session=None):
+    tier = preferred_tier(customer_details)
+    retrieve = lambda message: policy_retriever.format_for_prompt(message, prefer_tier=tier)
+    if session is None:
+        return retrieve(user_message)
+    return session.get_policy_info(user_message, retrieve, policy_index_key())
+
+# Identifies the policy text being served (edited files are re-indexed in the background); a conversation
+# only reuses earlier retrievals while it is unchanged
+def policy_index_key():
+    policy_retriever.refresh_if_changed()
+    return policy_retriever.index_key
+
+# Format the customer context block for the prompt
+def build_customer_context(customer_details):
+    return f"""
         Customer Information:
         - Name: {customer_details['name']}
         - Email: {customer_details['email']}
@@ -137,79 +197,580 @@ def process_chat(customer_id, user_message, chat_history):
         When responding, personalize your answers using the customer's name and loyalty tier.
         For flight-related questions, reference their specific flight details.
         """
-        system_messages.append(SystemMessage(content=context))
+
+# Token budget shared by policy information and chat history (see history_budget.py)
+PROMPT_BUDGET = PromptBudget()
+
+# Fold older turns into the conversation's rolling summary
+def summarize_history(previous_summary, messages):
+    max_tokens = history_summary_max_tokens()
+    prompt = build_history_summary_prompt(previous_summary, messages, max_tokens)
+    with span("history_summary"):
+        return BACKEND.chat([SystemMessage(content=prompt)], max_tokens=max_tokens)
+
+# Assemble the prompt from the customer context block and policy information
+def assemble_chat_messages(customer_context, policy_info, user_message, chat_history, session=None):
+    """
+    Policy information and history are packed into PROMPT_BUDGET tokens; returns the
+    messages and the token count of each prompt section.
+    
+    With a session, turns that no longer fit are folded into its rolling summary, and
+    everything that stays the same across turns (system prompt, customer context,
+    summary, earlier history) comes first with the per-turn policy information last,
+    so provider-side prompt caching can reuse the prefix. Folding the history is
+    timed as its own history_summary span inside prompt_assembly.
+    """
+    with span("prompt_assembly"):
+        return _assemble_chat_messages(customer_context, policy_info, user_message, chat_history, session)
+
+def _assemble_chat_messages(customer_context, policy_info, user_message, chat_history, session):
+    if policy_info:
+        policy_info = f"Reference the following policy information in your responses when relevant:\n\n{policy_info}"
+    fixed_sections = {
+        "system": SYSTEM_PROMPT,
+        "customer_context": customer_context,
+        "user_message": user_message,
+    }
+    if session is None:
+        plan = PROMPT_BUDGET.plan(fixed_sections, policy_info, chat_history)
+    else:
+        plan = PROMPT_BUDGET.plan_session(session, fixed_sections, policy_info, summarize_history)
+    
+    logger.debug("Policy info retrieved: %s", plan.policy_info)
+    
+    # Prepare system messages
+    system_messages = [SystemMessage(content=SYSTEM_PROMPT)]
+    policy_message = None
+    
+    # Add policy information if available
+    if plan.policy_info:
+        policy_message = SystemMessage(content=plan.policy_info)
+        if session is None:
+            system_messages.append(policy_message)
+    
+    # Add customer context if available
+    if customer_context:
+        system_messages.append(SystemMessage(content=customer_context))
+    
+    if plan.summary:
+        system_messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{plan.summary}"))
     
     # Prepare message history
     messages = system_messages.copy()
     
-    # Add chat history (limited to last 5 messages to keep context manageable)
-    recent_history = chat_history[-5:] if len(chat_history) > 5 else chat_history
-    for message in recent_history:
+    # Add the most recent chat history that fits the token budget
+    for message in plan.history:
         if message["role"] == "user":
             messages.append(HumanMessage(content=message["content"]))
         elif message["role"] == "assistant":
             messages.append(AIMessage(content=message["content"]))
     
+    if session is not None and policy_message is not None:
+        messages.append(policy_message)
+    
     # Add current user message
     messages.append(HumanMessage(content=user_message))
     
-    # Debug: Print the message structure
-    print(f"Number of messages: {len(messages)}")
-    for i, msg in enumerate(messages):
-        print(f"Message {i}: {msg.type} - {msg.content[:50]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Number of messages: %d, prompt tokens: %s", len(messages), plan.token_counts)
+        for i, msg in enumerate(messages):
+            logger.debug("Message %d: %s - %s...", i, msg.type, msg.content[:50])
     
-    try:
-        # Get response from LangChain
-        response = chat_model.invoke(messages)
-        ai_response = response.content
-        
-        # Debug: Print the raw response
-        print(f"Raw AI response: {ai_response}")
+    return messages, plan.token_counts
+
+# Build the prompt asking for a structured summary for a human agent
+def build_escalation_messages(customer_id, user_message, chat_history):
+    return [
+        SystemMessage(content=f"""
+        Generate a structured summary for a human agent based on the following conversation:
+        {json.dumps(chat_history)}
+        User's last message: {user_message}
         
-        # Check if the issue needs escalation
-        if "ESCALATE" in ai_response:
-            # Generate a structured summary for the agent
-            escalation_messages = [
-                SystemMessage(content=f"""
-                Generate a structured summary for a human agent based on the following conversation:
-                {json.dumps(chat_history)}
-                User's last message: {user_message}
-                
-                Format:
-                - Customer ID: {customer_id if customer_id else "Unknown"}
-                - Problem Summary:
-                - Attempted Solutions:
-                - Recommended Next Steps:
-                """)
-            ]
-            
-            summary_response = chat_model.invoke(escalation_messages)
-            structured_summary = summary_response.content
-            
-            return {
-                "response": ai_response.replace("ESCALATE", ""),
-                "needs_escalation": True,
-                "structured_summary": structured_summary
-            }
+        Format:
+        - Customer ID: {customer_id if customer_id else "Unknown"}
+        - Problem Summary:
+        - Attempted Solutions:
+        - Recommended Next Steps:
+        """)
+    ]
+
+# Build the final result for a reply that needs a human agent
+def escalated_result(ai_response, structured_summary):
+    return {
+        "response": ai_response.replace("ESCALATE", ""),
+        "needs_escalation": True,
+        "structured_summary": structured_summary
+    }
+
+# Insert the combined-output instructions just before the current user message
+def build_combined_messages(messages, customer_id):
+    return messages[:-1] + [SystemMessage(content=build_combined_instructions(customer_id))] + messages[-1:]
+
+# Escalation modes (see escalation.py); each returns the chat result
+def reply_sequential(backend, messages, customer_id, user_message, chat_history):
+    with span("llm"):
+        ai_response = backend.chat(messages)
+    
+    logger.debug("Raw AI response: %s", ai_response)
+    
+    # Check if the issue needs escalation
+    if "ESCALATE" in ai_response:
+        # Generate a structured summary for the agent
+        escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+        with span("escalation_summary"):
+            structured_summary = backend.chat(escalation_messages)
+        return escalated_result(ai_response, structured_summary)
+    
+    return {
+        "response": ai_response,
+        "needs_escalation": False
+    }
+
+def reply_combined(backend, messages, customer_id, user_message, chat_history):
+    with span("llm"):
+        content = backend.chat(build_combined_messages(messages, customer_id), json_mode=True)
+    
+    logger.debug("Raw AI response: %s", content)
+    
+    parsed = parse_combined_output(content)
+    if parsed is None:
+        # Not valid JSON; treat it as a plain reply
+        parsed = (content.replace("ESCALATE", ""), "ESCALATE" in content, None)
+    ai_response, needs_escalation, structured_summary = parsed
+    
+    if not needs_escalation:
+        return {
+            "response": ai_response,
+            "needs_escalation": False
+        }
+    if structured_summary is None:
+        escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+        with span("escalation_summary"):
+            structured_summary = backend.chat(escalation_messages)
+    return escalated_result(ai_response, structured_summary)
+
+def reply_speculative(backend, messages, customer_id, user_message, chat_history):
+    # The summary prompt does not depend on the reply, so generate both at once
+    escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+    summary_future = SPECULATIVE_EXECUTOR.submit(backend.chat, escalation_messages)
+    try:
+        with span("llm"):
+            ai_response = backend.chat(messages)
+    except Exception:
+        summary_future.cancel()
+        raise
+    
+    logger.debug("Raw AI response: %s", ai_response)
+    
+    if "ESCALATE" in ai_response:
+        # Only the wait beyond the reply shows up; the rest overlapped with it
+        with span("escalation_summary"):
+            structured_summary = summary_future.result()
+        return escalated_result(ai_response, structured_summary)
+    
+    # Not needed; cancel it if it has not started, otherwise let it finish and drop the result
+    summary_future.cancel()
+    return {
+        "response": ai_response,
+        "needs_escalation": False
+    }
+
+REPLY_STRATEGIES = {
+    "sequential": reply_sequential,
+    "combined": reply_combined,
+    "speculative": reply_speculative,
+}
+
+# Record how long the selected escalation strategy took and attach it to the result
+def record_escalation_latency(result, mode, start):
+    latency_ms = (time.perf_counter() - start) * 1000
+    ESCALATION_LATENCY.record(mode, "escalated" if result["needs_escalation"] else "resolved", latency_ms)
+    result["escalation_mode"] = mode
+    result["latency_ms"] = round(latency_ms, 1)
+    return result
+
+# Opt-in cache of answers to general policy questions (see response_cache.py)
+RESPONSE_CACHE = create_response_cache(POLICIES_DIR)
+
+# Customer context for cached answers: only the loyalty tier, so the answer suits anyone on that tier
+def build_tier_context(loyalty_tier):
+    return f"""
+        Customer Information:
+        - Loyalty Tier: {loyalty_tier}
         
+        When responding, explain benefits based on this loyalty tier. Do not address the customer by name.
+        """
+
+# Structured questions (flight status, gate, delay, departure time, seat, booking reference) are answered
+# from templates over the data store without calling the model (see intent_router.py).
+# The classifier needs scikit-learn, so it is built following STARTUP_MODE like the retriever.
+INTENT_ROUTER = None
+if intent_router_enabled():
+    intent_classifier = Deferred(IntentClassifier, name="intent_classifier")
+    if STARTUP_MODE == "prewarm":
+        intent_classifier.prewarm()
+    elif STARTUP_MODE != "lazy":
+        intent_classifier.get()
+    INTENT_ROUTER = IntentRouter(get_customer_details, classifier=intent_classifier,
+                                 get_flight_status=get_flight_status)
+    prefork.on_master_ready(intent_classifier.get)
+
+# Return a templated result for a structured question, or None if the model should answer
+def route_chat(customer_id, user_message):
+    if INTENT_ROUTER is None:
+        return None
+    with span("intent_routing"):
+        routed = INTENT_ROUTER.route(customer_id, user_message)
+    if routed is not None:
+        set_path("template")
+    return routed
+
+# First-turn policy questions are answered from the cache when the same
+# question retrieved the same policy text for the same tier before
+def uses_response_cache(user_message, chat_history):
+    return RESPONSE_CACHE is not None and not chat_history and is_faq_question(user_message)
+
+# Look up a cached answer; returns (cache key, cached result or None, loyalty tier the answer depends on)
+def lookup_cached_reply(user_message, policy_info, customer_details, start):
+    loyalty_tier = None
+    if customer_details and mentions_loyalty_tiers(policy_info):
+        loyalty_tier = customer_details.get('loyalty_tier')
+    with span("response_cache"):
+        cache_key = RESPONSE_CACHE.key(user_message, policy_info, loyalty_tier)
+        result = RESPONSE_CACHE.get(cache_key)
+    if result is not None:
+        set_path("cache")
+        result["cached"] = True
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return cache_key, result, loyalty_tier
+
+# Escalations include a per-customer summary, so only resolved answers are cached
+def store_cached_reply(cache_key, result):
+    if not result["needs_escalation"]:
+        RESPONSE_CACHE.put(cache_key, result)
+    result["cached"] = False
+
+# Generate the reply for one message; raises on failure
+def run_chat(customer_id, user_message, chat_history, session=None):
+    routed = route_chat(customer_id, user_message)
+    if routed is not None:
+        return routed
+    
+    cache_key = None
+    if uses_response_cache(user_message, chat_history):
+        start = time.perf_counter()
+        with span("customer_lookup"):
+            customer_details = get_customer_details(customer_id) if customer_id else None
+        with span("retrieval"):
+            policy_info = retrieve_policy_info(user_message, customer_details, session)
+        cache_key, result, loyalty_tier = lookup_cached_reply(user_message, policy_info, customer_details, start)
+        if result is not None:
+            return result
+        customer_context = build_tier_context(loyalty_tier) if loyalty_tier else None
+        messages, prompt_tokens = assemble_chat_messages(customer_context, policy_info, user_message, chat_history, session)
+    else:
+        messages, prompt_tokens = build_chat_messages(customer_id, user_message, chat_history, session)
+    
+    mode = get_escalation_mode()
+    start = time.perf_counter()
+    
+    # Get response from the chat backend
+    result = REPLY_STRATEGIES[mode](BACKEND, messages, customer_id, user_message, chat_history)
+    result["prompt_tokens"] = prompt_tokens
+    record_escalation_latency(result, mode, start)
+    if cache_key is not None:
+        store_cached_reply(cache_key, result)
+    return result
+
+# Function to process chat with AI
+def process_chat(customer_id, user_message, chat_history, session=None):
+    try:
+        return run_chat(customer_id, user_message, chat_history, session)
+    
+    except Exception as e:
+        logger.exception("Error processing chat: %s", e)
+        set_path("error")
+        return {
+            "response": "I'm having trouble processing your request. Please try again later.",
+            "needs_escalation": True,
+            "structured_summary": f"System error occurred: {str(e)}"
+        }
+
+# Batch replay of stored conversations (see batch_chat.py); rows are stateless
+def run_batch_row(row):
+    trace, token = start_trace("batch")
+    try:
+        return run_chat(row.get('customer_id'), row['message'], row.get('history') or row.get('chat_history') or [])
+    except Exception:
+        set_path("error")
+        raise
+    finally:
+        finish_trace(trace, token)
+
+BATCH_RUNNER = BatchRunner(
+    run_batch_row,
+    prefetch=lambda messages: policy_retriever.prefetch_query_embeddings(messages)
+)
+
+# Close the backend's pooled async HTTP client (called on ASGI shutdown)
+async def close_async_clients():
+    await BACKEND.aclose()
+
+# Async escalation modes, mirroring the sync ones above
+async def areply_sequential(backend, messages, customer_id, user_message, chat_history):
+    with span("llm"):
+        ai_response = await backend.achat(messages)
+    
+    logger.debug("Raw AI response: %s", ai_response)
+    
+    # Check if the issue needs escalation
+    if "ESCALATE" in ai_response:
+        # Generate a structured summary for the agent
+        escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+        with span("escalation_summary"):
+            structured_summary = await backend.achat(escalation_messages)
+        return escalated_result(ai_response, structured_summary)
+    
+    return {
+        "response": ai_response,
+        "needs_escalation": False
+    }
+
+async def areply_combined(backend, messages, customer_id, user_message, chat_history):
+    with span("llm"):
+        content = await backend.achat(build_combined_messages(messages, customer_id), json_mode=True)
+    
+    logger.debug("Raw AI response: %s", content)
+    
+    parsed = parse_combined_output(content)
+    if parsed is None:
+        # Not valid JSON; treat it as a plain reply
+        parsed = (content.replace("ESCALATE", ""), "ESCALATE" in content, None)
+    ai_response, needs_escalation, structured_summary = parsed
+    
+    if not needs_escalation:
         return {
             "response": ai_response,
             "needs_escalation": False
         }
+    if structured_summary is None:
+        escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+        with span("escalation_summary"):
+            structured_summary = await backend.achat(escalation_messages)
+    return escalated_result(ai_response, structured_summary)
+
+async def areply_speculative(backend, messages, customer_id, user_message, chat_history):
+    # The summary prompt does not depend on the reply, so generate both at once
+    escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+    summary_task = asyncio.create_task(backend.achat(escalation_messages))
+    try:
+        with span("llm"):
+            ai_response = await backend.achat(messages)
+    except BaseException:
+        summary_task.cancel()
+        raise
+    
+    logger.debug("Raw AI response: %s", ai_response)
+    
+    if "ESCALATE" in ai_response:
+        with span("escalation_summary"):
+            structured_summary = await summary_task
+        return escalated_result(ai_response, structured_summary)
+    
+    summary_task.cancel()
+    return {
+        "response": ai_response,
+        "needs_escalation": False
+    }
+
+ASYNC_REPLY_STRATEGIES = {
+    "sequential": areply_sequential,
+    "combined": areply_combined,
+    "speculative": areply_speculative,
+}
+
+# Async version of process_chat for the ASGI entry point (see asgi.py)
+async def process_chat_async(customer_id, user_message, chat_history, session=None):
+    try:
+        # The router and the retriever may still have to be built (STARTUP_MODE=lazy or
+        # prewarm), which blocks, so that happens in worker threads rather than on the loop
+        routed = await asyncio.to_thread(route_chat, customer_id, user_message)
+        if routed is not None:
+            return routed
+        if not policy_retriever.ready:
+            await asyncio.to_thread(policy_retriever.get)
+        
+        # The customer's loyalty tier ranks retrieval, so the (in-memory) lookup comes first
+        cache_start = time.perf_counter()
+        customer_details = None
+        if customer_id:
+            customer_details = await timed("customer_lookup", asyncio.to_thread(get_customer_details, customer_id))
+        
+        index_key = None
+        if session is not None:
+            await policy_retriever.arefresh_if_changed()
+            index_key = policy_retriever.index_key
+        policy_info = session.lookup_policy_info(user_message, index_key) if session else None
+        if policy_info is None:
+            policy_info = await timed("retrieval", policy_retriever.aformat_for_prompt(
+                user_message, prefer_tier=preferred_tier(customer_details)))
+        if session is not None:
+            session.store_policy_info(user_message, policy_info, index_key)
+        
+        cache_key = None
+        if uses_response_cache(user_message, chat_history):
+            cache_key, result, loyalty_tier = lookup_cached_reply(user_message, policy_info, customer_details,
+                                                                  cache_start)
+            if result is not None:
+                return result
+            customer_context = build_tier_context(loyalty_tier) if loyalty_tier else None
+        elif session is None:
+            customer_context = build_customer_context(customer_details) if customer_details else None
+        else:
+            customer_context = session.get_customer_context(customer_details, build_customer_context)
+        if session is None:
+            messages, prompt_tokens = assemble_chat_messages(customer_context, policy_info, user_message, chat_history)
+        else:
+            # Folding history into the summary is a blocking model call, so keep it off the event loop
+            messages, prompt_tokens = await asyncio.to_thread(
+                assemble_chat_messages, customer_context, policy_info, user_message, chat_history, session
+            )
+        
+        mode = get_escalation_mode()
+        start = time.perf_counter()
+        result = await ASYNC_REPLY_STRATEGIES[mode](BACKEND, messages, customer_id, user_message, chat_history)
+        result["prompt_tokens"] = prompt_tokens
+        record_escalation_latency(result, mode, start)
+        if cache_key is not None:
+            store_cached_reply(cache_key, result)
+        return result
     
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("Error processing chat: %s", e)
+        set_path("error")
         return {
             "response": "I'm having trouble processing your request. Please try again later.",
             "needs_escalation": True,
             "structured_summary": f"System error occurred: {str(e)}"
         }
 
+# Stream the chat response as Server-Sent Events
+def stream_chat(customer_id, user_message, chat_history, session=None):
+    """
+    Yields "token" events while the reply is generated, an "escalation" event as soon
+    as the marker is seen, and a final "done" event with the full result.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    summary_future = None
+    escalation_filter = EscalationFilter()
+    response_parts = []
+    trace, trace_token = start_trace("stream")
+    
+    try:
+        routed = route_chat(customer_id, user_message)
+        if routed is not None:
+            yield sse_event("token", {"content": routed["response"]})
+            finish_session_turn(session, user_message, routed)
+            yield sse_event("done", routed)
+            return
+        
+        messages, prompt_tokens = build_chat_messages(customer_id, user_message, chat_history, session)
+        # Includes the time the client takes to read each token event
+        stream_start = time.perf_counter()
+        for piece in BACKEND.stream(messages):
+            text = escalation_filter.feed(piece)
+            if escalation_filter.detected and summary_future is None:
+                # The summary only depends on the conversation, so start it while the reply finishes
+                escalation_messages = build_escalation_messages(customer_id, user_message, chat_history)
+                summary_future = executor.submit(BACKEND.chat, escalation_messages)
+                yield sse_event("escalation", {"needs_escalation": True})
+            if text:
+                response_parts.append(text)
+                yield sse_event("token", {"content": text})
+        
+        text = escalation_filter.flush()
+        if text:
+            response_parts.append(text)
+            yield sse_event("token", {"content": text})
+        record_span("llm", time.perf_counter() - stream_start)
+        
+        result = {
+            "response": "".join(response_parts),
+            "needs_escalation": escalation_filter.detected,
+            "prompt_tokens": prompt_tokens
+        }
+        if summary_future is not None:
+            with span("escalation_summary"):
+                result["structured_summary"] = summary_future.result()
+        finish_session_turn(session, user_message, result)
+        yield sse_event("done", result)
+    
+    except Exception as e:
+        logger.exception("Error streaming chat: %s", e)
+        set_path("error")
+        yield sse_event("done", {
+            "response": "".join(response_parts) or "I'm having trouble processing your request. Please try again later.",
+            "needs_escalation": True,
+            "structured_summary": f"System error occurred: {str(e)}"
+        })
+    finally:
+        executor.shutdown(wait=False)
+        finish_trace(trace, trace_token)
+
+# Server-side conversation sessions (see session_store.py)
+SESSION_STORE = create_session_store()
+
+# Load the session for a request that carries a conversation_id
+def load_session(data, customer_id):
+    conversation_id = data.get('conversation_id')
+    if not conversation_id:
+        return None
+    session = SESSION_STORE.load_or_create(str(conversation_id), customer_id)
+    if session.customer_id != customer_id:
+        # The conversation switched customers; start it over
+        session = ConversationSession(str(conversation_id), customer_id)
+    # Sessions are per process (or per host with SESSION_STORE=disk); a new instance restores
+    # the conversation from the full history the client sends when asked (history_required)
+    session.sync_history(data.get('chat_history'))
+    return session
+
+# The client sends only the new message and the history_marker of the last reply it received.
+# When the session does not end there (a new instance, an evicted session, a reply the client
+# never got) the client is asked to resend with its full chat_history
+def history_required(session, data):
+    if session is None or 'history_marker' not in data or 'chat_history' in data:
+        return None
+    if data['history_marker'] == session.history_marker():
+        return None
+    return {"history_required": True, "conversation_id": session.conversation_id}
+
+# Append the turn to the session history and persist it
+def finish_session_turn(session, user_message, result):
+    if session is None:
+        return
+    session.record_turn(user_message, result["response"])
+    SESSION_STORE.save(session)
+    result["conversation_id"] = session.conversation_id
+    result["history_marker"] = session.history_marker()
+
 # Routes
 @app.route('/')
 def home():
     return render_template('index.html')
 
+# Answers immediately, even while the retriever is still being built
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({
+        "status": "ok",
+        "startup_mode": STARTUP_MODE,
+        "policy_retriever_ready": policy_retriever.ready,
+        "policy_index_key": policy_retriever.index_key if policy_retriever.ready else None,
+        "flight_feed": FLIGHT_BOARD.stats(),
+        "response_cache": RESPONSE_CACHE.stats() if RESPONSE_CACHE is not None else None,
+        "intent_router": INTENT_ROUTER.stats() if INTENT_ROUTER is not None else None
+    })
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.json
@@ -217,9 +778,60 @@ def chat():
     user_message = data.get('message')
     chat_history = data.get('chat_history', [])
     
-    result = process_chat(customer_id, user_message, chat_history)
+    # With a conversation_id the server keeps the history, seeded from chat_history when it has none
+    session = load_session(data, customer_id)
+    required = history_required(session, data)
+    if required is not None:
+        return jsonify(required), 409
+    if session is not None:
+        chat_history = session.history
+    
+    trace, token = start_trace("chat")
+    try:
+        result = process_chat(customer_id, user_message, chat_history, session)
+        finish_session_turn(session, user_message, result)
+        with span("serialization"):
+            return jsonify(result)
+    finally:
+        finish_trace(trace, token)
+
+# Request counts and per-stage latency histograms in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/escalation/latency', methods=['GET'])
+def escalation_latency():
+    return jsonify({"mode": get_escalation_mode(), "latency": ESCALATION_LATENCY.summary()})
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json
+    customer_id = data.get('customer_id')
+    user_message = data.get('message')
+    chat_history = data.get('chat_history', [])
+    
+    session = load_session(data, customer_id)
+    required = history_required(session, data)
+    if required is not None:
+        return jsonify(required), 409
+    if session is not None:
+        chat_history = session.history
     
-    return jsonify(result)
+    return Response(
+        stream_with_context(stream_chat(customer_id, user_message, chat_history, session)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Replay many conversations at once; the body is JSONL of {customer_id, message, history} rows
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    lines = request.get_data().splitlines()
+    records = (json.dumps(record) + "\n" for record in BATCH_RUNNER.run(lines))
+    return Response(stream_with_context(records), mimetype='application/x-ndjson')
+
+mark_stage("app_ready")
 
 if __name__ == '__main__':
     app.run(debug=True)
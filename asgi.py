@@ -0,0 +1,91 @@
+"""
+ASGI entry point for the chat app.
+
+POST /api/chat is served by the async pipeline (process_chat_async) so a slow
+completion does not hold a worker thread; every other route falls through to
+the Flask app. Install requirements-server.txt and run with, e.g.:
+
+    uvicorn asgi:app --workers 4
+"""
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (app as flask_app, process_chat_async, close_async_clients, load_session, finish_session_turn,
+                 history_required)
+from observability import finish_trace, span, start_trace
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_json(send, payload, status=200):
+    with span("serialization"):
+        body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(receive, send):
+    try:
+        data = json.loads(await read_body(receive) or b"{}")
+    except ValueError:
+        await send_json(send, {"error": "Invalid JSON body"}, status=400)
+        return
+
+    customer_id = data.get('customer_id')
+    user_message = data.get('message')
+    chat_history = data.get('chat_history', [])
+
+    # With a conversation_id the server keeps the history, seeded from chat_history when it has none
+    session = load_session(data, customer_id)
+    required = history_required(session, data)
+    if required is not None:
+        await send_json(send, required, status=409)
+        return
+    if session is not None:
+        chat_history = session.history
+
+    trace, token = start_trace("chat_async")
+    try:
+        result = await process_chat_async(customer_id, user_message, chat_history, session)
+        finish_session_turn(session, user_message, result)
+        await send_json(send, result)
+    finally:
+        finish_trace(trace, token)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        await chat(receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,238 @@
+"""
+Batch chat replay: run many (customer_id, message, history) rows through the
+chat pipeline and stream the results back as JSONL.
+
+Rows are read in chunks of BATCH_CHUNK_SIZE. Before a chunk runs, all of its
+query embeddings are fetched in one call and stored in the retriever's query
+cache. Completions then run on a pool of BATCH_CONCURRENCY threads.
+BATCH_MAX_REQUESTS_PER_MINUTE caps the request rate. When the API rate-limits
+a request, the whole pool pauses for the retry-after period (or an exponential
+backoff), and the row is retried up to BATCH_MAX_RETRIES times.
+
+Each output line is one of:
+
+    {"type": "result", "index": 0, "id": ..., "response": ..., ...}
+    {"type": "result", "index": 1, "id": ..., "error": "..."}
+    {"type": "progress", "completed": ..., "errors": ..., "rows_per_second": ...}
+    {"type": "summary", ...}        (always last)
+
+Result lines come back in completion order; index is the row's position in the input.
+Offline use:
+
+    python batch_chat.py <input.jsonl> [<output.jsonl>]
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rows(lines):
+    """Yield (index, row or None, error or None) for each non-blank JSONL line."""
+    index = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict) or not row.get("message"):
+                raise ValueError("each row needs a message")
+            yield index, row, None
+        except ValueError as e:
+            yield index, None, f"Invalid row: {e}"
+        index += 1
+
+
+def is_rate_limit_error(error):
+    """True for 429 responses from the OpenAI SDK or any HTTP client that sets status_code."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "RateLimit" in type(error).__name__
+
+
+def retry_after_seconds(error):
+    """Return the server's Retry-After hint in seconds, if the error carries one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Spaces requests to at most requests_per_minute across all worker threads,
+    and lets a rate-limited worker pause every worker until the limit clears.
+    """
+
+    def __init__(self, requests_per_minute=0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.completed = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.embedding_batches = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "completed": self.completed,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "embedding_batches": self.embedding_batches,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_second": round(self.completed / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class BatchRunner:
+    """
+    Runs rows through handle_row(row) -> result dict, which should raise on failure
+    so rate limits can be retried. prefetch(messages), if given, is called once per
+    chunk to batch the retrieval embeddings.
+    """
+
+    def __init__(self, handle_row, prefetch=None, concurrency=None, requests_per_minute=None,
+                 chunk_size=None, max_retries=None, progress_every=None):
+        self.handle_row = handle_row
+        self.prefetch = prefetch
+        self.concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", "8"))
+        if requests_per_minute is None:
+            requests_per_minute = float(os.getenv("BATCH_MAX_REQUESTS_PER_MINUTE", "0"))
+        self.limiter = RateLimiter(requests_per_minute)
+        self.chunk_size = max(chunk_size or int(os.getenv("BATCH_CHUNK_SIZE", "64")), self.concurrency)
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("BATCH_MAX_RETRIES", "5"))
+        self.progress_every = progress_every or int(os.getenv("BATCH_PROGRESS_EVERY", "50"))
+
+    def _run_row(self, index, row, stats):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                result = self.handle_row(row)
+                break
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    stats.add(completed=1, errors=1)
+                    return {"type": "result", "index": index, "id": row.get("id"), "error": str(e)}
+                delay = retry_after_seconds(e) or min(60.0, 2 ** attempt) * (0.5 + random.random())
+                stats.add(retries=1, rate_limited=1)
+                self.limiter.pause(delay)
+        stats.add(completed=1)
+        return {"type": "result", "index": index, "id": row.get("id"), **result}
+
+    def _prefetch(self, chunk, stats):
+        if self.prefetch is None:
+            return
+        try:
+            self.prefetch([row["message"] for _, row in chunk])
+            stats.add(embedding_batches=1)
+        except Exception as e:
+            # Rows fall back to embedding their own query
+            logger.warning("Error batching query embeddings: %s", e)
+
+    def run(self, lines):
+        """Yield output records for the JSONL lines in lines, ending with a summary."""
+        stats = BatchStats()
+        pending = set()
+        chunk = []
+        emitted = 0
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-chat")
+
+        def emit(record):
+            nonlocal emitted
+            yield record
+            emitted += 1
+            if emitted % self.progress_every == 0:
+                yield {"type": "progress", **stats.report()}
+
+        def drain(limit):
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from emit(future.result())
+
+        def submit_chunk():
+            self._prefetch(chunk, stats)
+            for index, row in chunk:
+                pending.add(executor.submit(self._run_row, index, row, stats))
+            chunk.clear()
+
+        try:
+            for index, row, error in parse_rows(lines):
+                if error is not None:
+                    stats.add(completed=1, errors=1)
+                    yield from emit({"type": "result", "index": index, "error": error})
+                    continue
+                chunk.append((index, row))
+                if len(chunk) >= self.chunk_size:
+                    submit_chunk()
+                    # Keep at most about one chunk queued behind the one running
+                    yield from drain(self.chunk_size)
+            if chunk:
+                submit_chunk()
+            yield from drain(0)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+        yield {"type": "summary", **stats.report()}
+
+
+def main(argv):
+    if len(argv) not in (2, 3):
+        print("Usage: python batch_chat.py <input.jsonl> [<output.jsonl>]")
+        return 1
+    from app import BATCH_RUNNER
+
+    output = open(argv[2], "w") if len(argv) == 3 else sys.stdout
+    try:
+        with open(argv[1], "r") as f:
+            for record in BATCH_RUNNER.run(f):
+                if record["type"] == "result":
+                    output.write(json.dumps(record) + "\n")
+                else:
+                    print(json.dumps(record), file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
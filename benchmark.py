@@ -0,0 +1,453 @@
+"""
+Load test and benchmark harness. The LLM is always the in-process mock backend
+(see llm_backend.py), so results measure this service's own code, not OpenAI.
+
+    python benchmark.py [chat] [retrievers] [coldstart] [options]
+
+  chat        serve app.py or api/index.py on a local port and drive /api/chat
+              from --concurrency client threads
+  retrievers  build PolicyRetriever (TF-IDF), PolicyRetrieverLangChain (FAISS),
+              HybridPolicyRetriever (BM25 + FAISS with rank fusion) and
+              SimplePolicyRetriever (BM25) over synthetic corpora of
+              --sizes passages, then time their queries; each of --vector-indexes
+              (flat, hnsw, ivf, ivfpq) also reports recall@10 and index size
+  coldstart   time `import app` and api/index.py in fresh interpreters
+
+With no suite named, all three run. Results are written as JSON to --out.
+When a baseline exists (--baseline, default benchmark_baseline.json), every
+latency, time, RSS and throughput metric is compared against it. Changes worse
+than --tolerance are listed under "regressions", and --fail-on-regression makes
+them fail the run. --save-baseline stores this run as the new baseline.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Mixed traffic: policy questions go to the (mock) model, booking questions to the intent router
+CHAT_MESSAGES = [
+    ("C001", "How many checked bags do I get?"),
+    ("C002", "What is the cancellation policy?"),
+    ("C003", "My flight was cancelled, can I get a refund?"),
+    ("C001", "Can I change my flight to tomorrow?"),
+    ("C002", "How do I earn more miles?"),
+    ("C003", "Do Silver members get lounge access?"),
+    ("C001", "Is my flight on time?"),
+    ("C002", "Where is my gate?"),
+    ("C003", "What is my booking reference?"),
+    ("C001", "What's my seat?"),
+]
+
+VOCABULARY = (
+    "baggage bag checked carry-on fee weight pounds kilograms oversized cancellation refund credit "
+    "departure arrival flight change rebooking same-day fare class loyalty tier gold silver standard "
+    "miles points lounge priority boarding upgrade seat meal wheelchair assistance pet cabin hold "
+    "international domestic passport visa delay compensation voucher hotel connection missed gate "
+    "terminal check-in online airport counter deadline hours minutes days members eligible policy"
+).split()
+
+
+def percentiles(samples):
+    """Summarize a list of millisecond samples."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[round(q * (len(ordered) - 1))], 3)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def rss_kb():
+    """Current and peak resident set size of this process in KiB."""
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":")
+                    usage["rss_kb" if name == "VmRSS" else "peak_rss_kb"] = int(value.split()[0])
+    except OSError:
+        import resource
+        usage["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage
+
+
+def mock_environment(args, **extra):
+    """Environment variables that point the apps at the mock backend."""
+    env = {
+        "LLM_BACKEND": "mock",
+        "LLM_MOCK_LATENCY": args.llm_latency,
+        "LLM_MOCK_TOKEN_MS": str(args.llm_token_ms),
+        "LLM_MOCK_EMBEDDING_LATENCY": args.embedding_latency,
+        "LLM_MOCK_EMBEDDING_DIM": str(args.embedding_dim),
+        "LLM_MOCK_SEED": str(args.seed),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-benchmark"),
+    }
+    env.update(extra)
+    return env
+
+
+def load_app(target):
+    """Import the Flask app for target ("app" or "api") and return it."""
+    sys.path.insert(0, ROOT)
+    if target == "app":
+        os.chdir(ROOT)
+        import app
+        return app.app
+    sys.path.insert(0, os.path.join(ROOT, "api"))
+    import index
+    return index.app
+
+
+def bench_chat(args):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    os.environ.update(mock_environment(args, POLICY_INDEX_CACHE_DIR=tempfile.mkdtemp(prefix="bench-index-")))
+    before = rss_kb()
+    flask_app = load_app(args.target)
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    rng = random.Random(args.seed)
+    payloads = [
+        json.dumps({"customer_id": customer_id, "message": message}).encode("utf-8")
+        for customer_id, message in (rng.choice(CHAT_MESSAGES) for _ in range(args.requests + args.warmup))
+    ]
+    latencies = []
+    errors = []
+    next_request = iter(range(len(payloads)))
+    lock = threading.Lock()
+    started = {}
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while True:
+            with lock:
+                i = next(next_request, None)
+                if i == args.warmup:
+                    started["at"] = time.perf_counter()
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                connection.request("POST", "/api/chat", payloads[i], {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                body = response.read()
+                ok = response.status == 200 and "System error" not in body.decode("utf-8", "replace")
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                ok, body = False, str(e).encode()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if i >= args.warmup:
+                with lock:
+                    latencies.append(elapsed_ms)
+                    if not ok:
+                        errors.append(body[:200].decode("utf-8", "replace"))
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started.get("at", time.perf_counter())
+    server.shutdown()
+
+    return {
+        "target": args.target,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": percentiles(latencies),
+        "rss_before_app_kb": before.get("rss_kb"),
+        **rss_kb(),
+    }
+
+
+def synthetic_passages(count, rng, words_per_passage=70):
+    """Random policy-like passages drawn from VOCABULARY plus a long tail of rarer terms."""
+    tail = [f"term{i}" for i in range(max(100, count // 2))]
+    passages = []
+    for _ in range(count):
+        words = [rng.choice(VOCABULARY) if rng.random() < 0.8 else rng.choice(tail) for _ in range(words_per_passage)]
+        passages.append(" ".join(words) + ".")
+    return passages
+
+
+def write_corpus(passages, directory, passages_per_file=100):
+    """Write passages to policy files, each under its own ## heading so each one is a section."""
+    for file_number, start in enumerate(range(0, len(passages), passages_per_file)):
+        sections = [f"## Section {start + i}\n{passage}" for i, passage in enumerate(passages[start:start + passages_per_file])]
+        with open(os.path.join(directory, f"policy_{file_number:05d}.txt"), "w") as f:
+            f.write(f"# Synthetic Policy {file_number}\n\n" + "\n\n".join(sections))
+
+
+def time_queries(search, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies)
+
+
+def bench_retrievers(args):
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "api"))
+    os.environ.update(mock_environment(args, LLM_MOCK_EMBEDDING_LATENCY="fixed:0"))
+    from embedding_client import EmbeddingClient, EmbeddingStore
+    from llm_backend import MockBackend
+    from policy_retrieval import PolicyRetriever
+    from hybrid_retrieval import HybridPolicyRetriever
+    from policy_retrieval_langchain import BackendEmbeddings, PolicyRetrieverLangChain
+    from vector_index import IndexSpec
+    from index import SimplePolicyRetriever
+
+    rng = random.Random(args.seed)
+    results = {}
+    for size in args.sizes:
+        passages = synthetic_passages(size, rng)
+        queries = [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 8))) for _ in range(args.queries)]
+        workdir = tempfile.mkdtemp(prefix=f"bench-corpus-{size}-")
+        policy_dir = os.path.join(workdir, "policies")
+        os.makedirs(policy_dir)
+        write_corpus(passages, policy_dir)
+        size_results = results[str(size)] = {}
+        try:
+            start = time.perf_counter()
+            tfidf = PolicyRetriever(policy_dir)
+            size_results["tfidf"] = {
+                "chunks": len(tfidf.chunks),
+                "build_ms": round((time.perf_counter() - start) * 1000, 1),
+                "query": time_queries(tfidf.get_relevant_policies, queries),
+            }
+            del tfidf
+
+            backend = MockBackend(embedding_latency="fixed:0", embedding_dim=args.embedding_dim)
+            # A fresh embedding store, so the first build really embeds the corpus
+            store = EmbeddingStore(os.path.join(workdir, "embeddings.sqlite3"))
+            embeddings = BackendEmbeddings(backend, client=EmbeddingClient(backend, store=store))
+            cache_dir = os.path.join(workdir, "index_cache")
+            start = time.perf_counter()
+            vector = PolicyRetrieverLangChain(policy_dir, embeddings=embeddings, cache_dir=cache_dir)
+            build_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            PolicyRetrieverLangChain(policy_dir, embeddings=embeddings, cache_dir=cache_dir)
+            size_results["faiss"] = {
+                "chunks": vector.vector_store.index.ntotal if vector.vector_store else 0,
+                "build_ms": round(build_ms, 1),
+                "cached_load_ms": round((time.perf_counter() - start) * 1000, 1),
+                "embedding_requests": embeddings.client.stats["requests"],
+                # Includes embedding each query with the mock (no network latency)
+                "query": time_queries(vector.get_relevant_policies, queries),
+            }
+            start = time.perf_counter()
+            hybrid = HybridPolicyRetriever(vector)
+            size_results["hybrid"] = {
+                "build_ms": round((time.perf_counter() - start) * 1000, 1),
+                "query": time_queries(hybrid.get_relevant_policies, queries),
+            }
+            hybrid.executor.shutdown()
+            del hybrid, vector
+
+            for kind in args.vector_indexes:
+                spec = IndexSpec(kind, storage=args.vector_storage)
+                # Vectors come from the embedding store filled above, so this times index training and search
+                start = time.perf_counter()
+                vector = PolicyRetrieverLangChain(policy_dir, embeddings=embeddings, cache_dir=cache_dir, index_spec=spec)
+                build_ms = (time.perf_counter() - start) * 1000
+                if not vector.vector_store:
+                    continue
+                report = vector.recall_report(k=10)
+                size_results[f"faiss_{kind}"] = {
+                    "factory": report["factory"],
+                    "build_ms": round(build_ms, 1),
+                    "recall_at_10": report["recall"],
+                    "index_kb": report["bytes"] // 1024,
+                    "query": time_queries(vector.get_relevant_policies, queries),
+                }
+                del vector
+            store.close()
+
+            start = time.perf_counter()
+            bm25 = SimplePolicyRetriever({f"passage_{i}": text for i, text in enumerate(passages)})
+            size_results["bm25"] = {
+                "chunks": len(passages),
+                "build_ms": round((time.perf_counter() - start) * 1000, 1),
+                "query": time_queries(bm25.get_relevant_policies, queries),
+            }
+            del bm25
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        size_results.update(rss_kb())
+        print(f"retrievers: {size} passages done", file=sys.stderr)
+    return results
+
+
+COLD_START_SCRIPTS = {
+    "app": "import app",
+    "api": "import runpy; runpy.run_path('api/index.py')",
+}
+
+
+def bench_coldstart(args):
+    results = {}
+    index_cache = tempfile.mkdtemp(prefix="bench-coldstart-")
+    try:
+        for target, import_line in COLD_START_SCRIPTS.items():
+            script = (
+                "import json, time\n"
+                "start = time.perf_counter()\n"
+                f"{import_line}\n"
+                "elapsed = time.perf_counter() - start\n"
+                "import benchmark, startup\n"
+                "print(json.dumps({'import_ms': elapsed * 1000, 'stages': startup.STARTUP_STAGES, **benchmark.rss_kb()}))\n"
+            )
+            runs = []
+            for run in range(args.coldstart_runs):
+                env = dict(os.environ, **mock_environment(args, POLICY_INDEX_CACHE_DIR=index_cache))
+                start = time.perf_counter()
+                completed = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                                           capture_output=True, text=True, timeout=600)
+                wall_ms = (time.perf_counter() - start) * 1000
+                if completed.returncode != 0:
+                    runs.append({"error": completed.stderr[-500:]})
+                    continue
+                child = json.loads(completed.stdout.strip().splitlines()[-1])
+                runs.append({"wall_ms": round(wall_ms, 1), "import_ms": round(child["import_ms"], 1),
+                             "rss_kb": child.get("rss_kb"), "stages": child["stages"]})
+            ok = [run for run in runs if "error" not in run]
+            results[target] = {
+                # The first app.py run builds the policy index; later runs load it from the cache
+                "first_run": runs[0] if runs else None,
+                "wall": percentiles([run["wall_ms"] for run in ok]),
+                "import": percentiles([run["import_ms"] for run in ok]),
+                "rss_kb": max((run["rss_kb"] or 0 for run in ok), default=None),
+                "errors": [run["error"] for run in runs if "error" in run],
+            }
+    finally:
+        shutil.rmtree(index_cache, ignore_errors=True)
+    return results
+
+
+# Metric name suffixes where a larger value is worse or better
+LOWER_IS_BETTER = ("_ms", "_kb")
+HIGHER_IS_BETTER = ("rps", "recall_at_10")
+
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, path + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(results, baseline, tolerance):
+    """Return (comparisons, regressions) for every metric present in both runs."""
+    previous = dict(flatten(baseline))
+    comparisons = {}
+    regressions = []
+    for path, value in flatten(results):
+        name = path.rsplit(".", 1)[-1]
+        if path not in previous or not previous[path]:
+            continue
+        if name.endswith(LOWER_IS_BETTER):
+            change = value / previous[path] - 1
+        elif name.endswith(HIGHER_IS_BETTER):
+            change = previous[path] / value - 1 if value else float("inf")
+        else:
+            continue
+        comparisons[path] = {"baseline": previous[path], "current": value, "worse_by": round(change, 3)}
+        if change > tolerance:
+            regressions.append(path)
+    return comparisons, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chat service against the mock LLM backend.")
+    parser.add_argument("suites", nargs="*", choices=["chat", "retrievers", "coldstart"], default=[])
+    parser.add_argument("--target", choices=["app", "api"], default="app", help="app served by the chat suite")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--llm-latency", default="lognormal:300:0.4", help="mock time-to-first-token distribution")
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--embedding-latency", default="fixed:20")
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 500, 5000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--vector-indexes", nargs="*", default=["flat", "hnsw", "ivfpq"],
+                        help="FAISS index types to compare against exact search (see vector_index.py)")
+    parser.add_argument("--vector-storage", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--coldstart-runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional slowdown before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+    suites = args.suites or ["chat", "retrievers", "coldstart"]
+
+    results = {}
+    # Cold start runs in subprocesses, so do it before this process imports the apps
+    if "coldstart" in suites:
+        results["coldstart"] = bench_coldstart(args)
+    if "retrievers" in suites:
+        results["retrievers"] = bench_retrievers(args)
+    if "chat" in suites:
+        results["chat"] = bench_chat(args)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparisons, regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance,
+                                "metrics": comparisons, "regressions": regressions}
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+    print(json.dumps({"out": args.out, "regressions": regressions}, indent=2))
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
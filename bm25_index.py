@@ -0,0 +1,197 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Bump when the serialized layout changes
+BM25_INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase and split text into alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+# (word prefixes that trigger the group, terms appended to the query); every matching group applies
+QUERY_EXPANSIONS = [
+    (("bag", "luggage", "suitcase", "carry-on", "carry on"), "baggage allowance checked carry-on"),
+    (("cancel", "refund"), "cancellation policy refund ticket"),
+    (("change", "rebook", "reschedul"), "rebooking change flight reschedule"),
+    (("assist", "wheelchair", "disab", "mobility"), "special assistance disability wheelchair"),
+    (("mile", "point", "status", "tier", "loyalty"), "loyalty program miles points"),
+]
+_EXPANSION_RES = [
+    (re.compile(r"\b(?:" + "|".join(re.escape(prefix) for prefix in prefixes) + ")"), terms)
+    for prefixes, terms in QUERY_EXPANSIONS
+]
+
+
+def expand_query(query):
+    """Lowercase query and append the policy vocabulary of each topic it mentions."""
+    expanded = query.lower()
+    extra = [terms for pattern, terms in _EXPANSION_RES if pattern.search(expanded)]
+    if extra:
+        expanded = " ".join([expanded] + extra)
+        logger.debug("Expanded query: %s", expanded)
+    return expanded
+
+
+def content_hash(documents):
+    """Hash a {name: text} mapping so a serialized index can be checked for staleness."""
+    hasher = hashlib.sha256()
+    for name in sorted(documents):
+        hasher.update(name.encode('utf-8'))
+        hasher.update(b'\0')
+        hasher.update(documents[name].encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring.
+    Postings map each term to parallel lists of document ids and term frequencies.
+    Pure Python, so it can serve as the no-embeddings fallback on Vercel.
+    """
+
+    def __init__(self, doc_names, doc_lengths, postings, content_hash=None, k1=1.5, b=0.75):
+        self.doc_names = doc_names
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.content_hash = content_hash
+        self.k1 = k1
+        self.b = b
+        self.avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        self._prepare()
+
+    def _prepare(self):
+        """Precompute idf per term and the length normalization per document."""
+        n_docs = len(self.doc_names)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for term, (doc_ids, _) in self.postings.items()
+        }
+        avgdl = self.avgdl or 1.0
+        self.length_norm = [
+            self.k1 * (1 - self.b + self.b * length / avgdl) for length in self.doc_lengths
+        ]
+
+    @classmethod
+    def build(cls, documents, k1=1.5, b=0.75):
+        """Build an index from a {name: text} mapping."""
+        doc_names = list(documents.keys())
+        doc_lengths = []
+        postings = {}
+        for doc_id, name in enumerate(doc_names):
+            tokens = tokenize(documents[name])
+            doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = ([], [])
+                entry[0].append(doc_id)
+                entry[1].append(tf)
+        return cls(doc_names, doc_lengths, postings, content_hash(documents), k1=k1, b=b)
+
+    def search(self, query, top_n=3, allowed=None):
+        """Return up to top_n (doc_id, score) pairs with a positive score, best first.
+
+        allowed, a set of doc ids, restricts scoring to those documents.
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in zip(*entry):
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                score = idf * tf * (self.k1 + 1) / (tf + self.length_norm[doc_id])
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return heapq.nlargest(top_n, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self):
+        return {
+            "version": BM25_INDEX_VERSION,
+            "content_hash": self.content_hash,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_names": self.doc_names,
+            "doc_lengths": self.doc_lengths,
+            "postings": {term: [doc_ids, tfs] for term, (doc_ids, tfs) in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != BM25_INDEX_VERSION:
+            raise ValueError(f"Unsupported BM25 index version: {data.get('version')}")
+        postings = {term: (doc_ids, tfs) for term, (doc_ids, tfs) in data["postings"].items()}
+        return cls(data["doc_names"], data["doc_lengths"], postings, data.get("content_hash"),
+                   k1=data["k1"], b=data["b"])
+
+    def save(self, path):
+        """Serialize the index to a JSON file, replacing any existing file atomically."""
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_or_build(documents, path):
+    """Load the serialized index at path if it matches documents, otherwise build and save it."""
+    expected_hash = content_hash(documents)
+    if path and os.path.exists(path):
+        try:
+            index = BM25Index.load(path)
+            if index.content_hash == expected_hash:
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable BM25 index at %s: %s", path, e)
+
+    index = BM25Index.build(documents)
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            logger.warning("Could not write BM25 index: %s", e)
+    return index
+
+
+def load_policy_documents(policy_dir):
+    """Read every .txt file in policy_dir into a {policy_name: text} mapping."""
+    documents = {}
+    for filename in sorted(os.listdir(policy_dir)):
+        if filename.endswith('.txt'):
+            with open(os.path.join(policy_dir, filename), 'r') as f:
+                documents[filename[:-len('.txt')]] = f.read()
+    return documents
+
+
+if __name__ == '__main__':
+    # Usage: python bm25_index.py <policy_dir> <output.json>
+    # Indexes one document per policy section, as api/index.py's SimplePolicyRetriever does
+    from policy_sections import index_sections
+    if len(sys.argv) != 3:
+        print("Usage: python bm25_index.py <policy_dir> <output.json>")
+        sys.exit(1)
+    sections = index_sections(load_policy_documents(sys.argv[1]))
+    index = BM25Index.build({chunk_id: section.text for chunk_id, section in sections.items()})
+    index.save(sys.argv[2])
+    print(f"Wrote BM25 index with {len(index.doc_names)} documents and {len(index.postings)} terms to {sys.argv[2]}")
@@ -0,0 +1,44 @@
+import os
+import shutil
+
+import pytest
+
+from llm_backend import MockBackend
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def mock_backend():
+    """Deterministic in-process backend with no simulated latency, errors or escalations."""
+    return MockBackend(latency="fixed:0", token_ms=0, embedding_latency="fixed:0", error_rate=0,
+                       rate_limit_rate=0, escalation_rate=0, embedding_dim=64, seed=0)
+
+
+@pytest.fixture
+def policy_dir(tmp_path):
+    """A private copy of the bundled policy documents."""
+    path = tmp_path / "policies"
+    shutil.copytree(os.path.join(REPO_DIR, "policies"), path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def chat_app(tmp_path_factory):
+    """app.py imported once against the mock backend, with its caches in a scratch directory."""
+    scratch = tmp_path_factory.mktemp("app")
+    os.environ.update({
+        "LLM_BACKEND": "mock",
+        "LLM_MOCK_LATENCY": "fixed:0",
+        "LLM_MOCK_TOKEN_MS": "0",
+        "LLM_MOCK_EMBEDDING_LATENCY": "fixed:0",
+        "LLM_MOCK_ESCALATION_RATE": "0",
+        "LLM_MOCK_EMBEDDING_DIM": "64",
+        "EMBEDDING_STORE_PATH": str(scratch / "embeddings.sqlite3"),
+        "POLICY_INDEX_CACHE_DIR": str(scratch / "index_cache"),
+        "POLICY_REFRESH_INTERVAL_SECONDS": "0",
+        "SESSION_STORE": "memory",
+    })
+    import app
+    return app
+
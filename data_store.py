@@ -0,0 +1,155 @@
+import json
+import os
+
+# Loyalty tiers customers can hold, lowest first; policy text names them to vary fees and benefits
+LOYALTY_TIERS = ("standard", "silver", "gold", "platinum")
+
+
+def lookup_key(value):
+    """Ids are stored as strings, so lookups by int match too; None matches nothing."""
+    return None if value is None else str(value)
+
+
+class FlightRecord:
+    """A single flight. Fields not listed in __slots__ are kept in `extra`."""
+    __slots__ = ("flight_id", "origin", "destination", "departure", "status", "aircraft",
+                 "gate", "terminal", "delay_minutes", "cancellation_reason", "extra")
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, flight_id, origin=None, destination=None, departure=None, status=None,
+                 aircraft=None, gate=None, terminal=None, delay_minutes=None,
+                 cancellation_reason=None, **extra):
+        self.flight_id = str(flight_id)
+        self.origin = origin
+        self.destination = destination
+        self.departure = departure
+        self.status = status
+        self.aircraft = aircraft
+        self.gate = gate
+        self.terminal = terminal
+        self.delay_minutes = int(delay_minutes) if delay_minutes is not None else None
+        self.cancellation_reason = cancellation_reason
+        self.extra = extra
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+        data.update(self.extra)
+        return data
+
+
+class CustomerRecord:
+    """A single customer booking. Fields not listed in __slots__ are kept in `extra`."""
+    __slots__ = ("customer_id", "name", "email", "phone", "flight_id", "loyalty_tier",
+                 "loyalty_points", "booking_reference", "seat", "special_requests", "extra")
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, customer_id, name=None, email=None, phone=None, flight_id=None,
+                 loyalty_tier=None, loyalty_points=None, booking_reference=None, seat=None,
+                 special_requests=None, **extra):
+        self.customer_id = str(customer_id)
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.flight_id = lookup_key(flight_id)
+        self.loyalty_tier = loyalty_tier
+        self.loyalty_points = int(loyalty_points) if loyalty_points is not None else None
+        self.booking_reference = booking_reference
+        self.seat = seat
+        self.special_requests = special_requests
+        self.extra = extra
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+        data.update(self.extra)
+        return data
+
+
+class DataStore:
+    """
+    In-memory customer and flight store with hash indexes.
+    Customers are indexed by customer_id, booking_reference and email (case-insensitive),
+    flights by flight_id, and the customer -> flights join is precomputed.
+    """
+
+    def __init__(self, flights=(), customers=()):
+        self.flights = {}
+        self.customers = {}
+        self.customers_by_booking_reference = {}
+        self.customers_by_email = {}
+        # flight_id -> customer_ids booked on it
+        self.customers_by_flight = {}
+        for flight in flights:
+            self.add_flight(flight)
+        for customer in customers:
+            self.add_customer(customer)
+
+    @classmethod
+    def from_json_files(cls, data_dir):
+        """Load flights.json and customers.json from data_dir; missing files load as empty."""
+        def read(filename):
+            try:
+                with open(os.path.join(data_dir, filename), 'r') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return []
+        return cls(read('flights.json'), read('customers.json'))
+
+    def add_flight(self, flight):
+        """Insert or replace a flight from a record or a plain dict."""
+        if isinstance(flight, dict):
+            flight = FlightRecord(**flight)
+        self.flights[flight.flight_id] = flight
+        return flight
+
+    def add_customer(self, customer):
+        """Insert or replace a customer from a record or a plain dict, updating every index."""
+        if isinstance(customer, dict):
+            customer = CustomerRecord(**customer)
+        previous = self.customers.get(customer.customer_id)
+        if previous is not None:
+            self._unindex_customer(previous)
+        self.customers[customer.customer_id] = customer
+        if customer.booking_reference:
+            self.customers_by_booking_reference[customer.booking_reference.upper()] = customer
+        if customer.email:
+            self.customers_by_email[customer.email.lower()] = customer
+        if customer.flight_id:
+            self.customers_by_flight.setdefault(customer.flight_id, set()).add(customer.customer_id)
+        return customer
+
+    def _unindex_customer(self, customer):
+        if customer.booking_reference:
+            self.customers_by_booking_reference.pop(customer.booking_reference.upper(), None)
+        if customer.email:
+            self.customers_by_email.pop(customer.email.lower(), None)
+        if customer.flight_id:
+            self.customers_by_flight.get(customer.flight_id, set()).discard(customer.customer_id)
+
+    def get_flight(self, flight_id):
+        return self.flights.get(lookup_key(flight_id))
+
+    def get_customer(self, customer_id):
+        return self.customers.get(lookup_key(customer_id))
+
+    def find_by_booking_reference(self, booking_reference):
+        key = lookup_key(booking_reference)
+        return self.customers_by_booking_reference.get(key.upper()) if key is not None else None
+
+    def find_by_email(self, email):
+        key = lookup_key(email)
+        return self.customers_by_email.get(key.lower()) if key is not None else None
+
+    def customers_on_flight(self, flight_id):
+        return [self.customers[customer_id] for customer_id in self.customers_by_flight.get(lookup_key(flight_id), ())]
+
+    def get_flight_status(self, flight_id):
+        """Return the flight as a dict, or None if it is unknown."""
+        flight = self.get_flight(flight_id)
+        return flight.to_dict() if flight is not None else None
+
+    def get_customer_details(self, customer_id):
+        """Return the customer as a dict with their flight joined under "flight", or None."""
+        customer = self.get_customer(customer_id)
+        if customer is None:
+            return None
+        return {**customer.to_dict(), "flight": self.get_flight_status(customer.flight_id)}
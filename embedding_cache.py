@@ -0,0 +1,175 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from data_store import LOYALTY_TIERS
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(text):
+    """Normalize a query for cache lookups: lowercase, drop punctuation, collapse whitespace."""
+    return ' '.join(_WORD_RE.findall(text.lower()))
+
+
+def _term_vector(normalized):
+    """Cheap local bag-of-words vector used for the near-duplicate tier."""
+    counts = Counter(normalized.split())
+    norm = math.sqrt(sum(c * c for c in counts.values()))
+    return counts, norm
+
+
+def _key_terms(normalized):
+    """Words a near-duplicate must share exactly: loyalty tiers, and numbers such as flight ids or bag counts."""
+    return frozenset(word for word in normalized.split()
+                     if word in LOYALTY_TIERS or any(ch.isdigit() for ch in word))
+
+
+def _cosine(a, b):
+    counts_a, norm_a = a
+    counts_b, norm_b = b
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(counts_a) > len(counts_b):
+        counts_a, counts_b = counts_b, counts_a
+    dot = sum(c * counts_b.get(term, 0) for term, c in counts_a.items())
+    return dot / (norm_a * norm_b)
+
+
+class _Entry:
+    __slots__ = ("embedding", "terms", "key_terms", "expires_at", "size")
+
+    def __init__(self, embedding, terms, key_terms, expires_at, size):
+        self.embedding = embedding
+        self.terms = terms
+        self.key_terms = key_terms
+        self.expires_at = expires_at
+        self.size = size
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU/TTL cache for query embeddings.
+
+    Lookups hit on the normalized query text, so "How many bags can I check?" and
+    "how many bags can i check" are the same entry. If near_duplicate_threshold
+    is set, a miss falls back to comparing a local bag-of-words cosine against
+    cached queries, so "how many bags can i check in" reuses the embedding of
+    "how many bags can i check" without another network round trip.
+
+    The cosine only counts shared words; it knows nothing about their meaning.
+    A one-word substitution in a short question still scores high, so two
+    queries only share an embedding if they name the same loyalty tiers and
+    numbers: "gold" and "silver" questions never collide. Other distinctions
+    ("can" vs "cannot") are not protected; keep the threshold at 0.9 or above.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, max_bytes=16 * 1024 * 1024,
+                 near_duplicate_threshold=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(key, embedding):
+        # Python floats in a list cost ~32 bytes each including the list slot
+        return len(key) + 32 * len(embedding)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            self._remove(key)
+            self.evictions += 1
+
+    def get(self, query):
+        """Return the cached embedding for query, or None on a miss."""
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.embedding
+                self._remove(key)
+                self.evictions += 1
+
+            if self.near_duplicate_threshold is not None and self._entries:
+                self._evict_expired(now)
+                terms = _term_vector(key)
+                key_terms = _key_terms(key)
+                best_key, best_score = None, self.near_duplicate_threshold
+                for cached_key, cached in self._entries.items():
+                    if cached.key_terms != key_terms:
+                        continue
+                    score = _cosine(terms, cached.terms)
+                    if score >= best_score:
+                        best_key, best_score = cached_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.near_hits += 1
+                    return self._entries[best_key].embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, query, embedding):
+        """Store the embedding for query, evicting least recently used entries as needed."""
+        key = normalize_query(query)
+        size = self._entry_size(key, embedding)
+        if size > self.max_bytes:
+            return
+        terms, key_terms = None, None
+        if self.near_duplicate_threshold is not None:
+            terms, key_terms = _term_vector(key), _key_terms(key)
+        entry = _Entry(embedding, terms, key_terms, time.monotonic() + self.ttl_seconds, size)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_compute(self, query, embed_fn):
+        """Return the cached embedding for query, calling embed_fn(query) on a miss."""
+        embedding = self.get(query)
+        if embedding is None:
+            embedding = embed_fn(query)
+            self.put(query, embedding)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,259 @@
+"""
+Corpus embedding: deduplicated, token-bounded, concurrent batches with retries,
+backed by a content-addressed store on disk.
+
+EmbeddingClient.embed_documents(texts) embeds each distinct text once. Texts
+whose embedding is already in the EmbeddingStore are read from it. The rest are
+packed into batches of at most EMBEDDING_BATCH_MAX_TOKENS tokens and
+EMBEDDING_BATCH_MAX_INPUTS inputs, and EMBEDDING_CONCURRENCY batches run at a
+time. Rate limits (429) pause every batch for the server's Retry-After period
+or an exponential backoff. Server and connection errors are retried up to
+EMBEDDING_MAX_RETRIES times. A batch that still fails raises EmbeddingError:
+the caller gets every vector or an exception, never a placeholder.
+
+The store is an SQLite file (EMBEDDING_STORE_PATH) keyed by a hash of the model
+name and the exact text. Re-indexing a corpus only calls the API for chunks that
+changed, and processes on the same host share the file.
+"""
+import hashlib
+import logging
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_chat import RateLimiter, is_rate_limit_error, retry_after_seconds
+from history_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingError(RuntimeError):
+    """Raised when embeddings could not be produced for every input."""
+
+
+def is_retryable_error(error):
+    """Rate limits, server errors, timeouts and dropped connections."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if is_rate_limit_error(error) or (status is not None and status >= 500):
+        return True
+    # The OpenAI SDK's APIConnectionError/APITimeoutError carry no status code
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        word in type(error).__name__ for word in ("Connection", "Timeout")
+    )
+
+
+def content_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Content-addressed embedding store in SQLite. Vectors are stored as float32.
+    Safe to share between threads, and between processes on the same host.
+    After a fork the child opens its own connection.
+    """
+
+    # Keys per SELECT; SQLite limits bound parameters to 999 by default
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are stored."""
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                chunk = keys[start:start + self.LOOKUP_CHUNK]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs."""
+        rows = [(key, len(vector), array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)", rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+def create_embedding_store():
+    """The store at EMBEDDING_STORE_PATH, opened on first use; an empty path disables it."""
+    path = os.getenv("EMBEDDING_STORE_PATH", os.path.join(tempfile.gettempdir(), "embedding_store.sqlite3"))
+    return EmbeddingStore(path) if path else None
+
+
+class EmbeddingClient:
+    """
+    Embeds corpus text through backend.embed_documents (see llm_backend.py).
+    Each call counts what it did in stats: texts requested, unique texts, store hits,
+    API requests, retries and rate limits.
+    """
+
+    def __init__(self, backend, store=None, max_batch_tokens=None, max_batch_inputs=None,
+                 concurrency=None, max_retries=None, requests_per_minute=None):
+        env = os.getenv
+        self.backend = backend
+        self.model = getattr(backend, "embedding_model", None) or type(backend).__name__
+        self.store = store
+        self.max_batch_tokens = max_batch_tokens or int(env("EMBEDDING_BATCH_MAX_TOKENS", "50000"))
+        self.max_batch_inputs = max_batch_inputs or int(env("EMBEDDING_BATCH_MAX_INPUTS", "256"))
+        self.concurrency = concurrency or int(env("EMBEDDING_CONCURRENCY", "4"))
+        self.max_retries = max_retries if max_retries is not None else int(env("EMBEDDING_MAX_RETRIES", "5"))
+        if requests_per_minute is None:
+            requests_per_minute = float(env("EMBEDDING_MAX_REQUESTS_PER_MINUTE", "0"))
+        self.limiter = RateLimiter(requests_per_minute)
+        self._stats_lock = threading.Lock()
+        self.stats = {"texts": 0, "unique": 0, "store_hits": 0, "requests": 0, "retries": 0, "rate_limited": 0}
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def batches(self, texts):
+        """Split texts into batches bounded by max_batch_tokens and max_batch_inputs."""
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_inputs):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self._count(requests=1)
+            try:
+                vectors = self.backend.embed_documents(texts)
+                break
+            except Exception as e:
+                if not is_retryable_error(e) or attempt == self.max_retries:
+                    raise EmbeddingError(f"Embedding a batch of {len(texts)} texts failed: {e}") from e
+                delay = retry_after_seconds(e) or min(60.0, 2 ** attempt) * (0.5 + random.random())
+                self._count(retries=1, rate_limited=1 if is_rate_limit_error(e) else 0)
+                if is_rate_limit_error(e):
+                    # Every worker backs off, not just this one
+                    self.limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                logger.info("Retrying embedding batch in %.1f s after: %s", delay, e)
+        validate_embeddings(texts, vectors)
+        return vectors
+
+    # An unusable store only costs re-embedding, so its errors are logged rather than raised
+    def _load(self, keys):
+        if self.store is None:
+            return {}
+        try:
+            return self.store.get_many(keys)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Could not read the embedding store: %s", e)
+            return {}
+
+    def _save(self, items):
+        if self.store is None:
+            return
+        try:
+            self.store.put_many(items)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Could not write the embedding store: %s", e)
+
+    def embed_documents(self, texts, persist=True):
+        """Return one vector per text, in order; raises EmbeddingError if any cannot be embedded."""
+        texts = list(texts)
+        unique = list(dict.fromkeys(texts))
+        self._count(texts=len(texts), unique=len(unique))
+        keys = {text: content_key(self.model, text) for text in unique}
+        vectors = self._load(list(keys.values()))
+        self._count(store_hits=len(vectors))
+        missing = [text for text in unique if keys[text] not in vectors]
+
+        if missing:
+            batches = list(self.batches(missing))
+            workers = min(self.concurrency, len(batches))
+            if workers == 1:
+                results = map(self._embed_batch, batches)
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+                results = executor.map(self._embed_batch, batches)
+            try:
+                for batch, batch_vectors in zip(batches, results):
+                    items = [(keys[text], vector) for text, vector in zip(batch, batch_vectors)]
+                    vectors.update(items)
+                    if persist:
+                        # Saved per batch, so a failed run keeps what it already paid for
+                        self._save(items)
+            finally:
+                if workers > 1:
+                    executor.shutdown(wait=True, cancel_futures=True)
+        return [vectors[keys[text]] for text in texts]
+
+    def embed_query(self, text):
+        return self.backend.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.backend.aembed_query(text)
+
+
+# Vectors shorter than this have no direction: normalizing one for cosine search
+# amplifies rounding noise into an arbitrary unit vector
+MIN_EMBEDDING_NORM = 1e-6
+
+
+def validate_embeddings(texts, vectors):
+    """Raise EmbeddingError unless there is one finite, non-zero vector per text, all of the same size."""
+    if len(vectors) != len(texts):
+        raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+    dims = {len(vector) for vector in vectors}
+    if len(dims) != 1 or 0 in dims:
+        raise EmbeddingError(f"Embeddings have inconsistent sizes: {sorted(dims)}")
+    # NaN and infinity survive summation, so one sum per vector finds them
+    if not all(math.isfinite(sum(vector)) for vector in vectors):
+        raise EmbeddingError("Embedding contains non-finite values")
+    if any(math.sqrt(sum(value * value for value in vector)) < MIN_EMBEDDING_NORM for vector in vectors):
+        raise EmbeddingError("Embedding has a zero or near-zero norm")
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# How the structured summary for a human agent is produced:
+#   sequential  - ask for the summary in a second call after the reply mentions ESCALATE
+#   combined    - ask for the reply, escalation flag and summary together in one JSON response
+#   speculative - start the summary call alongside the reply and drop it if not needed
+ESCALATION_MODES = ("sequential", "combined", "speculative")
+DEFAULT_ESCALATION_MODE = "sequential"
+
+
+def get_escalation_mode():
+    """Read the escalation mode from the ESCALATION_MODE environment variable."""
+    mode = os.getenv("ESCALATION_MODE", DEFAULT_ESCALATION_MODE).strip().lower()
+    if mode not in ESCALATION_MODES:
+        logger.warning("Unknown ESCALATION_MODE %r, using %s", mode, DEFAULT_ESCALATION_MODE)
+        return DEFAULT_ESCALATION_MODE
+    return mode
+
+
+def build_combined_instructions(customer_id):
+    """System prompt asking for the reply and the agent summary in a single JSON object."""
+    return f"""
+    Respond ONLY with a JSON object with these keys:
+    - "response": your reply to the customer
+    - "escalate": true if a human agent must take over, otherwise false
+    - "summary": when escalating, a structured summary for the human agent in this format, otherwise null:
+        - Customer ID: {customer_id if customer_id else "Unknown"}
+        - Problem Summary:
+        - Attempted Solutions:
+        - Recommended Next Steps:
+    """
+
+
+def parse_combined_output(text):
+    """
+    Parse a combined JSON reply into (response, needs_escalation, summary).
+    Returns None if the model did not produce the expected JSON.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("response"), str):
+        return None
+    response = data["response"]
+    needs_escalation = bool(data.get("escalate")) or "ESCALATE" in response
+    summary = data.get("summary")
+    if not isinstance(summary, str) or not summary.strip():
+        summary = None
+    return response.replace("ESCALATE", ""), needs_escalation, summary
+
+
+class LatencyRecorder:
+    """Keeps a bounded window of latencies per (mode, path) and summarizes them."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode, path, latency_ms):
+        with self._lock:
+            samples = self._samples.get((mode, path))
+            if samples is None:
+                samples = self._samples[(mode, path)] = deque(maxlen=self.window)
+            samples.append(latency_ms)
+
+    def summary(self):
+        """Return {mode: {path: {count, mean_ms, p50_ms, p95_ms}}}."""
+        with self._lock:
+            snapshot = {key: sorted(samples) for key, samples in self._samples.items()}
+        report = {}
+        for (mode, path), samples in snapshot.items():
+            report.setdefault(mode, {})[path] = {
+                "count": len(samples),
+                "mean_ms": round(sum(samples) / len(samples), 1),
+                "p50_ms": round(samples[round(0.50 * (len(samples) - 1))], 1),
+                "p95_ms": round(samples[round(0.95 * (len(samples) - 1))], 1),
+            }
+        return report
+
+
+ESCALATION_LATENCY = LatencyRecorder()
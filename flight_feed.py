@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FlightStatusSnapshot:
+    """Immutable view of the live flight updates at one version. Never mutated after publish."""
+    __slots__ = ("version", "flights", "applied_events")
+
+    def __init__(self, version, flights, applied_events):
+        self.version = version
+        # flight_id -> dict of fields overriding the base flight record
+        self.flights = flights
+        self.applied_events = applied_events
+
+
+class FlightStatusBoard:
+    """
+    Live flight status overlaid on the base customer/flight store.
+    Writers build a new snapshot (copy-on-write) and publish it with a single
+    reference swap, so readers never take a lock and never see a partial batch.
+    """
+
+    def __init__(self):
+        self._snapshot = FlightStatusSnapshot(0, {}, 0)
+        self._write_lock = threading.Lock()
+
+    def current(self):
+        return self._snapshot
+
+    def apply_events(self, events):
+        """
+        Apply a batch of status events and publish a new snapshot.
+        Each event is a dict with a flight_id and the fields that changed;
+        a field set to null is removed from the flight.
+        """
+        events = [event for event in events if isinstance(event, dict) and event.get("flight_id")]
+        if not events:
+            return self._snapshot
+        with self._write_lock:
+            previous = self._snapshot
+            flights = dict(previous.flights)
+            for event in events:
+                flight_id = str(event["flight_id"])
+                updated = dict(flights.get(flight_id, {}))
+                for field, value in event.items():
+                    if field in ("flight_id", "event_time"):
+                        continue
+                    updated[field] = value
+                flights[flight_id] = updated
+            snapshot = FlightStatusSnapshot(previous.version + 1, flights, previous.applied_events + len(events))
+            self._snapshot = snapshot
+            return snapshot
+
+    def overlay(self, flight_id, flight):
+        """Merge live updates for flight_id into a base flight dict (which may be None)."""
+        updates = self._snapshot.flights.get(flight_id)
+        if not updates:
+            return flight
+        merged = dict(flight) if flight else {"flight_id": flight_id}
+        for field, value in updates.items():
+            if value is None:
+                merged.pop(field, None)
+            else:
+                merged[field] = value
+        return merged
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "flights_updated": len(snapshot.flights),
+            "events_applied": snapshot.applied_events,
+        }
+
+
+class FlightFeedTailer:
+    """
+    Tails an append-only JSONL file of flight status events into a FlightStatusBoard.
+    The file is replayed from the start, then polled for new complete lines; all
+    lines read in one poll are applied as a single batch. Truncation or rotation
+    of the file restarts reading from the beginning of the new file.
+    """
+
+    def __init__(self, board, path, poll_interval=0.5):
+        self.board = board
+        self.path = path
+        self.poll_interval = poll_interval
+        self._offset = 0
+        self._inode = None
+        self._partial = b""
+        self._stop = threading.Event()
+        self._thread = None
+        self.errors = 0
+
+    def poll_once(self):
+        """Read any new events from the file and apply them. Returns the number applied."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._inode = stat.st_ino
+            self._offset = 0
+            self._partial = b""
+        if stat.st_size == self._offset:
+            return 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        self._offset += len(data)
+
+        lines = (self._partial + data).split(b"\n")
+        # Keep an incomplete trailing line until the writer finishes it
+        self._partial = lines.pop()
+        events = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                self.errors += 1
+                logger.warning("Skipping malformed flight status event: %r", line[:100])
+        self.board.apply_events(events)
+        return len(events)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except OSError as e:
+                self.errors += 1
+                logger.error("Error reading flight status feed: %s", e)
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start tailing in a daemon thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="flight-feed-tailer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def start_flight_feed(path, poll_interval=None):
+    """Create a board and, if path is set, start tailing it. Returns (board, tailer or None)."""
+    board = FlightStatusBoard()
+    if not path:
+        return board, None
+    if poll_interval is None:
+        poll_interval = float(os.getenv("FLIGHT_STATUS_FEED_POLL_SECONDS", "0.5"))
+    tailer = FlightFeedTailer(board, path, poll_interval)
+    # Replay what is already in the file before serving requests
+    tailer.poll_once()
+    return board, tailer.start()
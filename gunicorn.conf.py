@@ -0,0 +1,36 @@
+"""
+gunicorn settings for the preforked serving mode (see prefork.py). gunicorn
+reads this file from the working directory:
+
+    gunicorn app:app
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+The master builds the policy index and data tables once, and the workers share
+them. `kill -HUP <master pid>` re-indexes the edited policy files and replaces
+the workers with ones that serve the new index.
+"""
+import multiprocessing
+import os
+
+import prefork
+
+# Workers must not re-index on their own: every worker would hold a private copy of the
+# index, and workers would disagree about it until all had checked. Reload with SIGHUP.
+os.environ.setdefault("POLICY_REFRESH_INTERVAL_SECONDS", "0")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = True
+
+
+def when_ready(server):
+    prefork.prepare_master()
+
+
+def post_fork(server, worker):
+    prefork.start_worker()
+
+
+def on_reload(server):
+    prefork.reload_master()
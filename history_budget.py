@@ -0,0 +1,238 @@
+"""
+Token-budgeted prompt packing.
+
+The prompt is split into sections. The fixed sections are the system prompt,
+customer context and current user message. They are always sent. The rest of
+PROMPT_TOKEN_BUDGET is shared between the retrieved policy information and the
+conversation history. Policy information may take up to POLICY_TOKEN_SHARE of
+what is left; anything it does not use goes to history. History is packed
+newest-first until the budget runs out.
+
+With a server-side session, turns that no longer fit are folded into a rolling
+summary instead of being dropped. A fold summarizes the new overflow together
+with the previous summary in one model call, and it trims history down to
+HISTORY_FOLD_TARGET of the history budget. The next few turns then fit without
+another fold.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing tokens added by the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+# Where tiktoken downloads each vocabulary from; its local cache is keyed on this URL
+_VOCABULARY_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+_PUBLIC_ENCODINGS = ("r50k_base", "p50k_base", "p50k_edit", "cl100k_base", "o200k_base")
+
+
+def _vocabulary_cached(encoding):
+    """True if tiktoken can load encoding from its local cache without going to the network."""
+    if encoding not in _PUBLIC_ENCODINGS:
+        return False
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+    elif "DATA_GYM_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["DATA_GYM_CACHE_DIR"]
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        return False
+    # p50k_edit shares p50k_base's vocabulary
+    url = _VOCABULARY_URL.format(encoding.replace("p50k_edit", "p50k_base"))
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()))
+
+
+def _get_encoder():
+    """
+    Return the tiktoken encoder, or None to estimate token counts instead.
+    TOKEN_COUNTER=auto (the default) only uses a vocabulary already in tiktoken's
+    local cache, since fetching it blocks, or hangs offline, on the first prompt.
+    TOKEN_COUNTER=tiktoken allows the download; TOKEN_COUNTER=estimate never loads tiktoken.
+    """
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                mode = os.getenv("TOKEN_COUNTER", "auto").lower()
+                encoding = os.getenv("TOKEN_ENCODING", "cl100k_base")
+                _encoder = None
+                if mode == "tiktoken" or (mode == "auto" and _vocabulary_cached(encoding)):
+                    try:
+                        import tiktoken
+                        _encoder = tiktoken.get_encoding(encoding)
+                    except Exception as e:
+                        logger.info("tiktoken unavailable, estimating token counts: %s", e)
+                elif mode == "auto":
+                    logger.info("%s vocabulary not cached locally, estimating token counts "
+                                "(set TOKEN_COUNTER=tiktoken to download it)", encoding)
+                _encoder_loaded = True
+    return _encoder
+
+
+def count_tokens(text):
+    """Count the tokens in text, estimating from words and characters without tiktoken."""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    # Close to cl100k for English: roughly one token per word or symbol, or per four characters
+    return max(len(_WORD_RE.findall(text)), math.ceil(len(text) / 4))
+
+
+def count_message_tokens(content):
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoder = _get_encoder()
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    # Shrink by the overshoot ratio until the estimate fits
+    while text and count_tokens(text) > max_tokens:
+        text = text[:max(0, int(len(text) * max_tokens / count_tokens(text)) - 1)]
+    return text
+
+
+class PromptPlan:
+    """What fits in the prompt for one turn, with the token count of each section."""
+    __slots__ = ("policy_info", "summary", "history", "history_budget", "dropped", "token_counts")
+
+    def __init__(self, policy_info, summary, history, history_budget, dropped, token_counts):
+        self.policy_info = policy_info
+        self.summary = summary
+        self.history = history
+        self.history_budget = history_budget
+        # Number of history messages that did not fit
+        self.dropped = dropped
+        self.token_counts = token_counts
+
+
+class PromptBudget:
+    """Splits a total prompt token budget between policy information and history."""
+
+    def __init__(self, total_tokens=None, policy_share=None, fold_target=None):
+        if total_tokens is None:
+            total_tokens = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+        if policy_share is None:
+            policy_share = float(os.getenv("POLICY_TOKEN_SHARE", "0.5"))
+        if fold_target is None:
+            fold_target = float(os.getenv("HISTORY_FOLD_TARGET", "0.5"))
+        self.total_tokens = total_tokens
+        self.policy_share = policy_share
+        self.fold_target = fold_target
+
+    def plan(self, fixed_sections, policy_info, history, summary=None):
+        """
+        Fit policy_info and as many of the most recent history messages as possible into the
+        budget left after fixed_sections, a dict of section name -> text.
+        """
+        token_counts = {name: count_message_tokens(text) if text else 0 for name, text in fixed_sections.items()}
+        remaining = max(0, self.total_tokens - sum(token_counts.values()))
+
+        summary_tokens = count_message_tokens(summary) if summary else 0
+        if summary_tokens > remaining:
+            summary = truncate_to_tokens(summary, remaining - MESSAGE_OVERHEAD_TOKENS)
+            summary_tokens = count_message_tokens(summary) if summary else 0
+        remaining -= summary_tokens
+
+        policy_tokens = 0
+        if policy_info:
+            policy_cap = int(remaining * self.policy_share)
+            policy_tokens = count_message_tokens(policy_info)
+            if policy_tokens > policy_cap:
+                policy_info = truncate_to_tokens(policy_info, policy_cap - MESSAGE_OVERHEAD_TOKENS)
+                policy_tokens = count_message_tokens(policy_info) if policy_info else 0
+        remaining -= policy_tokens
+
+        history_budget = remaining
+        kept = []
+        history_tokens = 0
+        for message in reversed(history):
+            tokens = count_message_tokens(message["content"])
+            if history_tokens + tokens > history_budget:
+                break
+            kept.append(message)
+            history_tokens += tokens
+        kept.reverse()
+
+        token_counts.update({
+            "summary": summary_tokens,
+            "policy": policy_tokens,
+            "history": history_tokens,
+        })
+        token_counts["total"] = sum(token_counts.values())
+        token_counts["budget"] = self.total_tokens
+        token_counts["history_messages"] = len(kept)
+        token_counts["history_dropped"] = len(history) - len(kept)
+        return PromptPlan(policy_info or None, summary or None, kept, history_budget,
+                          len(history) - len(kept), token_counts)
+
+    def plan_session(self, session, fixed_sections, policy_info, summarize):
+        """
+        Plan the prompt for a session, first folding the turns that do not fit into
+        the session's rolling summary. summarize(previous_summary, messages) returns
+        the new summary; if it fails, the overflow is simply left out this turn.
+        """
+        plan = self.plan(fixed_sections, policy_info, session.unsummarized_history(), session.summary)
+        if not plan.dropped:
+            return plan
+
+        unsummarized = session.unsummarized_history()
+        target = int(plan.history_budget * self.fold_target)
+        keep = 0
+        kept_tokens = 0
+        for message in reversed(unsummarized):
+            tokens = count_message_tokens(message["content"])
+            if kept_tokens + tokens > target:
+                break
+            keep += 1
+            kept_tokens += tokens
+        to_fold = unsummarized[:len(unsummarized) - keep]
+        try:
+            summary = summarize(session.summary, to_fold)
+        except Exception as e:
+            logger.error("Error summarizing conversation history: %s", e)
+            return plan
+        session.fold_history(len(to_fold), summary)
+        plan = self.plan(fixed_sections, policy_info, session.unsummarized_history(), session.summary)
+        plan.token_counts["history_folded"] = len(to_fold)
+        return plan
+
+
+def build_history_summary_prompt(previous_summary, messages, max_tokens):
+    """Prompt asking for the rolling summary to be extended with messages."""
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    return f"""
+    You maintain a running summary of a customer service conversation with an airline customer.
+    Update the summary so it also covers the new messages. Keep booking references, flight
+    numbers, dates, requests made and anything promised to the customer; drop small talk.
+    Reply with the updated summary only, in at most {max_tokens} tokens.
+
+    Current summary:
+    {previous_summary or "(none yet)"}
+
+    New messages:
+    {transcript}
+    """
+
+
+def history_summary_max_tokens():
+    return int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "250"))
@@ -0,0 +1,354 @@
+"""
+Hybrid policy retrieval: BM25 and vector search fused with reciprocal-rank fusion.
+
+HybridPolicyRetriever wraps a PolicyRetrieverLangChain. It keeps a BM25 index
+over the same chunks as the FAISS store, in the same row order. The vector
+branch embeds the query and searches FAISS on a worker thread, while the
+caller's thread runs the lexical branch. Each branch contributes its top
+HYBRID_CANDIDATES rows, and a row's fused score is the sum of
+1 / (HYBRID_RRF_K + rank) over the branches that found it. Rank fusion needs no
+score calibration between BM25 and L2 distances. Exact keyword matches (fees,
+tier names) come from BM25, and paraphrases come from the embeddings.
+
+Searches can be restricted by chunk metadata before scoring:
+  policy_name   - a policy name or list of names, e.g. "baggage policy"
+  loyalty_tier  - drops chunks that are only about other tiers. A chunk is tagged with the tiers its
+                  lines name, plus the general bucket if any line names no tier; general chunks
+                  always match. A value that is not one of LOYALTY_TIERS (a customer without a
+                  tier) filters nothing
+  as_of         - drops policies whose "Effective: YYYY-MM-DD" line is later than this date
+A filter becomes a set of rows, cached per index generation. BM25 scores only
+those rows (as numpy arrays of precomputed per-term impacts), and FAISS searches them through an IDSelector, so a narrow filter
+makes a search cheaper rather than over-fetching and discarding.
+
+prefer_tier ranks rather than filters: the chunks that name the customer's tier,
+in fused order, count as one more ranking in the fusion, weighted
+HYBRID_TIER_WEIGHT (default 0.1) against the two branches. A section about other
+tiers stays reachable ("do Standard passengers get reduced change fees?"),
+and the customer's own rules rise above general text of similar relevance.
+
+When HYBRID_VECTOR_TIMEOUT_MS is set, a vector branch that has not finished in
+time (usually a slow embedding call) is dropped for that query. The query is
+answered from BM25 alone, and the embedding still lands in the query cache.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import faiss
+import numpy as np
+
+from bm25_index import BM25Index, expand_query, tokenize
+from data_store import LOYALTY_TIERS
+
+logger = logging.getLogger(__name__)
+
+# Bucket of chunks with a line that names no tier; they apply to every customer
+GENERAL_TIER = "general"
+# The entry tier's name is also an ordinary word ("standard change fees apply"), so it only
+# counts as a tier when it labels a list item or names passengers, members or the tier
+_TIER_RE = re.compile(
+    r"\b(?:" + "|".join(LOYALTY_TIERS[1:]) + r")\b"
+    r"|\b" + LOYALTY_TIERS[0] + r"(?=:|\s+(?:passengers?|members?|customers?|tier)\b)",
+    re.IGNORECASE)
+_EFFECTIVE_RE = re.compile(r"^\W*effective(?: date)?\W*:?\s*(\d{4}-\d{2}-\d{2})", re.IGNORECASE | re.MULTILINE)
+
+# Weight of the preferred tier's ranking relative to the BM25 and vector rankings; a tie-breaker
+# worth about two rank positions near the top, so the more relevant section still wins
+DEFAULT_TIER_WEIGHT = 0.1
+
+# Distinct filters whose row sets are kept per index generation
+MAX_CACHED_FILTERS = 256
+
+
+def loyalty_tiers(text):
+    """Loyalty tiers a chunk of policy text mentions, lowercased and sorted."""
+    return sorted({match.group(0).lower() for match in _TIER_RE.finditer(text)})
+
+
+def section_tiers(body):
+    """Tiers a section body applies to: the tiers its lines name, plus GENERAL_TIER if any line names none."""
+    tiers = set()
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        named = loyalty_tiers(line)
+        tiers.update(named or [GENERAL_TIER])
+    return sorted(tiers)
+
+
+def tier_value(tier):
+    """Lowercased tier name, or None when tier is not one of LOYALTY_TIERS."""
+    tier = tier.strip().lower() if tier else None
+    return tier if tier in LOYALTY_TIERS else None
+
+
+def effective_date(text):
+    """ISO date from a policy's "Effective: YYYY-MM-DD" line, or None."""
+    match = _EFFECTIVE_RE.search(text)
+    return match.group(1) if match else None
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """Fuse ranked lists of ids, each weighted 1 unless weights says otherwise; returns (id, score) pairs, best first."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def fuse_rankings(rankings, k=60, tiers_of=None, prefer_tier=None, tier_weight=DEFAULT_TIER_WEIGHT):
+    """Reciprocal-rank fusion; with prefer_tier, the ids naming that tier are fused in as one more, lighter ranking."""
+    fused = reciprocal_rank_fusion(rankings, k)
+    tier = tier_value(prefer_tier)
+    if tier is None:
+        return fused
+    preferred = [item for item, _ in fused if tier in tiers_of(item)]
+    return reciprocal_rank_fusion(list(rankings) + [preferred], k, [1.0] * len(rankings) + [tier_weight])
+
+
+def filter_key(filters):
+    """Hashable form of a filters dict; None when nothing is filtered."""
+    if not filters:
+        return None
+    key = []
+    for name, value in sorted(filters.items()):
+        if value is None:
+            continue
+        if name == "policy_name":
+            names = [value] if isinstance(value, str) else value
+            value = tuple(sorted(name.lower() for name in names))
+        elif name == "loyalty_tier":
+            value = tier_value(value)
+            if value is None:
+                continue
+        elif name == "as_of":
+            value = value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else str(value)
+            value = value[:10]
+        else:
+            raise ValueError(f"Unknown policy filter {name!r}")
+        key.append((name, value))
+    return tuple(key) or None
+
+
+def matches_filter(metadata, key):
+    """True if a chunk's metadata passes every filter in key (from filter_key)."""
+    for name, value in key:
+        if name == "policy_name" and metadata.get("policy_name", "").lower() not in value:
+            return False
+        if name == "loyalty_tier":
+            tiers = metadata.get("loyalty_tiers") or [GENERAL_TIER]
+            if GENERAL_TIER not in tiers and value not in tiers:
+                return False
+        if name == "as_of":
+            effective = metadata.get("effective_date")
+            if effective and effective > value:
+                return False
+    return True
+
+
+class _Generation:
+    """BM25 index and row metadata for one vector store; replaced whenever the store is."""
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self.docs = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+            for row in range(vector_store.index.ntotal)
+        ]
+        # Keyed by row number, so BM25 doc ids and FAISS ids are the same
+        lexical = BM25Index.build({str(row): doc.page_content for row, doc in enumerate(self.docs)})
+        # Each term's BM25 contribution per document, precomputed so a query is one bincount
+        self.impacts = {}
+        length_norm = np.asarray(lexical.length_norm, dtype=np.float32)
+        for term, (doc_ids, tfs) in lexical.postings.items():
+            tfs = np.asarray(tfs, dtype=np.float32)
+            norms = length_norm[doc_ids]
+            self.impacts[term] = (np.asarray(doc_ids, dtype=np.int64),
+                                  lexical.idf[term] * tfs * (lexical.k1 + 1) / (tfs + norms))
+        self.filters = OrderedDict()
+        self.lock = threading.Lock()
+
+    def search(self, query, top_n, mask=None):
+        """Rows with the top_n BM25 scores for query, best first, among mask if given."""
+        postings = [self.impacts[term] for term in set(tokenize(query)) if term in self.impacts]
+        if not postings:
+            return []
+        doc_ids = np.concatenate([doc_ids for doc_ids, _ in postings])
+        weights = np.concatenate([weights for _, weights in postings])
+        if mask is not None:
+            keep = mask[doc_ids]
+            doc_ids, weights = doc_ids[keep], weights[keep]
+        scores = np.bincount(doc_ids, weights=weights, minlength=len(self.docs))
+        top_n = min(top_n, int(np.count_nonzero(scores)))
+        if not top_n:
+            return []
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+    def rows(self, key):
+        """(sorted int64 array, boolean mask) of the rows matching a filter key."""
+        with self.lock:
+            rows = self.filters.get(key)
+            if rows is not None:
+                self.filters.move_to_end(key)
+                return rows
+        matching = [row for row, doc in enumerate(self.docs) if matches_filter(doc.metadata, key)]
+        mask = np.zeros(len(self.docs), dtype=bool)
+        mask[matching] = True
+        rows = (np.array(matching, dtype=np.int64), mask)
+        with self.lock:
+            self.filters[key] = rows
+            while len(self.filters) > MAX_CACHED_FILTERS:
+                self.filters.popitem(last=False)
+        return rows
+
+
+class HybridPolicyRetriever:
+    """
+    Same interface as PolicyRetrieverLangChain (format_for_prompt, refresh, ...),
+    with every lookup running both branches. Methods not defined here are
+    delegated to the vector retriever.
+    """
+
+    def __init__(self, vector_retriever, candidates=None, rrf_k=None, vector_timeout_ms=None, workers=None,
+                 tier_weight=None):
+        env = os.getenv
+        self.vector_retriever = vector_retriever
+        self.candidates = candidates or int(env("HYBRID_CANDIDATES", "20"))
+        self.rrf_k = rrf_k or int(env("HYBRID_RRF_K", "60"))
+        if tier_weight is None:
+            tier_weight = float(env("HYBRID_TIER_WEIGHT", str(DEFAULT_TIER_WEIGHT)))
+        self.tier_weight = tier_weight
+        if vector_timeout_ms is None:
+            vector_timeout_ms = float(env("HYBRID_VECTOR_TIMEOUT_MS", "0"))
+        self.vector_timeout = vector_timeout_ms / 1000 if vector_timeout_ms else None
+        self.executor = ThreadPoolExecutor(max_workers=workers or int(env("HYBRID_WORKERS", "8")),
+                                           thread_name_prefix="hybrid")
+        self._generation = None
+        self._generation_lock = threading.Lock()
+        self._current()
+
+    def __getattr__(self, name):
+        if name == "vector_retriever":
+            raise AttributeError(name)
+        return getattr(self.vector_retriever, name)
+
+    def _current(self):
+        """The generation for the live vector store, rebuilding the BM25 side after a refresh."""
+        vector_store = self.vector_retriever.vector_store
+        generation = self._generation
+        if vector_store is None:
+            return None
+        if generation is None or generation.vector_store is not vector_store:
+            with self._generation_lock:
+                generation = self._generation
+                if generation is None or generation.vector_store is not vector_store:
+                    generation = self._generation = _Generation(vector_store)
+        return generation
+
+    def refresh(self):
+        result = self.vector_retriever.refresh()
+        self._current()
+        return result
+
+    def _rows(self, generation, filters):
+        key = filter_key(filters)
+        return None if key is None else generation.rows(key)
+
+    def _lexical(self, generation, query, rows):
+        return generation.search(expand_query(query), self.candidates, None if rows is None else rows[1])
+
+    def _vector(self, generation, query_embedding, rows):
+        index = generation.vector_store.index
+        query = np.asarray([query_embedding], dtype="float32")
+        k = min(self.candidates, index.ntotal if rows is None else len(rows[0]))
+        if rows is None:
+            _, ids = index.search(query, k)
+        else:
+            ids = self._search_rows(index, query, k, *rows)
+        return [row for row in ids[0].tolist() if row >= 0]
+
+    def _search_rows(self, index, query, k, rows, mask):
+        spec = self.vector_retriever.index_spec
+        selector = faiss.IDSelectorBatch(rows)
+        base = faiss.downcast_index(index)
+        if isinstance(base, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=spec.nprobe)
+        elif isinstance(base, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=spec.ef_search)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        try:
+            _, ids = index.search(query, k, params=params)
+        except RuntimeError:
+            # Wrapper indexes (e.g. a refine stage) reject selectors; filter a wider search instead
+            _, ids = index.search(query, min(index.ntotal, k * 10))
+            ids = np.array([[row for row in ids[0].tolist() if row >= 0 and mask[row]][:k]])
+        return ids
+
+    def _fuse(self, generation, rankings, top_k, prefer_tier=None):
+        fused = fuse_rankings([ranking for ranking in rankings if ranking], self.rrf_k,
+                              lambda row: generation.docs[row].metadata.get("loyalty_tiers", ()), prefer_tier,
+                              self.tier_weight)
+        results = []
+        for row, _ in fused[:top_k]:
+            doc = generation.docs[row]
+            results.append((doc.metadata.get("policy_name", "Unknown Policy"), doc.page_content))
+        return results
+
+    def get_relevant_policies(self, query, top_k=3, filters=None, prefer_tier=None):
+        """Retrieve the most relevant policy sections, optionally restricted by metadata filters."""
+        self.vector_retriever.refresh_if_changed()
+        generation = self._current()
+        if generation is None:
+            logger.warning("Vector store not initialized.")
+            return []
+        rows = self._rows(generation, filters)
+        if rows is not None and not len(rows[0]):
+            return []
+
+        vector_future = self.executor.submit(
+            lambda: self._vector(generation, self.vector_retriever.query_embedding(query), rows))
+        lexical = self._lexical(generation, query, rows)
+        try:
+            vector = vector_future.result(timeout=self.vector_timeout)
+        except FutureTimeoutError:
+            logger.info("Vector search over %.0f ms; answering from BM25 alone", self.vector_timeout * 1000)
+            vector = []
+        return self._fuse(generation, [lexical, vector], top_k, prefer_tier)
+
+    async def aget_relevant_policies(self, query, top_k=3, filters=None, prefer_tier=None):
+        """Async variant of get_relevant_policies; BM25 runs while the query embedding is awaited."""
+        await self.vector_retriever.arefresh_if_changed()
+        generation = self._current()
+        if generation is None:
+            logger.warning("Vector store not initialized.")
+            return []
+        rows = self._rows(generation, filters)
+        if rows is not None and not len(rows[0]):
+            return []
+
+        embedding = asyncio.ensure_future(self.vector_retriever.aquery_embedding(query))
+        lexical = self._lexical(generation, query, rows)
+        try:
+            query_embedding = await asyncio.wait_for(asyncio.shield(embedding), self.vector_timeout)
+            vector = self._vector(generation, query_embedding, rows)
+        except asyncio.TimeoutError:
+            logger.info("Vector search over %.0f ms; answering from BM25 alone", self.vector_timeout * 1000)
+            vector = []
+        return self._fuse(generation, [lexical, vector], top_k, prefer_tier)
+
+    def format_for_prompt(self, query, filters=None, prefer_tier=None):
+        return self.vector_retriever.format_policies(
+            self.get_relevant_policies(query, filters=filters, prefer_tier=prefer_tier))
+
+    async def aformat_for_prompt(self, query, filters=None, prefer_tier=None):
+        return self.vector_retriever.format_policies(
+            await self.aget_relevant_policies(query, filters=filters, prefer_tier=prefer_tier))
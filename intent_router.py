@@ -0,0 +1,287 @@
+"""
+Intent routing in front of the chat model.
+
+Questions that only ask for a field of the customer's booking (flight status,
+gate, delay, departure time, seat, booking reference) are answered from
+templates over the customer/flight store without retrieval or a completion.
+Everything else goes to the LLM.
+
+A question answers about the customer's own flight unless it names a flight id.
+A different flight's status, gate, delay or departure time is looked up with
+get_flight_status when the router has one. Seat and booking reference questions
+about another flight, and unknown flight ids, go to the LLM. So do messages
+about a flight that has no id in the message ("my connecting flight", "the
+return flight"), since the store only links a customer to one flight.
+
+Classification is keyword/regex first. Messages no pattern matches are
+passed to a small nearest-neighbour classifier over TF-IDF vectors of example
+phrasings (IntentClassifier), when one is configured. A template only answers
+a message that asks for exactly one thing: requests for action ("change my
+flight", "tell the gate agent"), complaints, cancellations, policy questions,
+compound questions ("... and can I bring a stroller") and long messages always
+go to the LLM. A wrong template answer costs more than an unneeded completion.
+"""
+import os
+import re
+import threading
+import time
+
+from escalation import LatencyRecorder
+
+STRUCTURED_INTENTS = ("status", "gate", "delay_minutes", "departure", "seat", "booking_reference")
+# Intents about the customer's booking rather than the flight; never answered for another flight
+BOOKING_INTENTS = ("seat", "booking_reference")
+
+INTENT_PATTERNS = {
+    "status": re.compile(
+        r"\b(on time|on schedule|flight status|status of (my |the )?flight"
+        r"|is (my|the) flight (still )?(delayed|late|on time|running|departing|leaving))\b"),
+    "gate": re.compile(r"\b(gate|(which|what) terminal)\b"),
+    "delay_minutes": re.compile(r"\b(how (long|late|much)\b.*\bdelay\w*|delayed by|how late|length of (the )?delay)\b"),
+    "departure": re.compile(
+        r"\b(departure time|(what time|when)\b.*\b(leave|leaves|leaving|depart\w*|take off|takes off|taking off))\b"),
+    "seat": re.compile(r"\b(my seat|seat (number|assignment)|which seat|what seat|where am i sitting)\b"),
+    "booking_reference": re.compile(r"\b(booking|confirmation|reservation) (reference|code|number)\b|\b(pnr|record locator)\b"),
+}
+
+# Requests for action, complaints, cancellations, explanations and policy questions
+# need the LLM even if a pattern matches
+OPEN_ENDED_RE = re.compile(
+    r"\b(why|change|cancel\w*|rebook|refund|upgrade|compensat\w*|switch|move me|options?|alternatives?"
+    r"|want|need|send|message|contact|speak|talk|call|agent|staff|help|fix|replace"
+    r"|complain\w*|stuck|awful|terrible|horrible|worst|ridiculous|unacceptable|angry|upset|frustrat\w*"
+    r"|annoy\w*|disappoint\w*|nobody|no one|broken|damaged|dirty|rude|problem|issue|wrong"
+    r"|baggage|bag|bags|luggage|pet|dog|cat|stroller|miles|points|lounge|policy|voucher|meal|wheelchair)\b")
+
+# Flight ids like FL002; a message naming one asks about that flight
+FLIGHT_ID_RE = re.compile(r"\b[a-z]{2}\d{2,4}\b")
+# A flight other than the customer's booked one, named without an id
+OTHER_FLIGHT_RE = re.compile(
+    r"\b(connect\w*|layover|stopover|transfer|return\w*|onward|outbound|inbound|other|another|next|second"
+    r"|earlier|later)\b|\bflights\b")
+
+# A second clause or question means the message asks for more than one template can answer
+SECOND_CLAUSE_RE = re.compile(r"\b(and|or|but|also|plus|then|because|so)\b|[,;]|[.?!]\s*\S")
+
+# Example phrasings for the classifier; "other" holds questions that need the LLM
+TRAINING_EXAMPLES = {
+    "status": [
+        "is my flight on time", "what is the status of my flight", "is the flight delayed",
+        "is my flight still going", "any news on my flight", "is my plane leaving on schedule",
+        "flight status please",
+    ],
+    "gate": [
+        "where is my gate", "which gate do i board from", "what gate is my flight at",
+        "gate number", "where do i board",
+    ],
+    "delay_minutes": [
+        "how long is the delay", "how late is my flight", "how many minutes delayed",
+        "how much longer do i have to wait",
+    ],
+    "departure": [
+        "what time does my flight leave", "when does my flight depart", "what is the departure time",
+        "when will my delayed flight leave", "what is the new departure time", "when do we take off",
+    ],
+    "seat": [
+        "what is my seat", "which seat am i in", "seat number", "where am i sitting",
+        "what seat did i get", "my seat assignment",
+    ],
+    "booking_reference": [
+        "what is my booking reference", "booking code", "confirmation number",
+        "what is my reservation number", "i lost my booking reference", "record locator",
+    ],
+    "other": [
+        "how many bags can i check", "what is the cancellation policy", "can i get a refund",
+        "i want to change my flight", "how do i earn miles", "can i bring my dog",
+        "do gold members get lounge access", "i need wheelchair assistance",
+        "my bag was damaged", "can you help me", "hello", "thank you",
+        "what are the benefits of silver status", "can i upgrade my seat",
+        "has my flight been cancelled", "what are my options", "i am at the terminal",
+    ],
+}
+
+
+class IntentClassifier:
+    """
+    Nearest-neighbour intent classifier over TF-IDF vectors of TRAINING_EXAMPLES,
+    using the vectorizer settings from policy_retrieval.py. Fits in a few
+    milliseconds and predicts in well under one.
+    """
+
+    def __init__(self, examples=None, min_confidence=None):
+        from policy_retrieval import create_vectorizer
+
+        examples = examples or TRAINING_EXAMPLES
+        if min_confidence is None:
+            min_confidence = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.5"))
+        self.min_confidence = min_confidence
+        self.labels = [label for label, phrases in examples.items() for _ in phrases]
+        self.vectorizer = create_vectorizer(ngram_range=(1, 2), sublinear_tf=True)
+        # Rows are L2-normalized, so the product with a query vector is cosine similarity
+        self.example_matrix_t = self.vectorizer.fit_transform(
+            [phrase for phrases in examples.values() for phrase in phrases]
+        ).T.tocsr()
+
+    def predict(self, text):
+        """Return (intent, score) for the closest example, or (None, score) below min_confidence or for "other"."""
+        scores = (self.vectorizer.transform([text]) @ self.example_matrix_t).toarray()[0]
+        best = int(scores.argmax())
+        score = float(scores[best])
+        label = self.labels[best]
+        if label == "other" or score < self.min_confidence:
+            return None, score
+        return label, score
+
+
+def _first_name(details):
+    return (details.get("name") or "").split(" ")[0] or "there"
+
+
+def answer_status(details, flight):
+    text = f"Flight {flight['flight_id']} from {flight.get('origin')} to {flight.get('destination')}, departing {flight.get('departure')}, is {flight.get('status', 'scheduled')}."
+    if flight.get("delay_minutes"):
+        text += f" The current delay is {flight['delay_minutes']} minutes."
+    if flight.get("cancellation_reason"):
+        text += f" Reason: {flight['cancellation_reason']}."
+    return text
+
+
+def answer_gate(details, flight):
+    if not flight.get("gate"):
+        return f"A gate has not been assigned to flight {flight['flight_id']} yet."
+    terminal = f" in terminal {flight['terminal']}" if flight.get("terminal") else ""
+    return f"Flight {flight['flight_id']} departs from gate {flight['gate']}{terminal}."
+
+
+def answer_departure(details, flight):
+    if str(flight.get("status", "")).lower() == "cancelled":
+        return answer_status(details, flight)
+    text = f"Flight {flight['flight_id']} is scheduled to depart at {flight.get('departure')}."
+    if flight.get("delay_minutes"):
+        text += f" It is delayed by {flight['delay_minutes']} minutes."
+    return text
+
+
+def answer_delay_minutes(details, flight):
+    if flight.get("delay_minutes"):
+        return f"Flight {flight['flight_id']} is delayed by {flight['delay_minutes']} minutes."
+    if str(flight.get("status", "")).lower() == "cancelled":
+        return answer_status(details, flight)
+    return f"Flight {flight['flight_id']} is not delayed; its status is {flight.get('status', 'scheduled')}."
+
+
+def answer_seat(details, flight):
+    if not details.get("seat"):
+        return f"You do not have a seat assigned on flight {flight['flight_id']} yet."
+    return f"Your seat on flight {flight['flight_id']} is {details['seat']}."
+
+
+def answer_booking_reference(details, flight):
+    if not details.get("booking_reference"):
+        return "I could not find a booking reference on your profile."
+    return f"Your booking reference is {details['booking_reference']}."
+
+
+TEMPLATES = {
+    "status": answer_status,
+    "gate": answer_gate,
+    "delay_minutes": answer_delay_minutes,
+    "departure": answer_departure,
+    "seat": answer_seat,
+    "booking_reference": answer_booking_reference,
+}
+
+
+class IntentRouter:
+    """
+    Answers structured intents from templates and counts how much traffic it
+    short-circuits. get_customer_details(customer_id) returns the customer dict
+    with its flight under "flight"; classifier, if given, has predict(text);
+    get_flight_status(flight_id), if given, returns any flight's dict or None.
+    """
+
+    def __init__(self, get_customer_details, classifier=None, max_words=None, get_flight_status=None):
+        self.get_customer_details = get_customer_details
+        self.get_flight_status = get_flight_status
+        self.classifier = classifier
+        self.max_words = max_words or int(os.getenv("INTENT_MAX_WORDS", "20"))
+        self.latency = LatencyRecorder()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.short_circuited = 0
+        self.by_intent = {}
+
+    def classify(self, user_message):
+        """Return the one structured intent asked for as a list, or [] when the LLM should answer."""
+        text = (user_message or "").lower().strip()
+        if (not text or len(text.split()) > self.max_words or OPEN_ENDED_RE.search(text)
+                or SECOND_CLAUSE_RE.search(text) or OTHER_FLIGHT_RE.search(text)):
+            return []
+        intents = [intent for intent, pattern in INTENT_PATTERNS.items() if pattern.search(text)]
+        if not intents and self.classifier is not None:
+            intent, _ = self.classifier.predict(text)
+            if intent is not None:
+                intents = [intent]
+        if "status" in intents:
+            # The status answer already includes the departure time and delay
+            intents = [intent for intent in intents if intent not in ("delay_minutes", "departure")]
+        return intents if len(intents) == 1 else []
+
+    def flight_for(self, details, intents, user_message):
+        """The flight a classified message asks about, or None if the LLM should answer."""
+        own = details.get("flight")
+        named = set(FLIGHT_ID_RE.findall(user_message.lower()))
+        if not named:
+            return own
+        if len(named) > 1:
+            return None
+        flight_id = named.pop().upper()
+        if own and str(own.get("flight_id", "")).upper() == flight_id:
+            return own
+        if self.get_flight_status is None or any(intent in BOOKING_INTENTS for intent in intents):
+            return None
+        return self.get_flight_status(flight_id)
+
+    def route(self, customer_id, user_message):
+        """Return a templated chat result, or None if the message should go to the LLM."""
+        start = time.perf_counter()
+        intents = self.classify(user_message) if customer_id else []
+        details = self.get_customer_details(customer_id) if intents else None
+        flight = self.flight_for(details, intents, user_message) if details else None
+
+        if not flight:
+            with self._lock:
+                self.requests += 1
+            self.latency.record("llm", "classify", (time.perf_counter() - start) * 1000)
+            return None
+
+        response = f"Hi {_first_name(details)}! " + " ".join(TEMPLATES[intent](details, flight) for intent in intents)
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.requests += 1
+            self.short_circuited += 1
+            for intent in intents:
+                self.by_intent[intent] = self.by_intent.get(intent, 0) + 1
+        self.latency.record("template", "+".join(intents), latency_ms)
+        return {
+            "response": response,
+            "needs_escalation": False,
+            "intent": intents,
+            "routed": "template",
+            "latency_ms": round(latency_ms, 3),
+        }
+
+    def stats(self):
+        with self._lock:
+            requests, short_circuited, by_intent = self.requests, self.short_circuited, dict(self.by_intent)
+        return {
+            "requests": requests,
+            "short_circuited": short_circuited,
+            "short_circuit_rate": short_circuited / requests if requests else 0.0,
+            "by_intent": by_intent,
+            "latency": self.latency.summary(),
+        }
+
+
+def intent_router_enabled():
+    return os.getenv("INTENT_ROUTER", "1").strip().lower() not in ("0", "false", "no", "off")
@@ -0,0 +1,297 @@
+"""
+Chat and embedding backends shared by app.py and api/index.py.
+
+LLM_BACKEND selects the implementation:
+  openai - the OpenAI API (the default)
+  mock   - an in-process stand-in with configurable latency, token streaming,
+           error injection and stub embeddings, for load testing without the
+           live API
+
+Every backend takes messages as {"role", "content"} dicts or LangChain message
+objects and returns plain strings:
+
+  chat(messages, json_mode=False, max_tokens=None) -> str
+  achat(...)                                        -> str (async)
+  stream(messages, max_tokens=None)                 -> iterator of text pieces
+  embed_documents(texts) / embed_query(text) / aembed_query(text)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# LangChain message types -> chat API roles
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def to_chat_messages(messages):
+    """Convert LangChain message objects to {"role", "content"} dicts; dicts pass through."""
+    converted = []
+    for message in messages:
+        if isinstance(message, dict):
+            converted.append(message)
+        else:
+            converted.append({"role": _ROLES.get(message.type, message.type), "content": message.content})
+    return converted
+
+
+class OpenAIBackend:
+    """The OpenAI API via the openai SDK, imported on first use."""
+
+    # Inputs per embeddings request
+    EMBEDDING_BATCH_SIZE = 512
+
+    def __init__(self, model=None, embedding_model=None, temperature=0.7):
+        self.model = model or os.getenv("OPENAI_CHAT_MODEL", "gpt-3.5-turbo")
+        self.embedding_model = embedding_model or os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        self.temperature = temperature
+        self._client = None
+        self._async_client = None
+        self._http_async_client = None
+        self._lock = threading.Lock()
+        # Clients are recreated after a fork (see prefork.py) so workers never share a parent's connections
+        self._client_pid = None
+        self._async_client_pid = None
+
+    @property
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    import openai
+                    self._client = openai.OpenAI()
+                    self._client_pid = os.getpid()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None or self._async_client_pid != os.getpid():
+            import httpx
+            import openai
+
+            # Pooled keep-alive connections let many in-flight conversations share a few sockets
+            self._http_async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "200")),
+                    max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50"))
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0)
+            )
+            self._async_client = openai.AsyncOpenAI(http_client=self._http_async_client)
+            self._async_client_pid = os.getpid()
+        return self._async_client
+
+    async def aclose(self):
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        self._async_client = None
+        self._http_async_client = None
+
+    def _request(self, messages, json_mode, max_tokens):
+        request = {"model": self.model, "messages": to_chat_messages(messages), "temperature": self.temperature}
+        if max_tokens:
+            request["max_tokens"] = max_tokens
+        if json_mode:
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def chat(self, messages, json_mode=False, max_tokens=None):
+        response = self.client.chat.completions.create(**self._request(messages, json_mode, max_tokens))
+        return response.choices[0].message.content or ""
+
+    async def achat(self, messages, json_mode=False, max_tokens=None):
+        response = await self.async_client.chat.completions.create(**self._request(messages, json_mode, max_tokens))
+        return response.choices[0].message.content or ""
+
+    def stream(self, messages, max_tokens=None):
+        for chunk in self.client.chat.completions.create(stream=True, **self._request(messages, False, max_tokens)):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def embed_documents(self, texts):
+        vectors = []
+        for batch_start in range(0, len(texts), self.EMBEDDING_BATCH_SIZE):
+            batch = texts[batch_start:batch_start + self.EMBEDDING_BATCH_SIZE]
+            response = self.client.embeddings.create(model=self.embedding_model, input=batch)
+            vectors.extend(item.embedding for item in response.data)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        response = await self.async_client.embeddings.create(model=self.embedding_model, input=[text])
+        return response.data[0].embedding
+
+
+class MockLLMError(Exception):
+    """Injected failure; status_code mirrors the API error it stands in for (429 or 500)."""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = None
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution into a function returning milliseconds:
+    "fixed:MS", "uniform:LOW:HIGH", "normal:MEAN:STDDEV" or "lognormal:MEDIAN:SIGMA".
+    """
+    kind, _, params = spec.strip().lower().partition(":")
+    values = [float(value) for value in params.split(":") if value]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class MockBackend:
+    """
+    In-process stand-in for the chat and embeddings APIs.
+
+    Replies are deterministic for a given last user message. Their latency is
+    the time to first token (LLM_MOCK_LATENCY) plus LLM_MOCK_TOKEN_MS per token.
+    LLM_MOCK_ESCALATION_RATE of the messages get an escalation reply.
+    LLM_MOCK_ERROR_RATE of calls fail with a 500 and LLM_MOCK_RATE_LIMIT_RATE
+    with a 429. Embeddings are hashed bags of words, so texts that share words
+    come out similar and retrieval still behaves sensibly.
+    """
+
+    def __init__(self, latency=None, token_ms=None, embedding_latency=None, error_rate=None,
+                 rate_limit_rate=None, escalation_rate=None, reply_tokens=None, embedding_dim=None, seed=None):
+        env = os.getenv
+        self.latency = parse_latency(latency or env("LLM_MOCK_LATENCY", "lognormal:300:0.4"))
+        self.token_ms = float(token_ms if token_ms is not None else env("LLM_MOCK_TOKEN_MS", "15"))
+        self.embedding_latency = parse_latency(embedding_latency or env("LLM_MOCK_EMBEDDING_LATENCY", "fixed:20"))
+        self.error_rate = float(error_rate if error_rate is not None else env("LLM_MOCK_ERROR_RATE", "0"))
+        self.rate_limit_rate = float(rate_limit_rate if rate_limit_rate is not None else env("LLM_MOCK_RATE_LIMIT_RATE", "0"))
+        self.escalation_rate = float(escalation_rate if escalation_rate is not None else env("LLM_MOCK_ESCALATION_RATE", "0.1"))
+        self.reply_tokens = int(reply_tokens or env("LLM_MOCK_REPLY_TOKENS", "60"))
+        self.embedding_dim = int(embedding_dim or env("LLM_MOCK_EMBEDDING_DIM", "1536"))
+        # Vectors of different sizes must not share index or embedding store entries
+        self.embedding_model = f"mock-embedding-{self.embedding_dim}"
+        seed = seed if seed is not None else env("LLM_MOCK_SEED")
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = {"chat": 0, "stream": 0, "embed": 0, "errors": 0}
+
+    def _sample(self, distribution):
+        with self._rng_lock:
+            return distribution(self._rng)
+
+    def _maybe_fail(self, kind):
+        with self._rng_lock:
+            self.calls[kind] += 1
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.calls["errors"] += 1
+        if roll < self.rate_limit_rate:
+            raise MockLLMError(429, "Mock rate limit exceeded")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise MockLLMError(500, "Mock backend error")
+
+    def _reply(self, messages, json_mode, max_tokens=None):
+        messages = to_chat_messages(messages)
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        digest = hashlib.sha256(question.encode("utf-8")).digest()
+        escalate = digest[0] / 256 < self.escalation_rate
+        reply_tokens = min(self.reply_tokens, max_tokens) if max_tokens else self.reply_tokens
+        words = ["mock"] * max(0, reply_tokens - 12)
+        text = f"Thanks for asking about {' '.join(question.split()[:6])!r}. " + " ".join(words)
+        if escalate:
+            text += " ESCALATE"
+        if json_mode:
+            summary = "- Problem Summary: mock escalation" if escalate else None
+            return json.dumps({"response": text, "escalate": escalate, "summary": summary})
+        return text
+
+    def _timing(self, text):
+        pieces = [piece + " " for piece in text.split(" ")]
+        return self._sample(self.latency) / 1000, pieces
+
+    def chat(self, messages, json_mode=False, max_tokens=None):
+        self._maybe_fail("chat")
+        text = self._reply(messages, json_mode, max_tokens)
+        first_token, pieces = self._timing(text)
+        time.sleep(first_token + len(pieces) * self.token_ms / 1000)
+        return text
+
+    async def achat(self, messages, json_mode=False, max_tokens=None):
+        self._maybe_fail("chat")
+        text = self._reply(messages, json_mode, max_tokens)
+        first_token, pieces = self._timing(text)
+        await asyncio.sleep(first_token + len(pieces) * self.token_ms / 1000)
+        return text
+
+    def stream(self, messages, max_tokens=None):
+        self._maybe_fail("stream")
+        first_token, pieces = self._timing(self._reply(messages, False, max_tokens))
+        time.sleep(first_token)
+        for piece in pieces:
+            yield piece
+            time.sleep(self.token_ms / 1000)
+
+    def _embed(self, text):
+        vector = [0.0] * self.embedding_dim
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.embedding_dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        self._maybe_fail("embed")
+        time.sleep(self._sample(self.embedding_latency) / 1000)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        self._maybe_fail("embed")
+        await asyncio.sleep(self._sample(self.embedding_latency) / 1000)
+        return self._embed(text)
+
+    async def aclose(self):
+        pass
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "mock": MockBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide backend selected by LLM_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = os.getenv("LLM_BACKEND", "openai").strip().lower()
+                if name not in BACKENDS:
+                    logger.warning("Unknown LLM_BACKEND %r, using openai", name)
+                    name = "openai"
+                _backend = BACKENDS[name]()
+    return _backend
@@ -0,0 +1,274 @@
+"""
+Logging setup, Prometheus metrics and per-request timing spans for the chat pipeline.
+
+LOG_LEVEL sets the level for every module logger (default INFO). Startup
+messages are logged at INFO. Prompt dumps, raw model replies and each request's
+span breakdown are logged at DEBUG. Requests slower than CHAT_SLOW_REQUEST_MS
+(default 10000) log their breakdown at WARNING, so the slow tail can be seen
+without debug logging.
+
+A request is timed by start_trace(). Code anywhere below it wraps work in
+span(stage), and the time lands in both the request's trace and the
+chat_stage_seconds histogram. The trace is held in a context variable, so it
+follows asyncio tasks and asyncio.to_thread. Work submitted to a
+ThreadPoolExecutor is not covered; time the wait for its result instead.
+render_metrics() returns every metric in the Prometheus text format.
+"""
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging():
+    """Configure the root logger from LOG_LEVEL unless the host (e.g. gunicorn) already has."""
+    level = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(format=LOG_FORMAT)
+    root.setLevel(getattr(logging, level, logging.INFO))
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = float(os.getenv("CHAT_SLOW_REQUEST_MS", "10000"))
+
+# Seconds; spans run from sub-millisecond lookups to multi-second completions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @property
+    def family(self):
+        """Name the HELP and TYPE lines use; the text format expects the sample name, with _total."""
+        return f"{self.name}_total"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    @property
+    def family(self):
+        return self.name
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(total)}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Module reloads (e.g. api/index.py imported twice) reuse the first instance
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.family} {metric.documentation}")
+            lines.append(f"# TYPE {metric.family} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+CHAT_REQUESTS = REGISTRY.counter(
+    "chat_requests", "Chat requests handled, by endpoint and how they were answered.", ("endpoint", "path"))
+CHAT_ERRORS = REGISTRY.counter(
+    "chat_errors", "Chat requests that failed, by endpoint and pipeline stage.", ("endpoint", "stage"))
+CHAT_REQUEST_SECONDS = REGISTRY.histogram(
+    "chat_request_seconds", "End-to-end chat request latency.", ("endpoint",))
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_seconds", "Time spent in each chat pipeline stage.", ("stage",))
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+class RequestTrace:
+    """Stage timings for one request; a stage entered several times accumulates."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.path = "llm"
+        self.failed_stage = None
+
+    def add(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        return {
+            "endpoint": self.endpoint,
+            "path": self.path,
+            "total_ms": round(self.elapsed() * 1000, 3),
+            "spans_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.spans.items()},
+            **({"failed_stage": self.failed_stage} if self.failed_stage else {}),
+        }
+
+
+_current_trace = contextvars.ContextVar("chat_request_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as stage, in the current trace (if any) and the stage histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        trace = _current_trace.get()
+        if trace is not None and trace.failed_stage is None:
+            trace.failed_stage = stage
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+def record_span(stage, seconds):
+    """Record a stage timed without span(), e.g. one interleaved with yields."""
+    CHAT_STAGE_SECONDS.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def set_path(path):
+    """Label the current request with how it was answered (llm, template, cache, error)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.path = path
+
+
+def start_trace(endpoint):
+    """Begin timing a request; returns the trace and the token to pass to finish_trace."""
+    trace = RequestTrace(endpoint)
+    return trace, _current_trace.set(trace)
+
+
+def finish_trace(trace, token=None):
+    """Record the request's metrics and log its span breakdown."""
+    if token is not None:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streamed response finished in a different context than it started in
+            _current_trace.set(None)
+    elapsed = trace.elapsed()
+    CHAT_REQUEST_SECONDS.observe(elapsed, trace.endpoint)
+    CHAT_REQUESTS.inc(trace.endpoint, trace.path)
+    if trace.path == "error":
+        CHAT_ERRORS.inc(trace.endpoint, trace.failed_stage or "unknown")
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        logger.warning("Slow chat request: %s", json.dumps(trace.report()))
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Chat request: %s", json.dumps(trace.report()))
+
+
+
+async def timed(stage, awaitable):
+    """Await awaitable inside span(stage); for stages run concurrently with asyncio.gather."""
+    with span(stage):
+        return await awaitable
@@ -1,13 +1,27 @@
 import os
-import re
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from bm25_index import expand_query
+from policy_sections import split_sections
+
+def create_vectorizer(**overrides):
+    """TF-IDF vectorizer with the settings used for policy retrieval; also used by the intent classifier."""
+    settings = {"stop_words": "english"}
+    settings.update(overrides)
+    return TfidfVectorizer(**settings)
 
 class PolicyRetriever:
     def __init__(self, policy_dir='policies'):
         self.policy_dir = policy_dir
         self.policies = {}
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+        self.vectorizer = create_vectorizer()
+        # Chunk index built by fit_vectorizer
+        self.chunks = []
+        self.chunk_policy_names = []
+        self.chunk_matrix = None
+        self.chunk_matrix_t = None
+        self.chunk_doc_ids = None
+        self.doc_offsets = None
         self.load_policies()
         self.fit_vectorizer()
         
@@ -22,67 +36,84 @@ class PolicyRetriever:
                     self.policies[policy_name] = content
     
     def fit_vectorizer(self):
-        """Fit the TF-IDF vectorizer on all policy documents."""
+        """Fit the TF-IDF vectorizer and precompute the chunk matrix.
+        
+        Chunks are stored contiguously per policy, so doc_offsets[i] is the first
+        row of policy i in chunk_matrix and per-policy reductions can use reduceat.
+        """
         self.vectorizer.fit(self.policies.values())
         
-    def split_into_chunks(self, text, chunk_size=200):
-        """Split text into chunks of approximately chunk_size words."""
-        words = text.split()
-        return [' '.join(words[i:i+chunk_size]) for i in range(0, len(words), chunk_size)]
+        chunks = []
+        policy_names = []
+        doc_ids = []
+        offsets = []
+        for policy_name, content in self.policies.items():
+            policy_chunks = self.split_into_chunks(content, policy_name)
+            if not policy_chunks:
+                continue
+            offsets.append(len(chunks))
+            doc_ids.extend([len(policy_names)] * len(policy_chunks))
+            policy_names.append(policy_name)
+            chunks.extend(policy_chunks)
+        
+        self.chunks = chunks
+        self.chunk_policy_names = policy_names
+        self.chunk_doc_ids = np.array(doc_ids, dtype=np.intp)
+        self.doc_offsets = np.array(offsets, dtype=np.intp)
+        # Rows are L2-normalized by TfidfVectorizer, so a dot product is the cosine similarity
+        self.chunk_matrix = self.vectorizer.transform(chunks).tocsr() if chunks else None
+        # Keep the (terms x chunks) transpose in CSR form so scoring does not convert per query
+        self.chunk_matrix_t = self.chunk_matrix.T.tocsr() if chunks else None
+        
+    def split_into_chunks(self, text, source=''):
+        """Split text into its markdown sections, each starting with its heading path."""
+        return [section.text for section in split_sections(text, source)]
     
-    def get_relevant_policies(self, query, top_n=3):
+    def expand_query(self, query):
+        """Add common policy keywords to a query to improve matching."""
+        return expand_query(query)
+    
+    def best_chunks(self, scores):
         """
-        Retrieve the most relevant policy sections based on the query.
-        Returns a list of (policy_name, relevant_section) tuples.
+        Grouped argmax over policies.
+        Given a (n_queries, n_chunks) score matrix, returns the best chunk index and
+        its score for every (query, policy) pair, ties resolved to the earliest chunk.
         """
-        # Transform the query
-        query_vector = self.vectorizer.transform([query])
-        
-        # Add common policy keywords to improve matching
-        expanded_query = query.lower()
-        if 'baggage' in expanded_query or 'luggage' in expanded_query or 'bag' in expanded_query:
-            expanded_query += ' baggage allowance checked carry-on'
-        elif 'cancel' in expanded_query or 'refund' in expanded_query:
-            expanded_query += ' cancellation policy refund ticket'
-        elif 'change' in expanded_query or 'rebook' in expanded_query or 'reschedule' in expanded_query:
-            expanded_query += ' rebooking change flight reschedule'
-        elif 'assistance' in expanded_query or 'wheelchair' in expanded_query or 'disability' in expanded_query:
-            expanded_query += ' special assistance disability wheelchair'
-        elif 'miles' in expanded_query or 'points' in expanded_query or 'status' in expanded_query or 'tier' in expanded_query:
-            expanded_query += ' loyalty program miles points'
+        best_scores = np.maximum.reduceat(scores, self.doc_offsets, axis=1)
+        is_best = scores == best_scores[:, self.chunk_doc_ids]
+        positions = np.where(is_best, np.arange(scores.shape[1]), scores.shape[1])
+        best_idx = np.minimum.reduceat(positions, self.doc_offsets, axis=1)
+        return best_idx, best_scores
+    
+    def get_relevant_policies_many(self, queries, top_n=3):
+        """
+        Retrieve the most relevant policy sections for several queries at once.
+        Scores all queries against all chunks with a single sparse matrix product.
+        Returns one list of (policy_name, relevant_section) tuples per query.
+        """
+        if self.chunk_matrix is None or not queries:
+            return [[] for _ in queries]
         
-        # Use the expanded query if it's different from the original
-        if expanded_query != query.lower():
-            query_vector = self.vectorizer.transform([expanded_query])
-            print(f"Expanded query: {expanded_query}")
+        query_matrix = self.vectorizer.transform([self.expand_query(q) for q in queries])
+        scores = (query_matrix @ self.chunk_matrix_t).toarray()
+        best_idx, best_scores = self.best_chunks(scores)
         
         results = []
-        
-        # For each policy document
-        for policy_name, content in self.policies.items():
-            # Split into manageable chunks
-            chunks = self.split_into_chunks(content)
-            
-            # Transform chunks
-            chunk_vectors = self.vectorizer.transform(chunks)
-            
-            # Calculate similarity
-            similarities = cosine_similarity(query_vector, chunk_vectors).flatten()
-            
-            # Get the most relevant chunk
-            if len(chunks) > 0:
-                best_chunk_idx = similarities.argmax()
-                best_chunk = chunks[best_chunk_idx]
-                similarity_score = similarities[best_chunk_idx]
-                
-                # Lower the threshold to include more potentially relevant content
-                if similarity_score > 0.05:
-                    results.append((policy_name, best_chunk, similarity_score))
-                    print(f"Match found in {policy_name}: score {similarity_score}")
-        
-        # Sort by relevance and return top_n
-        results.sort(key=lambda x: x[2], reverse=True)
-        return [(name, chunk) for name, chunk, _ in results[:top_n]]
+        for row_idx, row_scores in zip(best_idx, best_scores):
+            ranked = np.argsort(-row_scores, kind='stable')[:top_n]
+            # Lower the threshold to include more potentially relevant content
+            results.append([
+                (self.chunk_policy_names[doc], self.chunks[row_idx[doc]])
+                for doc in ranked if row_scores[doc] > 0.05
+            ])
+        return results
+    
+    def get_relevant_policies(self, query, top_n=3):
+        """
+        Retrieve the most relevant policy sections based on the query.
+        Returns a list of (policy_name, relevant_section) tuples.
+        """
+        return self.get_relevant_policies_many([query], top_n=top_n)[0]
     
     def format_for_prompt(self, query):
         """Format relevant policy information for inclusion in an AI prompt."""
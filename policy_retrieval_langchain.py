@@ -1,12 +1,57 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import MarkdownTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from data_store import LOYALTY_TIERS
+from embedding_cache import QueryEmbeddingCache, normalize_query
+from embedding_client import EmbeddingClient, create_embedding_store
+from hybrid_retrieval import effective_date, filter_key, fuse_rankings, matches_filter, section_tiers, tier_value
+from policy_sections import default_max_tokens, split_sections
+from vector_index import IndexSpec, build_index, recall_report
+import faiss
+import hashlib
+import json
+import logging
+import numpy as np
 import os
+import shutil
 import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout or the chunk metadata of the cached index changes
+INDEX_CACHE_VERSION = 7
+
+class BackendEmbeddings(Embeddings):
+    """
+    LangChain embeddings interface over a chat/embedding backend (see llm_backend.py).
+    Documents go through an EmbeddingClient (see embedding_client.py), which dedupes,
+    batches and retries them and keeps their vectors in the embedding store.
+    """
+    
+    def __init__(self, backend, client=None):
+        self.backend = backend
+        # Read by embedding_model_name() for the index cache key
+        self.model = backend.embedding_model
+        self.client = client or EmbeddingClient(backend, store=create_embedding_store())
+    
+    def embed_documents(self, texts):
+        return self.client.embed_documents(texts)
+    
+    def embed_queries(self, texts):
+        """Batch-embed user queries; they are not written to the embedding store."""
+        return self.client.embed_documents(texts, persist=False)
+    
+    def embed_query(self, text):
+        return self.backend.embed_query(text)
+    
+    async def aembed_query(self, text):
+        return await self.backend.aembed_query(text)
 
 class PolicyRetrieverLangChain:
-    def __init__(self, policy_dir=None):
+    def __init__(self, policy_dir=None, embeddings=None, cache_dir=None, query_cache=None, index_spec=None):
         if policy_dir is None:
             if not os.path.exists('policies') or not os.access('policies', os.W_OK):
                 temp_dir = tempfile.gettempdir()
@@ -21,9 +66,41 @@ class PolicyRetrieverLangChain:
                 policy_dir = 'policies'
         
         self.policy_dir = policy_dir
-        self.embeddings = OpenAIEmbeddings()
-        self.text_splitter = MarkdownTextSplitter(chunk_size=500, chunk_overlap=50)
+        if embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            embeddings = OpenAIEmbeddings()
+        self.embeddings = embeddings
+        # One chunk per markdown section; longer sections are split into parts (see policy_sections.py)
+        self.section_max_tokens = default_max_tokens()
+        # Flat (exact) by default; large corpora can use HNSW or IVF-PQ (see vector_index.py)
+        self.index_spec = index_spec or IndexSpec.from_env()
+        
+        # Built indexes are cached on disk so cold starts can skip re-embedding the corpus
+        if cache_dir is None:
+            cache_dir = os.getenv("POLICY_INDEX_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'policy_index_cache'))
+        self.cache_dir = cache_dir
+        self.index_key = None
         self.vector_store = None
+        
+        # Repeated user questions reuse their query embedding instead of calling the API again
+        if query_cache is None:
+            threshold = os.getenv("QUERY_CACHE_NEAR_DUPLICATE_THRESHOLD")
+            query_cache = QueryEmbeddingCache(
+                max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024")),
+                ttl_seconds=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600")),
+                near_duplicate_threshold=float(threshold) if threshold else None,
+            )
+        self.query_cache = query_cache
+        # Serializes refreshes; queries never take this lock
+        self._refresh_lock = threading.Lock()
+        # Queries check the policy files for edits at most this often (seconds); 0 leaves
+        # re-indexing to explicit refresh() calls, e.g. the prefork reload hook
+        self.refresh_interval = float(os.getenv("POLICY_REFRESH_INTERVAL_SECONDS", "30"))
+        self._policy_signature = None
+        self._next_refresh_check = time.monotonic() + self.refresh_interval
+        # Background re-index started by refresh_if_changed, if one is running
+        self._refresh_thread = None
+        self._refresh_thread_lock = threading.Lock()
         self.initialize_vector_store()
         
     def create_sample_policies(self, policy_dir):
@@ -36,6 +113,18 @@ class PolicyRetrieverLangChain:
         with open(os.path.join(policy_dir, 'cancellation_policy.txt'), 'w') as f:
             f.write(cancellation_policy)
         
+    def policy_signature(self):
+        """Name, size and modification time of every policy file, or None if the directory cannot be read."""
+        signature = []
+        try:
+            for entry in os.scandir(self.policy_dir):
+                if entry.name.endswith('.txt'):
+                    stat = entry.stat()
+                    signature.append((entry.name, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            return None
+        return tuple(sorted(signature))
+    
     def load_policies(self):
         """Load all policy documents from the policy directory."""
         documents = []
@@ -47,33 +136,348 @@ class PolicyRetrieverLangChain:
                     policy_name = filename.replace('_', ' ').replace('.txt', '')
                     doc = Document(
                         page_content=content,
-                        metadata={"source": filename, "policy_name": policy_name}
+                        metadata={"source": filename, "policy_name": policy_name,
+                                  "effective_date": effective_date(content)}
                     )
                     documents.append(doc)
         return documents
     
+    def split_policies(self, documents):
+        """Split documents into section chunks, each tagged with its section id, heading path and a content-hash chunk id.
+        
+        Sections repeated within a policy file collapse into one entry.
+        """
+        splits = []
+        seen = set()
+        for doc in documents:
+            for section in split_sections(doc.page_content, doc.metadata["source"], self.section_max_tokens):
+                if section.chunk_id in seen:
+                    continue
+                seen.add(section.chunk_id)
+                metadata = {**doc.metadata, **section.metadata(), "loyalty_tiers": section_tiers(section.body)}
+                splits.append(Document(page_content=section.text, metadata=metadata))
+        return splits
+    
+    def embedding_model_name(self):
+        """Return the name of the embedding model, used as part of the index cache key."""
+        return getattr(self.embeddings, "model", None) or type(self.embeddings).__name__
+    
+    def compute_index_key(self, documents):
+        """Hash the policy contents, chunker settings, embedding model and index type into a cache key."""
+        hasher = hashlib.sha256()
+        settings = {
+            "version": INDEX_CACHE_VERSION,
+            "chunker": "sections",
+            "section_max_tokens": self.section_max_tokens,
+            "embedding_model": self.embedding_model_name(),
+            "vector_index": self.index_spec.cache_settings(),
+            "loyalty_tiers": LOYALTY_TIERS,
+        }
+        hasher.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        for doc in sorted(documents, key=lambda d: d.metadata["source"]):
+            hasher.update(doc.metadata["source"].encode('utf-8'))
+            hasher.update(b'\0')
+            hasher.update(doc.page_content.encode('utf-8'))
+            hasher.update(b'\0')
+        return hasher.hexdigest()
+    
+    def _index_cache_path(self, index_key):
+        return os.path.join(self.cache_dir, index_key)
+    
+    def load_cached_index(self, index_key):
+        """Load a previously built index from the cache, or return None if there is none."""
+        path = self._index_cache_path(index_key)
+        index_file = os.path.join(path, 'index.faiss')
+        chunks_file = os.path.join(path, 'chunks.json')
+        if not (os.path.exists(index_file) and os.path.exists(chunks_file)):
+            return None
+        
+        try:
+            # Memory-map the vectors so that instances on the same host share pages
+            try:
+                index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                index = faiss.read_index(index_file)
+            
+            with open(chunks_file, 'r') as f:
+                chunks = json.load(f)
+        except (OSError, RuntimeError, ValueError) as e:
+            logger.warning("Ignoring unreadable index cache at %s: %s", path, e)
+            return None
+        
+        if index.ntotal != len(chunks):
+            logger.warning("Ignoring inconsistent index cache at %s", path)
+            return None
+        
+        docstore = InMemoryDocstore({
+            chunk["id"]: Document(page_content=chunk["page_content"], metadata=chunk["metadata"])
+            for chunk in chunks
+        })
+        index_to_docstore_id = {i: chunk["id"] for i, chunk in enumerate(chunks)}
+        # nprobe/efSearch are not part of the cache key, so the current settings apply
+        return FAISS(self.embeddings, self.index_spec.configure(index), docstore, index_to_docstore_id)
+    
+    def build_vector_store(self, splits, vectors=None):
+        """Build a FAISS store over splits with the configured index type, training it if needed."""
+        if vectors is None:
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in splits])
+        index = build_index(np.asarray(vectors, dtype='float32'), self.index_spec)
+        ids = [doc.metadata["chunk_id"] for doc in splits]
+        return FAISS(self.embeddings, index, InMemoryDocstore(dict(zip(ids, splits))), dict(enumerate(ids)))
+    
+    def save_index(self, index_key, vector_store):
+        """Write the index and its chunk metadata to the cache directory."""
+        path = self._index_cache_path(index_key)
+        chunks = []
+        for i in range(vector_store.index.ntotal):
+            doc_id = vector_store.index_to_docstore_id[i]
+            doc = vector_store.docstore.search(doc_id)
+            chunks.append({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata})
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write into a scratch directory first so readers never see a half-written index
+            tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+            faiss.write_index(vector_store.index, os.path.join(tmp_path, 'index.faiss'))
+            with open(os.path.join(tmp_path, 'chunks.json'), 'w') as f:
+                json.dump(chunks, f)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another process cached the same key first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except OSError as e:
+            logger.warning("Could not write index cache: %s", e)
+    
     def initialize_vector_store(self):
-        """Initialize the vector store with policy documents."""
+        """Initialize the vector store with policy documents, reusing the on-disk cache when possible."""
+        start = time.perf_counter()
+        self._policy_signature = self.policy_signature()
         documents = self.load_policies()
         if not documents:
-            print("Warning: No policy documents found.")
+            logger.warning("No policy documents found.")
+            return
+        
+        self.index_key = self.compute_index_key(documents)
+        vector_store = self.load_cached_index(self.index_key)
+        if vector_store is not None:
+            self.vector_store = vector_store
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            logger.info("Vector store loaded from cache with %d document chunks in %.1f ms", vector_store.index.ntotal, elapsed_ms)
             return
             
         # Split documents into chunks
-        splits = self.text_splitter.split_documents(documents)
+        splits = self.split_policies(documents)
         
         # Create vector store
-        self.vector_store = FAISS.from_documents(splits, self.embeddings)
-        print(f"Vector store initialized with {len(splits)} document chunks")
+        self.vector_store = self.build_vector_store(splits)
+        self.save_index(self.index_key, self.vector_store)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info("Vector store initialized with %d document chunks in %.1f ms", len(splits), elapsed_ms)
     
-    def get_relevant_policies(self, query, top_k=3):
-        """Retrieve the most relevant policy sections based on the query."""
-        if not self.vector_store:
-            print("Vector store not initialized.")
+    def refresh(self):
+        """Re-index the policy directory, embedding only chunks that changed.
+        
+        Chunks are diffed by content hash against the live index: removed chunks
+        are deleted, new or edited chunks are embedded in batches, and the updated
+        store is swapped in atomically once complete. Trained indexes (HNSW, IVF)
+        are rebuilt instead, with unchanged chunks read from the embedding store. Queries already running keep
+        using the previous store. Returns counts of added, removed and unchanged chunks.
+        """
+        with self._refresh_lock:
+            start = time.perf_counter()
+            # Taken before reading, so an edit made while refreshing is picked up by the next check
+            signature = self.policy_signature()
+            documents = self.load_policies()
+            index_key = self.compute_index_key(documents) if documents else None
+            if index_key is not None and index_key == self.index_key:
+                self._policy_signature = signature
+                current = self.vector_store.index.ntotal if self.vector_store else 0
+                return {"added": 0, "removed": 0, "unchanged": current}
+            
+            splits = self.split_policies(documents)
+            new_chunks = {doc.metadata["chunk_id"]: doc for doc in splits}
+            
+            old_store = self.vector_store
+            old_ids = set(old_store.index_to_docstore_id.values()) if old_store else set()
+            removed_ids = [chunk_id for chunk_id in old_ids if chunk_id not in new_chunks]
+            added = [doc for chunk_id, doc in new_chunks.items() if chunk_id not in old_ids]
+            
+            if not new_chunks:
+                self.vector_store = None
+                self.index_key = index_key
+                self._policy_signature = signature
+                return {"added": 0, "removed": len(removed_ids), "unchanged": 0}
+            
+            if not self.index_spec.exact:
+                # Retrain on the whole corpus; only the added chunks reach the embedding API
+                new_store = self.build_vector_store(list(new_chunks.values()))
+            elif old_store is None:
+                new_store = None
+            else:
+                # Work on a private copy; the live index may be a read-only mmap
+                new_store = FAISS(
+                    self.embeddings,
+                    faiss.clone_index(old_store.index),
+                    InMemoryDocstore(dict(old_store.docstore._dict)),
+                    dict(old_store.index_to_docstore_id),
+                )
+                if removed_ids:
+                    new_store.delete(removed_ids)
+            
+            if added and self.index_spec.exact:
+                # Embedded before the store is touched, so a failure leaves the live index as it was
+                texts = [doc.page_content for doc in added]
+                text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
+                metadatas = [doc.metadata for doc in added]
+                ids = [doc.metadata["chunk_id"] for doc in added]
+                if new_store is None:
+                    new_store = self.build_vector_store(added, [vector for _, vector in text_embeddings])
+                else:
+                    new_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            
+            self.save_index(index_key, new_store)
+            # Single attribute assignment, so readers see either the old or the new store
+            self.vector_store = new_store
+            self.index_key = index_key
+            self._policy_signature = signature
+            
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            unchanged = len(new_chunks) - len(added)
+            logger.info("Vector store refreshed: %d added, %d removed, %d unchanged in %.1f ms", len(added), len(removed_ids), unchanged, elapsed_ms)
+            return {"added": len(added), "removed": len(removed_ids), "unchanged": unchanged}
+    
+    def policies_changed(self):
+        """True when refresh_interval has passed since the last check and a policy file was added, removed or edited."""
+        if not self.refresh_interval:
+            return False
+        now = time.monotonic()
+        if now < self._next_refresh_check:
+            return False
+        self._next_refresh_check = now + self.refresh_interval
+        return self.policy_signature() != self._policy_signature
+    
+    def _refresh_logged(self):
+        try:
+            return self.refresh()
+        except Exception as e:
+            # The live index is untouched; the next check retries
+            logger.error("Refreshing the policy index failed, serving the previous one: %s", e)
+            return None
+    
+    def refresh_if_changed(self):
+        """Called by queries: when policies_changed(), start refresh() on a background thread.
+        
+        The query is answered from the current index, and the refreshed one is swapped
+        in when it is complete. Returns the refresh thread (the one already running if
+        there is one), or None when nothing changed.
+        """
+        if not self.policies_changed():
+            return None
+        with self._refresh_thread_lock:
+            thread = self._refresh_thread
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._refresh_logged, name="policy-refresh", daemon=True)
+                thread.start()
+                self._refresh_thread = thread
+        return thread
+    
+    async def arefresh_if_changed(self):
+        """Async variant of refresh_if_changed; starting the background refresh does not block the loop."""
+        return self.refresh_if_changed()
+    
+    def wait_for_refresh(self, timeout=None):
+        """Wait for a background refresh to finish; True if none is running afterwards."""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+        return thread is None or not thread.is_alive()
+    
+    def query_embedding(self, query):
+        """Embedding of a user query, from the query cache when possible."""
+        return self.query_cache.get_or_compute(query, self.embeddings.embed_query)
+    
+    async def aquery_embedding(self, query):
+        query_embedding = self.query_cache.get(query)
+        if query_embedding is None:
+            query_embedding = await self.embeddings.aembed_query(query)
+            self.query_cache.put(query, query_embedding)
+        return query_embedding
+    
+    def get_relevant_policies(self, query, top_k=3, filters=None, prefer_tier=None):
+        """Retrieve the most relevant policy sections based on the query (filters and prefer_tier as in hybrid_retrieval.py)."""
+        self.refresh_if_changed()
+        vector_store = self.vector_store
+        if not vector_store:
+            logger.warning("Vector store not initialized.")
             return []
             
         # Retrieve relevant documents
-        docs = self.vector_store.similarity_search(query, k=top_k)
+        return self._search_by_vector(vector_store, self.query_embedding(query), top_k, filters, prefer_tier)
+    
+    async def aget_relevant_policies(self, query, top_k=3, filters=None, prefer_tier=None):
+        """Async variant of get_relevant_policies that awaits the query embedding."""
+        await self.arefresh_if_changed()
+        vector_store = self.vector_store
+        if not vector_store:
+            logger.warning("Vector store not initialized.")
+            return []
+        
+        return self._search_by_vector(vector_store, await self.aquery_embedding(query), top_k, filters, prefer_tier)
+    
+    def prefetch_query_embeddings(self, queries):
+        """Embed the uncached queries in batched calls and store them in the query cache.
+        
+        Used by batch replay so each row's retrieval hits the cache instead of
+        making its own embedding request. Returns the number of queries embedded.
+        """
+        missing = []
+        seen = set()
+        for query in queries:
+            key = normalize_query(query)
+            if key not in seen and self.query_cache.get(query) is None:
+                seen.add(key)
+                missing.append(query)
+        if missing:
+            # Queries stay out of the persistent embedding store when the embeddings support that
+            embed = getattr(self.embeddings, "embed_queries", self.embeddings.embed_documents)
+            for query, vector in zip(missing, embed(missing)):
+                self.query_cache.put(query, vector)
+        return len(missing)
+
+    def recall_report(self, k=10, queries=None, sweep=None):
+        """Recall@k of the live index against exact search over the same chunk vectors.
+
+        queries are question strings; by default a sample of the chunks is used.
+        Chunk vectors come from the embedding store, so this makes no API calls for
+        an indexed corpus. See vector_index.recall_report for the fields returned.
+        """
+        vector_store = self.vector_store
+        if not vector_store:
+            return None
+        docstore_ids = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+        texts = [vector_store.docstore.search(doc_id).page_content for doc_id in docstore_ids]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype='float32')
+        if queries is not None:
+            embed = getattr(self.embeddings, "embed_queries", self.embeddings.embed_documents)
+            queries = np.asarray(embed(list(queries)), dtype='float32')
+        return recall_report(vectors, self.index_spec, queries=queries, k=k, sweep=sweep, index=vector_store.index)
+
+    def _search_by_vector(self, vector_store, query_embedding, top_k, filters=None, prefer_tier=None):
+        key = filter_key(filters)
+        # Re-ranking for a preferred tier needs candidates beyond the top_k
+        k = top_k if tier_value(prefer_tier) is None else max(20, top_k * 10)
+        if key is None:
+            docs = vector_store.similarity_search_by_vector(query_embedding, k=k)
+        else:
+            # Without HybridPolicyRetriever's row sets, over-fetch and drop the chunks that do not match
+            docs = vector_store.similarity_search_by_vector(
+                query_embedding, k=k, fetch_k=max(20, k * 10),
+                filter=lambda metadata: matches_filter(metadata, key))
+        if k != top_k:
+            fused = fuse_rankings([list(range(len(docs)))], prefer_tier=prefer_tier,
+                                  tiers_of=lambda i: docs[i].metadata.get("loyalty_tiers", ()))
+            docs = [docs[i] for i, _ in fused[:top_k]]
         
         # Format results
         results = []
@@ -83,10 +487,16 @@ class PolicyRetrieverLangChain:
             
         return results
     
-    def format_for_prompt(self, query):
+    def format_for_prompt(self, query, filters=None, prefer_tier=None):
         """Format relevant policy information for inclusion in an AI prompt."""
-        relevant_policies = self.get_relevant_policies(query)
-        
+        return self.format_policies(self.get_relevant_policies(query, filters=filters, prefer_tier=prefer_tier))
+    
+    async def aformat_for_prompt(self, query, filters=None, prefer_tier=None):
+        """Async variant of format_for_prompt."""
+        return self.format_policies(await self.aget_relevant_policies(query, filters=filters, prefer_tier=prefer_tier))
+    
+    def format_policies(self, relevant_policies):
+        """Format (policy_name, section) pairs for inclusion in an AI prompt."""
         if not relevant_policies:
             return "No specific policy information found for this query."
         
@@ -95,4 +505,4 @@ class PolicyRetrieverLangChain:
         for policy_name, section in relevant_policies:
             formatted_text += f"From {policy_name.title()} Policy:\n{section}\n\n"
             
-        return formatted_text 
\ No newline at end of file
+        return formatted_text 
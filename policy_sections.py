@@ -0,0 +1,144 @@
+"""
+Structure-aware chunking of the markdown policy documents.
+
+split_sections(text, source) turns the ATX headings (#, ##, ...) that
+create_policies.py writes into one Section per heading with a body:
+  section_id    - hash of the source and heading path; stays the same when the section's text is edited
+  chunk_id      - hash of the source, heading path, part and text; changes whenever the text does
+  heading_path  - headings from the document title down, e.g.
+                  ("SkyWay Airlines Baggage Policy", "Checked Baggage Allowance")
+  text          - the heading path on one line, then the section body
+  tokens        - count_tokens(text)
+
+Retrieval returns these records as they are, so a hit is a whole section. Only
+a section longer than max_tokens (POLICY_SECTION_MAX_TOKENS, default 800) is
+split, between paragraphs and list items, into parts numbered part/parts that
+each repeat the heading path. Parts do not overlap, and a section whose body
+repeats an earlier one in the same document is dropped.
+"""
+import hashlib
+import os
+import re
+
+from history_budget import count_tokens
+
+HEADING_PATH_SEPARATOR = " > "
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+class Section:
+    """One policy section, or one part of a section too long to embed whole."""
+    __slots__ = ("source", "heading_path", "body", "part", "parts", "section_id", "chunk_id", "text", "tokens")
+
+    def __init__(self, source, heading_path, body, part=1, parts=1, occurrence=1):
+        self.source = source
+        self.heading_path = tuple(heading_path)
+        self.body = body
+        self.part = part
+        self.parts = parts
+        path = HEADING_PATH_SEPARATOR.join(self.heading_path)
+        # A heading path repeated within a document is numbered by occurrence
+        key = f"{source}\0{path}" if occurrence == 1 else f"{source}\0{path}\0{occurrence}"
+        self.section_id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        self.text = f"{path}\n{body}" if path else body
+        self.chunk_id = hashlib.sha256(f"{self.section_id}\0{part}\0{self.text}".encode("utf-8")).hexdigest()
+        self.tokens = count_tokens(self.text)
+
+    def metadata(self):
+        """Document metadata for the vector store."""
+        return {
+            "source": self.source,
+            "section_id": self.section_id,
+            "chunk_id": self.chunk_id,
+            "heading_path": list(self.heading_path),
+            "part": self.part,
+            "parts": self.parts,
+            "tokens": self.tokens,
+        }
+
+
+def default_max_tokens():
+    return int(os.getenv("POLICY_SECTION_MAX_TOKENS", "800"))
+
+
+def _blocks(body):
+    """Paragraphs and list items: the units a long section is split between."""
+    blocks = []
+    for line in body.split("\n"):
+        starts_item = re.match(r"\s*([-*+]|\d+[.)])\s", line)
+        if not line.strip():
+            blocks.append([])
+        elif starts_item or not blocks or not blocks[-1]:
+            blocks.append([line])
+        else:
+            blocks[-1].append(line)
+    return ["\n".join(block) for block in blocks if block]
+
+
+def _split_body(body, budget):
+    """Pack the body's blocks, in order, into parts of at most budget tokens (one block may exceed it)."""
+    parts, current, current_tokens = [], [], 0
+    for block in _blocks(body):
+        tokens = count_tokens(block)
+        if current and current_tokens + tokens > budget:
+            parts.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+def split_sections(text, source, max_tokens=None):
+    """Parse a markdown policy document into Section records, in document order."""
+    max_tokens = max_tokens or default_max_tokens()
+    raw = []
+    path = []
+    lines = []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if body:
+            raw.append((tuple(title for _, title in path), body))
+        lines.clear()
+
+    for line in text.split("\n"):
+        match = _HEADING_RE.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, match.group(2)))
+        else:
+            lines.append(line)
+    flush()
+
+    sections = []
+    seen_bodies = set()
+    occurrences = {}
+    for heading_path, body in raw:
+        normalized = " ".join(body.split())
+        if normalized in seen_bodies:
+            continue
+        seen_bodies.add(normalized)
+        occurrence = occurrences[heading_path] = occurrences.get(heading_path, 0) + 1
+        path = HEADING_PATH_SEPARATOR.join(heading_path)
+        budget = max(1, max_tokens - count_tokens(path))
+        bodies = _split_body(body, budget) if count_tokens(body) > budget else [body]
+        sections.extend(
+            Section(source, heading_path, part_body, part, len(bodies), occurrence)
+            for part, part_body in enumerate(bodies, start=1)
+        )
+    return sections
+
+
+def index_sections(policies, max_tokens=None):
+    """{chunk_id: Section} over a {policy_name: text} mapping, with each policy name as the source."""
+    sections = {}
+    for policy_name, text in policies.items():
+        for section in split_sections(text, policy_name, max_tokens):
+            sections[section.chunk_id] = section
+    return sections
+
@@ -0,0 +1,85 @@
+"""
+Preforked serving: shared state is built once in the gunicorn master and
+inherited by every worker.
+
+With gunicorn.conf.py (preload_app), the master imports app.py and runs the
+on_master_ready() hooks, which finish building the policy retriever. The
+retriever holds the FAISS index, chunk texts and BM25 arrays, and the
+customer/flight tables are already loaded by the import. prepare_master() then
+moves every object into the garbage collector's permanent generation
+(gc.freeze), so collections in the workers do not write to those pages. Forked
+workers share them copy-on-write, and memory and startup embedding cost no
+longer grow with the worker count. The vectors and BM25 impacts live outside
+Python object headers (faiss and numpy buffers), so reference counting does not
+dirty them either.
+
+Threads do not survive fork(). The master stops its background threads before
+forking, and each worker starts its own in the on_worker_start() hooks.
+Connection-holding clients (the OpenAI SDK, the SQLite embedding store) check
+the pid and reconnect in the child.
+
+Reload: `kill -HUP <master pid>`. gunicorn calls reload_master(), which runs
+the on_reload() hooks in the master. The policy retriever's refresh() re-indexes
+the current policy files and embeds only the chunks that changed. gunicorn then
+forks a fresh set of workers and gracefully stops the old ones.
+Every worker serves exactly one generation, and each request is answered by one
+generation from start to finish. If a reload hook fails, the master keeps the
+previous generation and the new workers inherit it.
+"""
+import gc
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_master_ready_hooks = []
+_worker_start_hooks = []
+_reload_hooks = []
+
+
+def on_master_ready(hook):
+    """Run hook in the master before workers are forked, e.g. to finish building shared state."""
+    _master_ready_hooks.append(hook)
+    return hook
+
+
+def on_worker_start(hook):
+    """Run hook in each worker right after it is forked, e.g. to restart a background thread."""
+    _worker_start_hooks.append(hook)
+    return hook
+
+
+def on_reload(hook):
+    """Run hook in the master on reload (SIGHUP), before the new workers are forked."""
+    _reload_hooks.append(hook)
+    return hook
+
+
+def prepare_master():
+    start = time.perf_counter()
+    for hook in _master_ready_hooks:
+        hook()
+    gc.collect()
+    # Objects alive now are never scanned by the collector again, so forked workers keep sharing their pages
+    gc.freeze()
+    logger.info("Shared state ready for forking in %.1f ms (%d objects frozen)",
+                (time.perf_counter() - start) * 1000, gc.get_freeze_count())
+
+
+def start_worker():
+    for hook in _worker_start_hooks:
+        hook()
+
+
+def reload_master():
+    start = time.perf_counter()
+    # Let the previous generation be collected once nothing refers to it
+    gc.unfreeze()
+    for hook in _reload_hooks:
+        try:
+            hook()
+        except Exception:
+            logger.exception("Reload hook %s failed; keeping the previous generation",
+                             getattr(hook, "__name__", hook))
+    prepare_master()
+    logger.info("Reloaded shared state in %.1f ms", (time.perf_counter() - start) * 1000)
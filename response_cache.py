@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from data_store import LOYALTY_TIERS
+from embedding_cache import normalize_query
+
+# Questions about the customer's own trip depend on live data, so they are never cached
+PERSONAL_QUERY_RE = re.compile(
+    r"\b(status|gate|delay(ed|s)?|depart\w*|arriv\w*|seat|booking reference|confirmation"
+    r"|my (flight|booking|reservation|trip|ticket|itinerary))\b",
+    re.IGNORECASE,
+)
+LOYALTY_TIER_RE = re.compile(r"\b(" + "|".join(LOYALTY_TIERS) + r")\b|\bmembers?\b", re.IGNORECASE)
+
+
+def is_faq_question(user_message):
+    """True for general policy questions whose answer does not depend on the customer's booking."""
+    return bool(user_message) and not PERSONAL_QUERY_RE.search(user_message)
+
+
+def mentions_loyalty_tiers(policy_info):
+    """True when the retrieved policy text differs by loyalty tier, so answers must be keyed on it."""
+    return bool(policy_info) and bool(LOYALTY_TIER_RE.search(policy_info))
+
+
+def policy_files_signature(policy_dir):
+    """Names, sizes and modification times of the policy files; changes whenever a file does."""
+    try:
+        entries = sorted(os.scandir(policy_dir), key=lambda entry: entry.name)
+    except OSError:
+        return None
+    return tuple(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in entries if entry.name.endswith('.txt')
+    )
+
+
+class ResponseCache:
+    """
+    Bounded LRU/TTL cache of chat results for FAQ-style questions.
+
+    Keys combine the normalized question, a hash of the retrieved policy text
+    (policy names and chunk contents, so an edited chunk gets a new key) and the
+    loyalty tier when the answer depends on it. version() is polled at most every
+    version_check_seconds; when its value changes, for example because a policy file
+    was edited, every entry is dropped.
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=3600, version=None, version_check_seconds=1.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+        self.version_check_seconds = version_check_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_version = version() if version else None
+        self._version_checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(user_message, policy_info, loyalty_tier=None):
+        hasher = hashlib.sha256()
+        for part in (normalize_query(user_message), policy_info or "", (loyalty_tier or "").lower()):
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b'\0')
+        return hasher.hexdigest()
+
+    def _check_version(self, now):
+        if self.version is None or now - self._version_checked_at < self.version_check_seconds:
+            return
+        self._version_checked_at = now
+        version = self.version()
+        if version != self._current_version:
+            self._current_version = version
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        """Return a copy of the cached result for key, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(result)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            self._entries[key] = (dict(result), now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+            }
+
+
+def create_response_cache(policy_dir):
+    """Build the response cache if RESPONSE_CACHE is enabled, otherwise return None."""
+    if os.getenv("RESPONSE_CACHE", "").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048")),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+        version=lambda: policy_files_signature(policy_dir),
+        version_check_seconds=float(os.getenv("RESPONSE_CACHE_VERSION_CHECK_SECONDS", "1")),
+    )
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Messages kept per conversation once they have been folded into the summary
+MAX_SESSION_MESSAGES = 50
+# Hard cap on messages kept per conversation, summarized or not
+MAX_UNSUMMARIZED_MESSAGES = 200
+# Retrieval results remembered per conversation
+MAX_CACHED_RETRIEVALS = 20
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text):
+    return ' '.join(_WORD_RE.findall(text.lower()))
+
+
+def _marker(count, message):
+    digest = hashlib.sha256(f"{message['role']}\0{message['content']}".encode('utf-8')).hexdigest()[:16]
+    return f"{count}-{digest}"
+
+
+def clean_history(messages):
+    """The well-formed user and assistant messages of a client-supplied history."""
+    if not isinstance(messages, list):
+        return []
+    return [
+        {"role": message["role"], "content": message["content"]}
+        for message in messages
+        if isinstance(message, dict) and message.get("role") in ("user", "assistant")
+        and isinstance(message.get("content"), str)
+    ]
+
+
+class ConversationSession:
+    """
+    Server-side state for one conversation: the message history, the rolling
+    summary of older turns, the assembled customer context block and the policy
+    retrievals already made. The first summarized_count messages of history are
+    covered by summary (see history_budget.py). Retrievals are only reused while
+    the policy index they came from (retrievals_key) is still the one served.
+
+    message_count counts every message of the conversation, including the ones
+    dropped from history once summarized. Each reply carries history_marker(),
+    and the client sends it back with the next message instead of its history.
+    A marker that does not match means the session is missing or stale, and the
+    client is asked for its full history (sync_history).
+    """
+    __slots__ = ("conversation_id", "customer_id", "history", "summary", "summarized_count", "message_count",
+                 "customer_context", "customer_fingerprint", "retrievals", "retrievals_key", "updated_at")
+
+    def __init__(self, conversation_id, customer_id=None, history=None, summary=None, summarized_count=0,
+                 message_count=None, customer_context=None, customer_fingerprint=None, retrievals=None,
+                 retrievals_key=None, updated_at=None):
+        self.conversation_id = conversation_id
+        self.customer_id = customer_id
+        self.history = history or []
+        self.summary = summary
+        self.summarized_count = summarized_count
+        self.message_count = len(self.history) if message_count is None else message_count
+        self.customer_context = customer_context
+        self.customer_fingerprint = customer_fingerprint
+        self.retrievals = retrievals or {}
+        self.retrievals_key = retrievals_key
+        self.updated_at = updated_at or time.time()
+
+    def get_customer_context(self, customer_details, build_context):
+        """
+        Return the cached customer context block, rebuilding it only when the
+        customer details (including live flight status) have changed.
+        """
+        fingerprint = hashlib.sha256(
+            json.dumps(customer_details, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        if fingerprint != self.customer_fingerprint:
+            self.customer_context = build_context(customer_details) if customer_details else None
+            self.customer_fingerprint = fingerprint
+        return self.customer_context
+
+    def _retrievals_for(self, index_key):
+        """The cached retrievals, emptied first if they came from a different policy index."""
+        if index_key != self.retrievals_key:
+            self.retrievals = {}
+            self.retrievals_key = index_key
+        return self.retrievals
+
+    def lookup_policy_info(self, user_message, index_key=None):
+        """Return the policy information retrieved earlier for this message from index index_key, or None."""
+        return self._retrievals_for(index_key).get(_normalize(user_message))
+
+    def store_policy_info(self, user_message, policy_info, index_key=None):
+        retrievals = self._retrievals_for(index_key)
+        retrievals[_normalize(user_message)] = policy_info
+        while len(retrievals) > MAX_CACHED_RETRIEVALS:
+            retrievals.pop(next(iter(retrievals)))
+
+    def get_policy_info(self, user_message, retrieve, index_key=None):
+        """Return the policy information for a message, reusing earlier retrievals in this conversation."""
+        policy_info = self.lookup_policy_info(user_message, index_key)
+        if policy_info is None:
+            policy_info = retrieve(user_message)
+            self.store_policy_info(user_message, policy_info, index_key)
+        return policy_info
+
+    def history_marker(self):
+        """Identifies the conversation's latest message; None while it has none."""
+        return _marker(self.message_count, self.history[-1]) if self.history else None
+
+    def sync_history(self, client_history):
+        """
+        Adopt the client's full history when it differs from this session's: the
+        session is new, expired or evicted, another instance answered the last turn,
+        or the client never received the last reply. The rolling summary is kept if
+        the client's copy still holds the messages it covers at the same positions.
+        Returns True if the client's copy was taken.
+        """
+        client_history = clean_history(client_history)
+        if not client_history or _marker(len(client_history), client_history[-1]) == self.history_marker():
+            return False
+        # Position of history[0] in the conversation; earlier messages were dropped once summarized
+        start = self.message_count - len(self.history)
+        covered = start + self.summarized_count
+        if (self.summary is not None and len(client_history) > start
+                and client_history[start:covered] == self.history[:self.summarized_count]):
+            history = client_history[start:]
+        else:
+            history, self.summary, self.summarized_count = client_history, None, 0
+        excess = len(history) - MAX_UNSUMMARIZED_MESSAGES
+        if excess > 0:
+            del history[:excess]
+            self.summarized_count = max(0, self.summarized_count - excess)
+        self.history = history
+        self.message_count = len(client_history)
+        return True
+
+    def unsummarized_history(self):
+        """The messages not yet folded into the summary."""
+        return self.history[self.summarized_count:]
+
+    def fold_history(self, count, summary):
+        """Mark the next count unsummarized messages as covered by summary."""
+        self.summarized_count = min(len(self.history), self.summarized_count + count)
+        self.summary = summary
+
+    def record_turn(self, user_message, ai_response):
+        self.history.append({"role": "user", "content": user_message})
+        self.history.append({"role": "assistant", "content": ai_response})
+        self.message_count += 2
+        # Only drop messages the summary already covers, unless the hard cap is hit
+        excess = len(self.history) - MAX_SESSION_MESSAGES
+        if excess > 0:
+            drop = max(min(excess, self.summarized_count), len(self.history) - MAX_UNSUMMARIZED_MESSAGES)
+            del self.history[:drop]
+            self.summarized_count = max(0, self.summarized_count - drop)
+        self.updated_at = time.time()
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class InMemorySessionStore:
+    """Process-local session store with LRU eviction and an idle TTL."""
+
+    def __init__(self, max_sessions=10000, ttl_seconds=3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, conversation_id):
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl_seconds:
+                del self._sessions[conversation_id]
+                return None
+            self._sessions.move_to_end(conversation_id)
+            return session
+
+    def save(self, session):
+        with self._lock:
+            self._sessions[session.conversation_id] = session
+            self._sessions.move_to_end(session.conversation_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def load_or_create(self, conversation_id, customer_id=None):
+        return self.load(conversation_id) or ConversationSession(conversation_id, customer_id)
+
+
+class DiskSessionStore(InMemorySessionStore):
+    """
+    Session store that writes each session to a JSON file so conversations
+    survive restarts and can be shared by workers on the same host.
+    Recently used sessions are also kept in memory.
+    """
+
+    def __init__(self, directory, max_sessions=10000, ttl_seconds=3600):
+        super().__init__(max_sessions, ttl_seconds)
+        self.directory = directory
+        # conversation_id -> mtime of the file version held in memory
+        self._file_mtimes = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, conversation_id):
+        return os.path.join(self.directory, hashlib.sha256(conversation_id.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, conversation_id):
+        path = self._path(conversation_id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return super().load(conversation_id)
+        session = super().load(conversation_id)
+        # Another worker may have written a newer version
+        if session is not None and self._file_mtimes.get(conversation_id) == mtime:
+            return session
+        try:
+            with open(path, 'r') as f:
+                session = ConversationSession.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Ignoring unreadable session file %s: %s", path, e)
+            return None
+        if time.time() - session.updated_at > self.ttl_seconds:
+            self.delete(conversation_id)
+            return None
+        super().save(session)
+        self._file_mtimes[conversation_id] = mtime
+        return session
+
+    def save(self, session):
+        super().save(session)
+        if len(self._file_mtimes) > 2 * self.max_sessions:
+            self._file_mtimes = {cid: m for cid, m in self._file_mtimes.items() if cid in self._sessions}
+        path = self._path(session.conversation_id)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(session.to_dict(), f)
+            os.replace(tmp_path, path)
+            self._file_mtimes[session.conversation_id] = os.path.getmtime(path)
+        except OSError as e:
+            logger.warning("Could not write session file %s: %s", path, e)
+
+    def delete(self, conversation_id):
+        super().delete(conversation_id)
+        self._file_mtimes.pop(conversation_id, None)
+        try:
+            os.remove(self._path(conversation_id))
+        except OSError:
+            pass
+
+
+def create_session_store():
+    """Build the session store selected by SESSION_STORE (memory or disk)."""
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    if os.getenv("SESSION_STORE", "memory").strip().lower() == "disk":
+        directory = os.getenv("SESSION_DIR", os.path.join(tempfile.gettempdir(), 'chat_sessions'))
+        return DiskSessionStore(directory, max_sessions, ttl_seconds)
+    return InMemorySessionStore(max_sessions, ttl_seconds)
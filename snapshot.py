@@ -0,0 +1,314 @@
+"""
+Memory-mapped columnar snapshot of the customer and flight datasets.
+
+Layout (little-endian, sections 8-byte aligned):
+
+    magic "AIBZSNP1" | uint64 header length | JSON header | sections...
+
+The JSON header describes each table's columns and indexes by byte offset.
+Columns are fixed width: int64 (null = INT64_MIN) or uint32 ids into a shared
+string table (null = 0xFFFFFFFF). Each index is a pair of uint32 arrays (key
+string id, row) sorted by the key's UTF-8 bytes, searched with bisection.
+
+Build it with:
+
+    python snapshot.py <data_dir> <output_path>
+
+Opened files are mapped read-only, so every worker on a host shares the same
+page cache and a lookup only touches the pages for the rows it reads.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from data_store import CustomerRecord, FlightRecord, lookup_key
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AIBZSNP1"
+SNAPSHOT_VERSION = 2
+INT_NULL = -(1 << 63)
+STR_NULL = 0xFFFFFFFF
+
+# Which columns get a lookup index, and how keys are normalized
+TABLES = {
+    "flights": {"indexes": {"flight_id": None}},
+    "customers": {"indexes": {"customer_id": None, "email": "lower", "booking_reference": "upper", "flight_id": None}},
+}
+
+
+def _normalize(value, how):
+    if how == "lower":
+        return value.lower()
+    if how == "upper":
+        return value.upper()
+    return value
+
+
+class _Writer:
+    def __init__(self):
+        self.sections = []
+        self.size = 0
+        self.strings = {}
+        self.string_list = []
+
+    def add(self, data):
+        """Append a section and return its offset relative to the start of the data area."""
+        offset = self.size
+        padding = (-len(data)) % 8
+        self.sections.append(data + b"\0" * padding)
+        self.size += len(data) + padding
+        return offset
+
+    def string_id(self, value):
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = self.strings[value] = len(self.string_list)
+            self.string_list.append(value)
+        return string_id
+
+
+def _column_type(values):
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "int"
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    return "json"
+
+
+def build_snapshot(flights, customers, output_path):
+    """Write a snapshot of the given flight and customer dicts to output_path."""
+    # Stored exactly as DataStore holds them (string ids, int counts), so both stores answer alike
+    flights = [FlightRecord(**flight).to_dict() for flight in flights]
+    customers = [CustomerRecord(**customer).to_dict() for customer in customers]
+    writer = _Writer()
+    header = {"version": SNAPSHOT_VERSION, "tables": {}}
+
+    for table_name, rows in (("flights", flights), ("customers", customers)):
+        column_names = []
+        for row in rows:
+            for name in row:
+                if name not in column_names:
+                    column_names.append(name)
+
+        columns = {}
+        for name in column_names:
+            values = [row.get(name) for row in rows]
+            column_type = _column_type(values)
+            if column_type == "int":
+                data = struct.pack(f"<{len(values)}q", *[INT_NULL if v is None else v for v in values])
+            else:
+                if column_type == "json":
+                    values = [None if v is None else json.dumps(v) for v in values]
+                ids = [STR_NULL if v is None else writer.string_id(v) for v in values]
+                data = struct.pack(f"<{len(ids)}I", *ids)
+            columns[name] = {"type": column_type, "offset": writer.add(data)}
+
+        indexes = {}
+        for name, how in TABLES[table_name]["indexes"].items():
+            entries = []
+            for row_number, row in enumerate(rows):
+                value = row.get(name)
+                if isinstance(value, str):
+                    entries.append((_normalize(value, how).encode("utf-8"), row_number))
+            entries.sort()
+            keys = [writer.string_id(key.decode("utf-8")) for key, _ in entries]
+            row_numbers = [row_number for _, row_number in entries]
+            indexes[name] = {
+                "normalize": how,
+                "count": len(entries),
+                "keys_offset": writer.add(struct.pack(f"<{len(keys)}I", *keys)),
+                "rows_offset": writer.add(struct.pack(f"<{len(row_numbers)}I", *row_numbers)),
+            }
+
+        header["tables"][table_name] = {"rows": len(rows), "columns": columns, "indexes": indexes}
+
+    encoded = [value.encode("utf-8") for value in writer.string_list]
+    string_offsets = [0]
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+    header["strings"] = {
+        "count": len(encoded),
+        "offsets_offset": writer.add(struct.pack(f"<{len(string_offsets)}Q", *string_offsets)),
+        "data_offset": writer.add(b"".join(encoded)),
+    }
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * ((-len(header_bytes)) % 8)
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for section in writer.sections:
+            f.write(section)
+    os.replace(tmp_path, output_path)
+
+
+def build_snapshot_from_json(data_dir, output_path):
+    with open(os.path.join(data_dir, "flights.json"), "r") as f:
+        flights = json.load(f)
+    with open(os.path.join(data_dir, "customers.json"), "r") as f:
+        customers = json.load(f)
+    build_snapshot(flights, customers, output_path)
+    return len(flights), len(customers)
+
+
+class _Table:
+    def __init__(self, snapshot, spec):
+        self.snapshot = snapshot
+        self.rows = spec["rows"]
+        self.columns = {}
+        for name, column in spec["columns"].items():
+            fmt = "q" if column["type"] == "int" else "I"
+            self.columns[name] = (column["type"], snapshot.array(column["offset"], fmt, self.rows))
+        self.indexes = {
+            name: (index["normalize"],
+                   snapshot.array(index["keys_offset"], "I", index["count"]),
+                   snapshot.array(index["rows_offset"], "I", index["count"]))
+            for name, index in spec["indexes"].items()
+        }
+
+    def row(self, row_number):
+        """Decode a single row into a dict, skipping null fields."""
+        data = {}
+        for name, (column_type, values) in self.columns.items():
+            value = values[row_number]
+            if column_type == "int":
+                if value != INT_NULL:
+                    data[name] = value
+            elif value != STR_NULL:
+                text = self.snapshot.string(value)
+                data[name] = json.loads(text) if column_type == "json" else text
+        return data
+
+    def find_rows(self, column, value):
+        """Return the row numbers whose indexed column equals value (compared as a string)."""
+        value = lookup_key(value)
+        if value is None:
+            return []
+        how, keys, rows = self.indexes[column]
+        target = _normalize(value, how).encode("utf-8")
+        string_bytes = self.snapshot.string_bytes
+        low, high = 0, len(keys)
+        while low < high:
+            mid = (low + high) // 2
+            if string_bytes(keys[mid]) < target:
+                low = mid + 1
+            else:
+                high = mid
+        matches = []
+        while low < len(keys) and string_bytes(keys[low]) == target:
+            matches.append(rows[low])
+            low += 1
+        return matches
+
+    def find_row(self, column, value):
+        matches = self.find_rows(column, value)
+        return matches[0] if matches else None
+
+
+class SnapshotStore:
+    """Read-only store over a snapshot file with the same lookup API as DataStore."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if bytes(self._view[:8]) != MAGIC:
+            raise ValueError(f"{path} is not a data snapshot")
+        (header_length,) = struct.unpack_from("<Q", self._mmap, 8)
+        header = json.loads(bytes(self._view[16:16 + header_length]))
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {header.get('version')}")
+        self._data_start = 16 + header_length
+
+        strings = header["strings"]
+        self._string_offsets = self.array(strings["offsets_offset"], "Q", strings["count"] + 1)
+        self._string_data = self._data_start + strings["data_offset"]
+
+        self.flights = _Table(self, header["tables"]["flights"])
+        self.customers = _Table(self, header["tables"]["customers"])
+
+    def array(self, offset, fmt, count):
+        """Zero-copy typed view over a section of the file."""
+        start = self._data_start + offset
+        size = struct.calcsize(fmt) * count
+        return self._view[start:start + size].cast(fmt)
+
+    def string_bytes(self, string_id):
+        start = self._string_data + self._string_offsets[string_id]
+        end = self._string_data + self._string_offsets[string_id + 1]
+        return self._view[start:end].tobytes()
+
+    def string(self, string_id):
+        return self.string_bytes(string_id).decode("utf-8")
+
+    def get_flight(self, flight_id):
+        row = self.flights.find_row("flight_id", flight_id)
+        return FlightRecord(**self.flights.row(row)) if row is not None else None
+
+    def get_customer(self, customer_id):
+        row = self.customers.find_row("customer_id", customer_id)
+        return CustomerRecord(**self.customers.row(row)) if row is not None else None
+
+    def find_by_booking_reference(self, booking_reference):
+        row = self.customers.find_row("booking_reference", booking_reference)
+        return CustomerRecord(**self.customers.row(row)) if row is not None else None
+
+    def find_by_email(self, email):
+        row = self.customers.find_row("email", email)
+        return CustomerRecord(**self.customers.row(row)) if row is not None else None
+
+    def customers_on_flight(self, flight_id):
+        return [CustomerRecord(**self.customers.row(row)) for row in self.customers.find_rows("flight_id", flight_id)]
+
+    def get_flight_status(self, flight_id):
+        """Return the flight as a dict, or None if it is unknown."""
+        row = self.flights.find_row("flight_id", flight_id)
+        return self.flights.row(row) if row is not None else None
+
+    def get_customer_details(self, customer_id):
+        """Return the customer as a dict with their flight joined under "flight", or None."""
+        row = self.customers.find_row("customer_id", customer_id)
+        if row is None:
+            return None
+        customer = self.customers.row(row)
+        return {**customer, "flight": self.get_flight_status(customer.get("flight_id"))}
+
+
+def open_data_store(data_dir, snapshot_path=None):
+    """
+    Open the snapshot at snapshot_path if it is at least as new as the JSON files,
+    otherwise fall back to loading the JSON into a DataStore.
+    """
+    from data_store import DataStore
+
+    if snapshot_path and os.path.exists(snapshot_path):
+        snapshot_mtime = os.path.getmtime(snapshot_path)
+        json_mtimes = [
+            os.path.getmtime(os.path.join(data_dir, name))
+            for name in ("flights.json", "customers.json")
+            if os.path.exists(os.path.join(data_dir, name))
+        ]
+        if all(mtime <= snapshot_mtime for mtime in json_mtimes):
+            try:
+                return SnapshotStore(snapshot_path)
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable data snapshot at %s: %s", snapshot_path, e)
+        else:
+            logger.info("Data snapshot at %s is older than the JSON files; loading JSON", snapshot_path)
+    return DataStore.from_json_files(data_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python snapshot.py <data_dir> <output_path>")
+        sys.exit(1)
+    n_flights, n_customers = build_snapshot_from_json(sys.argv[1], sys.argv[2])
+    print(f"Wrote snapshot with {n_flights} flights and {n_customers} customers to {sys.argv[2]}")
@@ -0,0 +1,113 @@
+import builtins
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Best available approximation of process start: when this module was first imported
+PROCESS_START = time.perf_counter()
+
+
+class ImportProfiler:
+    """
+    Records how long each module takes to import the first time.
+    Wraps builtins.__import__ while installed; call uninstall() once startup is done.
+    Cumulative time includes nested imports, self time excludes them.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self._original_import = None
+        # Nested-import timing is tracked per thread; no lock is held across an import
+        self._local = threading.local()
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original_import = self._original_import or builtins.__import__
+        # Only time absolute imports of modules not yet loaded
+        if level != 0 or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.modules.setdefault(name, {
+                "cumulative_ms": round(elapsed * 1000, 2),
+                "self_ms": round((elapsed - children) * 1000, 2),
+            })
+
+    def report(self, top_n=50):
+        """Return the slowest imports by cumulative time."""
+        ranked = sorted(self.modules.items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)
+        return [{"module": name, **timing} for name, timing in ranked[:top_n]]
+
+
+STARTUP_STAGES = {}
+
+
+def mark_stage(stage):
+    """Record the time since process start at which a startup stage finished."""
+    STARTUP_STAGES[stage] = round((time.perf_counter() - PROCESS_START) * 1000, 2)
+
+
+class Deferred:
+    """
+    Builds an expensive object on first use instead of at import.
+    Attribute access is forwarded to the built object; prewarm() builds it
+    in a background thread so the first request does not have to wait.
+    """
+
+    def __init__(self, factory, name=None):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "deferred")
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = self._factory()
+                    logger.info("Built %s in %.1f ms", self._name, (time.perf_counter() - start) * 1000)
+                    mark_stage(f"{self._name}_ready")
+                instance = self._instance
+        return instance
+
+    def prewarm(self):
+        """Build the object in a daemon thread."""
+        def build():
+            try:
+                self.get()
+            except Exception as e:
+                logger.error("Error prewarming %s: %s", self._name, e)
+        threading.Thread(target=build, name=f"prewarm-{self._name}", daemon=True).start()
+
+    def __getattr__(self, attribute):
+        return getattr(self.get(), attribute)
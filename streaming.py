@@ -0,0 +1,43 @@
+import json
+
+ESCALATION_MARKER = "ESCALATE"
+
+
+def sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EscalationFilter:
+    """
+    Incrementally detects and strips the escalation marker from a token stream.
+    The marker may be split across chunks, so any trailing text that could be the
+    start of it is held back until the next chunk (or flush) resolves it.
+    """
+
+    def __init__(self, marker=ESCALATION_MARKER):
+        self.marker = marker
+        self.detected = False
+        self._pending = ""
+
+    def _held_back(self, text):
+        """Length of the longest suffix of text that is a proper prefix of the marker."""
+        for size in range(min(len(text), len(self.marker) - 1), 0, -1):
+            if self.marker.startswith(text[-size:]):
+                return size
+        return 0
+
+    def feed(self, text):
+        """Add a chunk of model output and return the text that is safe to forward."""
+        buffer = self._pending + text
+        if self.marker in buffer:
+            self.detected = True
+            buffer = buffer.replace(self.marker, "")
+        held = self._held_back(buffer)
+        self._pending = buffer[len(buffer) - held:]
+        return buffer[:len(buffer) - held]
+
+    def flush(self):
+        """Return any text still held back at the end of the stream."""
+        remainder, self._pending = self._pending, ""
+        return remainder
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from startup import Deferred
+
+
+@pytest.fixture
+def asgi(chat_app):
+    import asgi
+    return asgi
+
+
+async def call(asgi, payload, status=200):
+    body = json.dumps(payload).encode("utf-8")
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app({"type": "http", "path": "/api/chat", "method": "POST"}, receive, send)
+    assert sent[0]["status"] == status
+    return json.loads(sent[1]["body"])
+
+
+def test_async_chat_matches_the_sync_pipeline(chat_app, asgi):
+    message = "What is the carry-on size limit?"
+    result = asyncio.run(call(asgi, {"customer_id": "C001", "message": message}))
+    expected = chat_app.process_chat("C001", message, [])
+    assert result["response"] == expected["response"]
+    assert result["prompt_tokens"] == expected["prompt_tokens"]
+
+
+def test_stale_conversations_ask_for_the_full_history(chat_app, asgi):
+    payload = {"customer_id": "C001", "conversation_id": "asgi-stale", "message": "Hello"}
+    first = asyncio.run(call(asgi, {**payload, "history_marker": None}))
+    assert first["history_marker"]
+    assert asyncio.run(call(asgi, {**payload, "history_marker": "0-stale"}, status=409))["history_required"]
+
+
+def test_routing_errors_return_the_error_payload(chat_app, monkeypatch):
+    def broken_route(customer_id, user_message):
+        raise KeyError("flight lookup failed")
+
+    monkeypatch.setattr(chat_app, "route_chat", broken_route)
+    result = asyncio.run(chat_app.process_chat_async("C001", "Is my flight on time?", []))
+    assert result["needs_escalation"]
+    assert "flight lookup failed" in result["structured_summary"]
+
+
+def test_lazy_retriever_build_does_not_block_the_event_loop(chat_app, monkeypatch):
+    built = threading.Event()
+    retriever = chat_app.policy_retriever.get()
+
+    def slow_build():
+        time.sleep(0.2)
+        built.set()
+        return retriever
+
+    monkeypatch.setattr(chat_app, "policy_retriever", Deferred(slow_build, name="slow_retriever"))
+
+    async def scenario():
+        chat = asyncio.ensure_future(chat_app.process_chat_async(None, "What is the carry-on size limit?", []))
+        ticks = 0
+        while not chat.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return chat.result(), ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert built.is_set()
+    assert "trouble" not in result["response"], result
+    # The loop kept running while the retriever was built
+    assert ticks > 5
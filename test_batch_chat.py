@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+import types
+
+from batch_chat import BatchRunner, RateLimiter, is_rate_limit_error, parse_rows, retry_after_seconds
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = types.SimpleNamespace(status_code=429, headers=headers)
+
+
+def jsonl(rows):
+    return [json.dumps(row) for row in rows]
+
+
+def results(records):
+    return sorted((r for r in records if r["type"] == "result"), key=lambda r: r["index"])
+
+
+def test_parse_rows_reports_bad_lines_in_place():
+    lines = ['{"message": "hi"}', "", "not json", '{"id": 1}', b'{"message": "bytes"}']
+    parsed = list(parse_rows(lines))
+    assert [index for index, _, _ in parsed] == [0, 1, 2, 3]
+    assert parsed[0][1] == {"message": "hi"} and parsed[3][1] == {"message": "bytes"}
+    assert parsed[1][2].startswith("Invalid row") and parsed[2][2].startswith("Invalid row")
+
+
+def test_rate_limit_errors_are_recognized():
+    assert is_rate_limit_error(RateLimitError())
+    assert not is_rate_limit_error(ValueError("bad"))
+    assert retry_after_seconds(RateLimitError(retry_after=2)) == 2.0
+    assert retry_after_seconds(RateLimitError()) is None
+
+
+def test_every_row_gets_one_result_and_the_summary_is_last():
+    rows = [{"id": n, "message": f"question {n}"} for n in range(25)]
+    runner = BatchRunner(lambda row: {"response": row["message"].upper()}, concurrency=4, chunk_size=8,
+                         progress_every=10)
+    records = list(runner.run(jsonl(rows) + ["oops"]))
+
+    assert records[-1]["type"] == "summary"
+    assert records[-1]["completed"] == 26 and records[-1]["errors"] == 1
+    assert sum(r["type"] == "progress" for r in records) == 2
+    done = results(records)
+    assert [r["index"] for r in done] == list(range(26))
+    assert done[3] == {"type": "result", "index": 3, "id": 3, "response": "QUESTION 3"}
+    assert "error" in done[25]
+
+
+def test_each_chunk_prefetches_its_embeddings_once():
+    prefetched = []
+    runner = BatchRunner(lambda row: {}, prefetch=prefetched.append, concurrency=2, chunk_size=4)
+    records = list(runner.run(jsonl({"message": f"m{n}"} for n in range(10))))
+    assert [len(batch) for batch in prefetched] == [4, 4, 2]
+    assert records[-1]["embedding_batches"] == 3
+
+
+def test_failed_prefetch_does_not_fail_rows():
+    def prefetch(messages):
+        raise RuntimeError("embedding API down")
+
+    records = list(BatchRunner(lambda row: {"ok": True}, prefetch=prefetch, concurrency=2).run(
+        jsonl([{"message": "a"}, {"message": "b"}])))
+    assert all(r["ok"] for r in results(records))
+    assert records[-1]["errors"] == 0 and records[-1]["embedding_batches"] == 0
+
+
+def test_rate_limited_rows_are_retried_and_pause_the_pool():
+    attempts = []
+    lock = threading.Lock()
+
+    def handle(row):
+        with lock:
+            attempts.append((row["message"], time.monotonic()))
+            first = len(attempts) == 1
+        if first:
+            raise RateLimitError(retry_after=0.2)
+        return {"response": "ok"}
+
+    started = time.monotonic()
+    records = list(BatchRunner(handle, concurrency=1, max_retries=2).run(
+        jsonl([{"message": "a"}, {"message": "b"}])))
+    assert all(r["response"] == "ok" for r in results(records))
+    assert records[-1]["retries"] == 1 and records[-1]["rate_limited"] == 1
+    assert attempts[1][1] - started >= 0.2
+
+
+def test_other_errors_are_not_retried():
+    calls = []
+
+    def handle(row):
+        calls.append(row)
+        raise ValueError("unknown customer")
+
+    records = list(BatchRunner(handle, concurrency=1, max_retries=3).run(jsonl([{"message": "a"}])))
+    assert len(calls) == 1
+    assert results(records)[0]["error"] == "unknown customer"
+
+
+def test_rows_give_up_after_max_retries():
+    calls = []
+
+    def handle(row):
+        calls.append(row)
+        raise RateLimitError(retry_after=0.01)
+
+    records = list(BatchRunner(handle, concurrency=1, max_retries=2).run(jsonl([{"message": "a"}])))
+    assert len(calls) == 3
+    assert results(records)[0]["error"] == "rate limited"
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_minute=1200)
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.14
+
+
+def test_batch_endpoint_streams_jsonl(chat_app):
+    body = "\n".join(jsonl([
+        {"id": "a", "customer_id": "C001", "message": "What is the carry-on size limit?"},
+        {"id": "b", "message": "Can I bring my dog?", "history": [{"role": "user", "content": "Hi"}]},
+    ]))
+    response = chat_app.app.test_client().post("/api/chat/batch", data=body)
+    assert response.mimetype == "application/x-ndjson"
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert records[-1]["type"] == "summary" and records[-1]["errors"] == 0
+    assert {r["id"] for r in results(records)} == {"a", "b"}
+    assert all(r["response"] for r in results(records))
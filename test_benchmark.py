@@ -0,0 +1,60 @@
+import json
+import random
+
+import pytest
+
+import benchmark
+from policy_sections import split_sections
+
+
+def test_percentiles():
+    summary = benchmark.percentiles([float(n) for n in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == 51.0 and summary["p99_ms"] == 99.0 and summary["max_ms"] == 100.0
+    assert benchmark.percentiles([]) == {"count": 0}
+
+
+def test_compare_flags_only_regressions_beyond_the_tolerance():
+    baseline = {"chat": {"latency": {"p50_ms": 100.0, "p99_ms": 200.0}, "rps": 50.0, "errors": 0},
+                "retrievers": {"5": {"faiss_hnsw": {"recall_at_10": 1.0}}}}
+    results = {"chat": {"latency": {"p50_ms": 110.0, "p99_ms": 300.0}, "rps": 30.0, "errors": 5},
+               "retrievers": {"5": {"faiss_hnsw": {"recall_at_10": 0.95}}}}
+    comparisons, regressions = benchmark.compare(results, baseline, tolerance=0.2)
+    assert sorted(regressions) == ["chat.latency.p99_ms", "chat.rps"]
+    assert comparisons["chat.latency.p50_ms"]["worse_by"] == 0.1
+    # Counters with no better direction are not compared
+    assert "chat.errors" not in comparisons
+
+
+def test_synthetic_corpus_has_one_section_per_passage(tmp_path):
+    passages = benchmark.synthetic_passages(150, random.Random(0))
+    benchmark.write_corpus(passages, str(tmp_path))
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == 2
+    sections = [section for path in files for section in split_sections(path.read_text(), path.name)]
+    assert len(sections) == 150
+
+
+@pytest.fixture
+def fixed_results(monkeypatch):
+    results = {"5": {"bm25": {"query": {"p50_ms": 1.0}}}}
+    monkeypatch.setattr(benchmark, "bench_retrievers", lambda args: results)
+    return results
+
+
+def run(tmp_path, *extra):
+    out, baseline = tmp_path / "results.json", tmp_path / "baseline.json"
+    code = benchmark.main(["retrievers", "--out", str(out), "--baseline", str(baseline), *extra])
+    return code, json.loads(out.read_text())
+
+
+def test_runs_are_compared_against_the_saved_baseline(tmp_path, fixed_results):
+    code, report = run(tmp_path, "--save-baseline")
+    assert code == 0 and "comparison" not in report
+
+    fixed_results["5"]["bm25"]["query"]["p50_ms"] = 2.0
+    code, report = run(tmp_path)
+    assert code == 0
+    assert report["comparison"]["regressions"] == ["retrievers.5.bm25.query.p50_ms"]
+    code, _ = run(tmp_path, "--fail-on-regression")
+    assert code == 1
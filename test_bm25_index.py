@@ -0,0 +1,106 @@
+import json
+import math
+import os
+
+import pytest
+
+from bm25_index import BM25Index, expand_query, load_or_build, load_policy_documents, tokenize
+from policy_sections import index_sections
+
+POLICY_DIR = os.path.join(os.path.dirname(__file__), "policies")
+
+
+def keyword_scan(documents, query, top_n):
+    """The set-intersection scan BM25 replaced: count query words present in each document."""
+    query_words = set(query.lower().split())
+    scores = [(name, len(query_words & set(text.lower().split()))) for name, text in documents.items()]
+    scores.sort(key=lambda item: item[1], reverse=True)
+    return [name for name, score in scores[:top_n] if score > 0]
+
+
+def brute_force_bm25(documents, query, k1=1.5, b=0.75):
+    tokenized = {name: tokenize(text) for name, text in documents.items()}
+    avgdl = sum(len(tokens) for tokens in tokenized.values()) / len(tokenized)
+    scores = {}
+    for term in set(tokenize(query)):
+        containing = [name for name, tokens in tokenized.items() if term in tokens]
+        idf = math.log(1 + (len(documents) - len(containing) + 0.5) / (len(containing) + 0.5))
+        for name in containing:
+            tf = tokenized[name].count(term)
+            norm = k1 * (1 - b + b * len(tokenized[name]) / avgdl)
+            scores[name] = scores.get(name, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+@pytest.fixture(scope="module")
+def sections():
+    return {chunk_id: section.text for chunk_id, section in index_sections(load_policy_documents(POLICY_DIR)).items()}
+
+
+@pytest.fixture(scope="module")
+def index(sections):
+    return BM25Index.build(sections)
+
+
+@pytest.mark.parametrize("query", ["checked bag fee for gold members", "wheelchair at the gate", "refund"])
+def test_scores_match_the_bm25_formula(sections, index, query):
+    expected = brute_force_bm25(sections, query)
+    results = index.search(query, top_n=len(sections))
+    assert {index.doc_names[doc_id]: pytest.approx(score) for doc_id, score in results} == expected
+
+
+def test_rare_terms_outrank_common_word_overlap():
+    documents = {
+        "boarding": "the boarding time is shown at the gate and on the board at the airport",
+        "delays": "the new time is shown at the gate when the flight is late",
+        "seats": "the seat is assigned at check-in or at the gate",
+        "assistance": "wheelchair service is available",
+    }
+    query = "wheelchair at the gate"
+    # The keyword scan counts shared words, so stop words decide the ranking
+    assert keyword_scan(documents, query, 1) == ["boarding"]
+    index = BM25Index.build(documents)
+    assert index.doc_names[index.search(query, 1)[0][0]] == "assistance"
+
+
+def test_finds_every_section_the_keyword_scan_finds(sections, index):
+    for query in ["pets in cabin", "how many miles do i earn", "cancel my ticket"]:
+        found = {index.doc_names[doc_id] for doc_id, _ in index.search(query, top_n=len(sections))}
+        # The scan splits on whitespace only; tokenizing the same words finds at least as much
+        scanned = keyword_scan({name: " ".join(tokenize(text)) for name, text in sections.items()},
+                               " ".join(tokenize(query)), len(sections))
+        assert set(scanned) <= found
+
+
+def test_punctuation_does_not_hide_matches():
+    index = BM25Index.build({"baggage": "Checked bags: two free.", "other": "Seat selection"})
+    assert [index.doc_names[doc_id] for doc_id, _ in index.search("bags?")] == ["baggage"]
+
+
+def test_allowed_restricts_the_documents_scored(index):
+    top = index.search("checked bags", top_n=3)
+    allowed = {doc_id for doc_id, _ in top[1:]}
+    assert [doc_id for doc_id, _ in index.search("checked bags", top_n=3, allowed=allowed)] == [
+        doc_id for doc_id, _ in top[1:]]
+
+
+def test_query_expansion_adds_every_matching_topic():
+    expanded = expand_query("Can I cancel and get my bags refunded?")
+    assert "cancellation" in expanded and "baggage" in expanded
+    assert expand_query("Hello") == "hello"
+
+
+def test_serialized_index_round_trips(index, tmp_path):
+    path = tmp_path / "bm25.json"
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.search("gold checked bags", 5) == index.search("gold checked bags", 5)
+
+
+def test_load_or_build_rebuilds_stale_indexes(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    load_or_build({"a": "first text"}, path)
+    index = load_or_build({"a": "second text"}, path)
+    assert index.search("second") and not index.search("first")
+    with open(path) as f:
+        assert json.load(f)["content_hash"] == index.content_hash
@@ -0,0 +1,66 @@
+import pytest
+
+from data_store import CustomerRecord, DataStore, FlightRecord
+
+FLIGHTS = [
+    {"flight_id": "FL001", "origin": "JFK", "destination": "LAX", "departure": "2025-06-01T08:00",
+     "status": "On Time", "gate": "B12", "terminal": "4"},
+    {"flight_id": "FL002", "origin": "SFO", "destination": "ORD", "status": "Delayed", "delay_minutes": "45"},
+]
+CUSTOMERS = [
+    {"customer_id": "C001", "name": "Jane Doe", "email": "Jane@Example.com", "flight_id": "FL001",
+     "loyalty_tier": "Gold", "loyalty_points": 75000, "booking_reference": "abc123", "seat": "12A"},
+    {"customer_id": "C002", "name": "John Roe", "email": "john@example.com", "flight_id": "FL001",
+     "loyalty_tier": "Standard", "booking_reference": "DEF456"},
+    {"customer_id": "C003", "name": "Ann Poe", "email": "ann@example.com", "loyalty_tier": "Silver",
+     "nickname": "Annie"},
+]
+
+
+@pytest.fixture
+def store():
+    return DataStore(FLIGHTS, CUSTOMERS)
+
+
+def test_customer_details_join_the_flight(store):
+    details = store.get_customer_details("C001")
+    assert details["name"] == "Jane Doe"
+    assert details["flight"] == {"flight_id": "FL001", "origin": "JFK", "destination": "LAX",
+                                 "departure": "2025-06-01T08:00", "status": "On Time", "gate": "B12", "terminal": "4"}
+    assert store.get_customer_details("C999") is None
+
+
+def test_customers_without_a_flight(store):
+    details = store.get_customer_details("C003")
+    assert details["flight"] is None
+    assert details["nickname"] == "Annie"
+
+
+def test_secondary_indexes_are_case_insensitive(store):
+    assert store.find_by_booking_reference("ABC123").customer_id == "C001"
+    assert store.find_by_email("jane@example.COM").customer_id == "C001"
+    assert {c.customer_id for c in store.customers_on_flight("FL001")} == {"C001", "C002"}
+
+
+def test_replacing_a_customer_updates_every_index(store):
+    store.add_customer({**CUSTOMERS[0], "email": "jane@new.example", "booking_reference": "XYZ999",
+                        "flight_id": "FL002"})
+    assert store.find_by_email("Jane@Example.com") is None
+    assert store.find_by_booking_reference("ABC123") is None
+    assert store.find_by_booking_reference("xyz999").customer_id == "C001"
+    assert [c.customer_id for c in store.customers_on_flight("FL001")] == ["C002"]
+    assert [c.customer_id for c in store.customers_on_flight("FL002")] == ["C001"]
+
+
+def test_records_coerce_field_types():
+    flight = FlightRecord(flight_id=7, delay_minutes="45", meal="snack")
+    assert flight.flight_id == "7" and flight.delay_minutes == 45
+    assert flight.to_dict() == {"flight_id": "7", "delay_minutes": 45, "meal": "snack"}
+    assert CustomerRecord(customer_id=5, loyalty_points="10").to_dict() == {"customer_id": "5", "loyalty_points": 10}
+
+
+def test_loads_json_files(tmp_path):
+    (tmp_path / "flights.json").write_text('[{"flight_id": "FL001", "status": "Boarding"}]')
+    store = DataStore.from_json_files(tmp_path)
+    assert store.get_flight_status("FL001") == {"flight_id": "FL001", "status": "Boarding"}
+    assert store.customers == {}
@@ -0,0 +1,72 @@
+import time
+
+from embedding_cache import QueryEmbeddingCache, normalize_query
+
+
+def test_normalized_queries_share_an_entry():
+    cache = QueryEmbeddingCache()
+    cache.put("How many bags can I check?", [1.0, 0.0])
+    assert normalize_query("  how MANY bags, can i check ") == "how many bags can i check"
+    assert cache.get("how many bags can i check") == [1.0, 0.0]
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_or_compute_embeds_each_query_once():
+    cache = QueryEmbeddingCache()
+    calls = []
+
+    def embed(query):
+        calls.append(query)
+        return [float(len(query))]
+
+    assert cache.get_or_compute("refund policy", embed) == [13.0]
+    assert cache.get_or_compute("Refund policy?", embed) == [13.0]
+    assert calls == ["refund policy"]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0] and cache.get("c") == [3.0]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = QueryEmbeddingCache(ttl_seconds=0.01)
+    cache.put("pet policy", [1.0])
+    time.sleep(0.02)
+    assert cache.get("pet policy") is None
+
+
+def test_byte_budget_bounds_the_cache():
+    cache = QueryEmbeddingCache(max_bytes=1000)
+    cache.put("too big", [0.0] * 100)
+    assert cache.stats()["entries"] == 0
+    for query in ("one", "two", "three"):
+        cache.put(query, [0.0] * 10)
+    assert cache.stats()["bytes"] <= 1000
+
+
+def test_near_duplicates_hit_only_when_enabled():
+    exact = QueryEmbeddingCache()
+    exact.put("how many bags can i check", [1.0])
+    assert exact.get("how many checked bags can i have") is None
+
+    fuzzy = QueryEmbeddingCache(near_duplicate_threshold=0.8)
+    fuzzy.put("how many bags can i check", [1.0])
+    assert fuzzy.get("how many bags can i check in") == [1.0]
+    assert fuzzy.get("what is the pet policy") is None
+    assert fuzzy.stats()["near_hits"] == 1
+
+
+def test_near_duplicates_never_cross_loyalty_tiers_or_numbers():
+    cache = QueryEmbeddingCache(near_duplicate_threshold=0.8)
+    cache.put("what is the baggage allowance for gold members", [1.0])
+    cache.put("what is the status of flight fl001", [2.0])
+    assert cache.get("what is the baggage allowance for silver members") is None
+    assert cache.get("what is the status of flight fl002") is None
+    assert cache.get("what is the baggage allowance for gold members please") == [1.0]
@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from embedding_client import EmbeddingClient, EmbeddingError, EmbeddingStore, content_key, validate_embeddings
+from llm_backend import MockLLMError
+
+
+class FlakyBackend:
+    """Embeds texts as [len(text), 1.0]; the first failures calls raise the given errors."""
+
+    embedding_model = "flaky"
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+            if self.failures:
+                raise self.failures.pop(0)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def api_error(status_code):
+    """An API error asking to be retried after 10 ms, so tests do not wait out the backoff."""
+    error = MockLLMError(status_code, f"status {status_code}")
+    error.response = type("Response", (), {"status_code": status_code, "headers": {"retry-after": "0.01"}})()
+    return error
+
+
+def rate_limited():
+    return api_error(429)
+
+
+def client(backend, **settings):
+    return EmbeddingClient(backend, **{"concurrency": 1, "max_retries": 2, **settings})
+
+
+def test_each_distinct_text_is_embedded_once():
+    backend = FlakyBackend()
+    embedder = client(backend)
+    vectors = embedder.embed_documents(["a", "bb", "a", "ccc"])
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0]]
+    assert backend.batches == [["a", "bb", "ccc"]]
+    assert embedder.stats["texts"] == 4 and embedder.stats["unique"] == 3
+
+
+def test_batches_respect_token_and_input_limits():
+    embedder = client(FlakyBackend(), max_batch_tokens=10, max_batch_inputs=3)
+    texts = ["word " * 4, "word " * 4, "word " * 4, "one", "two", "three", "four"]
+    batches = list(embedder.batches(texts))
+    assert batches == [texts[:2], texts[2:5], texts[5:]]
+    # A single text over the limit still gets a batch of its own
+    assert list(embedder.batches(["word " * 50])) == [["word " * 50]]
+
+
+def test_concurrent_batches_keep_input_order():
+    backend = FlakyBackend()
+    texts = [f"text {'x' * n}" for n in range(40)]
+    vectors = client(backend, concurrency=4, max_batch_inputs=3).embed_documents(texts)
+    assert vectors == [[float(len(text)), 1.0] for text in texts]
+    assert len(backend.batches) == 14
+
+
+def test_rate_limits_and_server_errors_are_retried():
+    backend = FlakyBackend(rate_limited(), api_error(500))
+    embedder = client(backend)
+    assert embedder.embed_documents(["a"]) == [[1.0, 1.0]]
+    assert embedder.stats["requests"] == 3
+    assert embedder.stats["retries"] == 2 and embedder.stats["rate_limited"] == 1
+
+
+def test_failures_raise_instead_of_returning_placeholders():
+    with pytest.raises(EmbeddingError):
+        client(FlakyBackend(ValueError("bad input"))).embed_documents(["a"])
+    with pytest.raises(EmbeddingError):
+        client(FlakyBackend(*[rate_limited()] * 3)).embed_documents(["a"])
+
+
+@pytest.mark.parametrize("vectors", [[[1.0]], [[1.0], [1.0, 2.0]], [[1.0], [float("nan")]], [[], []],
+                                     [[1.0], [0.0]], [[1.0, 0.0], [1e-9, -1e-9]]])
+def test_malformed_embeddings_are_rejected(vectors):
+    with pytest.raises(EmbeddingError):
+        validate_embeddings(["a", "b"], vectors)
+
+
+def test_stored_embeddings_are_not_requested_again(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+    backend = FlakyBackend()
+    client(backend, store=store).embed_documents(["a", "bb"])
+    assert len(store) == 2
+
+    embedder = client(backend, store=EmbeddingStore(str(tmp_path / "embeddings.sqlite3")))
+    assert embedder.embed_documents(["a", "bb", "ccc"]) == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert backend.batches == [["a", "bb"], ["ccc"]]
+    assert embedder.stats["store_hits"] == 2
+
+
+def test_store_keys_depend_on_the_model():
+    assert content_key("model-a", "text") != content_key("model-b", "text")
+
+
+def test_batches_embedded_before_a_failure_are_kept(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+    backend = FlakyBackend()
+    backend.embed_documents = _failing_after(backend.embed_documents, calls=1)
+    with pytest.raises(EmbeddingError):
+        client(backend, store=store, max_batch_inputs=1).embed_documents(["a", "bb"])
+    assert len(store) == 1
+
+
+def _failing_after(embed, calls):
+    count = [0]
+
+    def wrapper(texts):
+        count[0] += 1
+        if count[0] > calls:
+            raise ValueError("quota exceeded")
+        return embed(texts)
+
+    return wrapper
+
+
+def test_unwritable_store_only_costs_re_embedding(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    store = EmbeddingStore(str(blocker / "embeddings.sqlite3"))
+    assert client(FlakyBackend(), store=store).embed_documents(["a"]) == [[1.0, 1.0]]
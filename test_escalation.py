@@ -0,0 +1,92 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from escalation import LatencyRecorder, get_escalation_mode, parse_combined_output
+
+
+class ScriptedBackend:
+    """Answers the reply prompt and the agent-summary prompt with fixed texts, counting calls."""
+
+    def __init__(self, reply, summary="- Problem Summary: lost bag"):
+        self.reply = reply
+        self.summary = summary
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def chat(self, messages, json_mode=False, max_tokens=None):
+        kind = "summary" if "Generate a structured summary" in messages[0].content else "reply"
+        with self._lock:
+            self.calls.append(kind)
+        return self.summary if kind == "summary" else self.reply
+
+    async def achat(self, messages, json_mode=False, max_tokens=None):
+        return self.chat(messages, json_mode, max_tokens)
+
+
+def test_parse_combined_output():
+    text = json.dumps({"response": "An agent will help. ESCALATE", "escalate": False, "summary": " "})
+    assert parse_combined_output(text) == ("An agent will help. ", True, None)
+    assert parse_combined_output(json.dumps({"response": "Hi", "escalate": True, "summary": "s"})) == ("Hi", True, "s")
+    assert parse_combined_output("not json") is None
+    assert parse_combined_output(json.dumps({"reply": "Hi"})) is None
+
+
+def test_unknown_mode_falls_back_to_sequential(monkeypatch):
+    monkeypatch.setenv("ESCALATION_MODE", " Speculative ")
+    assert get_escalation_mode() == "speculative"
+    monkeypatch.setenv("ESCALATION_MODE", "parallel")
+    assert get_escalation_mode() == "sequential"
+
+
+def test_latency_summary():
+    recorder = LatencyRecorder(window=3)
+    for latency in (100, 1, 2, 3):
+        recorder.record("speculative", "resolved", latency)
+    summary = recorder.summary()["speculative"]["resolved"]
+    assert summary["count"] == 3 and summary["p50_ms"] == 2 and summary["mean_ms"] == 2
+
+
+@pytest.fixture(params=["sequential", "combined", "speculative"])
+def mode(request):
+    return request.param
+
+
+def run(chat_app, mode, backend, use_async=False):
+    strategies = chat_app.ASYNC_REPLY_STRATEGIES if use_async else chat_app.REPLY_STRATEGIES
+    messages, _ = chat_app.assemble_chat_messages(None, None, "Where is my bag?", [])
+    result = strategies[mode](backend, messages, "C001", "Where is my bag?", [])
+    return asyncio.run(result) if use_async else result
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_every_mode_escalates_with_a_summary(chat_app, mode, use_async):
+    reply = json.dumps({"response": "Let me get an agent.", "escalate": True, "summary": None}) \
+        if mode == "combined" else "Let me get an agent. ESCALATE"
+    result = run(chat_app, mode, ScriptedBackend(reply), use_async)
+    assert result["needs_escalation"]
+    assert result["structured_summary"] == "- Problem Summary: lost bag"
+    assert "ESCALATE" not in result["response"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_resolved_replies_carry_no_summary(chat_app, mode, use_async):
+    reply = json.dumps({"response": "It is on belt 4.", "escalate": False, "summary": None}) \
+        if mode == "combined" else "It is on belt 4."
+    result = run(chat_app, mode, ScriptedBackend(reply), use_async)
+    assert result == {"response": "It is on belt 4.", "needs_escalation": False}
+
+
+def test_combined_mode_needs_one_call_when_the_summary_is_included(chat_app):
+    backend = ScriptedBackend(json.dumps({"response": "Agent coming.", "escalate": True, "summary": "inline"}))
+    result = run(chat_app, "combined", backend)
+    assert result["structured_summary"] == "inline"
+    assert backend.calls == ["reply"]
+
+
+def test_sequential_mode_only_summarizes_escalations(chat_app):
+    backend = ScriptedBackend("It is on belt 4.")
+    run(chat_app, "sequential", backend)
+    assert backend.calls == ["reply"]
@@ -0,0 +1,83 @@
+import json
+import os
+import time
+
+from flight_feed import FlightFeedTailer, FlightStatusBoard, start_flight_feed
+
+BASE = {"flight_id": "FL001", "status": "On Time", "gate": "B12"}
+
+
+def append(path, *events, raw=b""):
+    with open(path, "ab") as f:
+        for event in events:
+            f.write(json.dumps(event).encode("utf-8") + b"\n")
+        f.write(raw)
+
+
+def test_events_overlay_the_base_record():
+    board = FlightStatusBoard()
+    board.apply_events([{"flight_id": "FL001", "status": "Delayed", "delay_minutes": 30, "event_time": "t"},
+                        {"flight_id": "FL001", "gate": None}])
+    assert board.overlay("FL001", BASE) == {"flight_id": "FL001", "status": "Delayed", "delay_minutes": 30}
+    assert BASE == {"flight_id": "FL001", "status": "On Time", "gate": "B12"}
+    assert board.overlay("FL002", None) is None
+
+
+def test_published_snapshots_are_never_mutated():
+    board = FlightStatusBoard()
+    first = board.apply_events([{"flight_id": "FL001", "status": "Boarding"}])
+    board.apply_events([{"flight_id": "FL001", "status": "Departed"}, {"not": "an event"}])
+    assert first.flights == {"FL001": {"status": "Boarding"}}
+    assert board.current().flights["FL001"]["status"] == "Departed"
+    assert board.stats() == {"version": 2, "flights_updated": 1, "events_applied": 2}
+
+
+def test_tailer_waits_for_complete_lines(tmp_path):
+    path = tmp_path / "feed.jsonl"
+    board = FlightStatusBoard()
+    tailer = FlightFeedTailer(board, str(path))
+    assert tailer.poll_once() == 0
+
+    append(path, {"flight_id": "FL001", "status": "Delayed"}, raw=b'{"flight_id": "FL001", "ga')
+    assert tailer.poll_once() == 1
+    append(path, raw=b'te": "C7"}\nnot json\n')
+    assert tailer.poll_once() == 1
+    assert board.overlay("FL001", BASE)["gate"] == "C7"
+    assert tailer.errors == 1
+
+
+def test_tailer_restarts_after_rotation(tmp_path):
+    path = tmp_path / "feed.jsonl"
+    append(path, {"flight_id": "FL001", "status": "Delayed"}, {"flight_id": "FL001", "gate": "C1"})
+    board = FlightStatusBoard()
+    tailer = FlightFeedTailer(board, str(path))
+    tailer.poll_once()
+
+    rotated = tmp_path / "feed.new"
+    append(rotated, {"flight_id": "FL001", "status": "Cancelled"})
+    os.replace(rotated, path)
+    assert tailer.poll_once() == 1
+    assert board.overlay("FL001", BASE)["status"] == "Cancelled"
+
+
+def test_background_tailer_applies_new_events_and_restarts(tmp_path):
+    path = tmp_path / "feed.jsonl"
+    append(path, {"flight_id": "FL001", "status": "Delayed"})
+    board, tailer = start_flight_feed(str(path), poll_interval=0.01)
+    try:
+        # Replayed before start_flight_feed returns
+        assert board.overlay("FL001", BASE)["status"] == "Delayed"
+        tailer.stop()
+        tailer.start()
+        append(path, {"flight_id": "FL001", "status": "Boarding"})
+        deadline = time.monotonic() + 2
+        while board.overlay("FL001", BASE)["status"] != "Boarding" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert board.overlay("FL001", BASE)["status"] == "Boarding"
+    finally:
+        tailer.stop()
+
+
+def test_no_feed_path_means_no_tailer():
+    board, tailer = start_flight_feed("")
+    assert tailer is None and board.stats()["version"] == 0
@@ -0,0 +1,124 @@
+import hashlib
+import sys
+import types
+
+import pytest
+
+import history_budget
+from history_budget import MESSAGE_OVERHEAD_TOKENS, PromptBudget, count_message_tokens, count_tokens
+from session_store import ConversationSession
+
+
+class FakeTiktoken(types.ModuleType):
+    """Stands in for tiktoken and records which encodings were requested."""
+
+    def __init__(self):
+        super().__init__("tiktoken")
+        self.requested = []
+
+    def get_encoding(self, name):
+        self.requested.append(name)
+        return types.SimpleNamespace(encode=lambda text, disallowed_special=(): text.split(),
+                                     decode=lambda tokens: " ".join(tokens))
+
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch, tmp_path):
+    module = FakeTiktoken()
+    monkeypatch.setitem(sys.modules, "tiktoken", module)
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("TOKEN_COUNTER", raising=False)
+    monkeypatch.setattr(history_budget, "_encoder", None)
+    monkeypatch.setattr(history_budget, "_encoder_loaded", False)
+    return module
+
+
+def cache_vocabulary(cache_dir, encoding):
+    url = f"https://openaipublic.blob.core.windows.net/encodings/{encoding}.tiktoken"
+    (cache_dir / hashlib.sha1(url.encode()).hexdigest()).write_bytes(b"")
+
+
+def test_uncached_vocabulary_is_never_downloaded(fake_tiktoken):
+    assert history_budget._get_encoder() is None
+    assert fake_tiktoken.requested == []
+    assert count_tokens("How many bags can I check?") == 7
+
+
+def test_cached_vocabulary_is_used(fake_tiktoken, tmp_path):
+    cache_vocabulary(tmp_path, "cl100k_base")
+    assert count_tokens("How many bags can I check?") == 6
+    assert fake_tiktoken.requested == ["cl100k_base"]
+
+
+def test_token_counter_overrides(fake_tiktoken, monkeypatch, tmp_path):
+    monkeypatch.setenv("TOKEN_COUNTER", "tiktoken")
+    assert history_budget._get_encoder() is not None
+
+    cache_vocabulary(tmp_path, "cl100k_base")
+    monkeypatch.setenv("TOKEN_COUNTER", "estimate")
+    monkeypatch.setattr(history_budget, "_encoder_loaded", False)
+    assert history_budget._get_encoder() is None
+    assert fake_tiktoken.requested == ["cl100k_base"]
+
+
+def test_estimate_truncates_to_the_budget(fake_tiktoken):
+    text = "word " * 100
+    truncated = history_budget.truncate_to_tokens(text, 20)
+    assert 0 < count_tokens(truncated) <= 20
+    assert text.startswith(truncated)
+
+
+def messages(count, words=20):
+    return [{"role": "user" if n % 2 == 0 else "assistant", "content": f"message {n} " + "word " * words}
+            for n in range(count)]
+
+
+def test_plan_keeps_the_newest_history_that_fits():
+    history = messages(20)
+    budget = PromptBudget(total_tokens=300, policy_share=0.5)
+    plan = budget.plan({"system": "You are a helpful agent."}, "Policy text " * 10, history)
+
+    assert plan.history == history[-len(plan.history):]
+    assert plan.dropped == len(history) - len(plan.history) > 0
+    assert plan.token_counts["total"] <= 300
+    assert plan.token_counts["history"] == sum(count_message_tokens(m["content"]) for m in plan.history)
+
+
+def test_policy_is_capped_at_its_share():
+    budget = PromptBudget(total_tokens=200, policy_share=0.25)
+    plan = budget.plan({"system": "short"}, "policy " * 500, [])
+    remaining = 200 - count_message_tokens("short")
+    assert plan.token_counts["policy"] <= int(remaining * 0.25)
+    assert plan.token_counts["policy"] > MESSAGE_OVERHEAD_TOKENS
+
+
+def test_overflow_is_folded_into_the_summary_once():
+    session = ConversationSession("c1", history=messages(20))
+    budget = PromptBudget(total_tokens=400, policy_share=0.5, fold_target=0.5)
+    folded = []
+
+    def summarize(previous, overflow):
+        folded.append((previous, len(overflow)))
+        return "Customer asked about bags."
+
+    plan = budget.plan_session(session, {"system": "prompt"}, None, summarize)
+    assert len(folded) == 1 and folded[0][0] is None
+    assert plan.dropped == 0
+    assert plan.summary == "Customer asked about bags."
+    assert session.summarized_count == plan.token_counts["history_folded"] == folded[0][1]
+
+    # The next turn fits without another fold
+    session.record_turn("one more question", "one more answer")
+    budget.plan_session(session, {"system": "prompt"}, None, summarize)
+    assert len(folded) == 1
+
+
+def test_failed_summary_drops_the_overflow_for_this_turn():
+    session = ConversationSession("c1", history=messages(20))
+
+    def summarize(previous, overflow):
+        raise RuntimeError("backend down")
+
+    plan = PromptBudget(total_tokens=400).plan_session(session, {"system": "prompt"}, None, summarize)
+    assert plan.dropped > 0
+    assert session.summary is None and session.summarized_count == 0
@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+
+import pytest
+
+from embedding_client import EmbeddingClient
+from hybrid_retrieval import (GENERAL_TIER, HybridPolicyRetriever, filter_key, fuse_rankings, loyalty_tiers,
+                              matches_filter, reciprocal_rank_fusion, section_tiers)
+from policy_retrieval_langchain import BackendEmbeddings, PolicyRetrieverLangChain
+
+# Sections whose text names only the Silver, Gold and Platinum tiers
+ELITE_ONLY = ("Tier Benefits", "Loyalty Member Benefits")
+CHECKED_BAGS = "Standard passengers: First checked bag $30"
+NON_REFUNDABLE_CHANGE = "Changes to non-refundable tickets: $200 change fee"
+
+
+@pytest.fixture
+def vector_retriever(policy_dir, mock_backend, tmp_path):
+    return PolicyRetrieverLangChain(policy_dir=str(policy_dir), cache_dir=str(tmp_path / "cache"),
+                                    embeddings=BackendEmbeddings(mock_backend, client=EmbeddingClient(mock_backend)))
+
+
+@pytest.fixture
+def retriever(vector_retriever):
+    retriever = HybridPolicyRetriever(vector_retriever)
+    yield retriever
+    retriever.executor.shutdown()
+
+
+def all_sections(retriever, filters=None):
+    return retriever.get_relevant_policies("loyalty tier benefits checked bag fees members", top_k=50,
+                                           filters=filters)
+
+
+@pytest.mark.parametrize("text, tiers", [
+    ("- Standard passengers: First checked bag $30", ["standard"]),
+    ("- Standard: Entry level, no minimum miles required", ["standard"]),
+    ("If missed due to passenger delay: Standard change fees apply", []),
+    ("Free for Gold and Platinum members", ["gold", "platinum"]),
+    ("Carry-on bags must fit in the overhead bin.", []),
+])
+def test_chunks_are_tagged_with_the_tiers_they_name(text, tiers):
+    assert loyalty_tiers(text) == tiers
+
+
+@pytest.mark.parametrize("body, tiers", [
+    ("- Change fee: $200\n- Same-day change: $75 for standard passengers, free for Gold members",
+     [GENERAL_TIER, "gold", "standard"]),
+    ("- Platinum members: Change fees waived\n- Silver members: Reduced change fee of $150",
+     ["platinum", "silver"]),
+    ("- Name changes are not permitted", [GENERAL_TIER]),
+])
+def test_sections_are_general_unless_every_line_names_a_tier(body, tiers):
+    assert section_tiers(body) == tiers
+
+
+def test_filter_keys_normalize_tiers_and_ignore_unknown_ones():
+    assert filter_key({"loyalty_tier": " Standard "}) == (("loyalty_tier", "standard"),)
+    assert filter_key({"loyalty_tier": "Bronze"}) is None
+    assert filter_key({"loyalty_tier": None, "policy_name": "Baggage Policy"}) == (
+        ("policy_name", ("baggage policy",)),)
+    assert filter_key({"as_of": datetime.date(2025, 1, 2)}) == (("as_of", "2025-01-02"),)
+    with pytest.raises(ValueError):
+        filter_key({"cabin": "economy"})
+
+
+def test_general_chunks_match_every_tier():
+    key = filter_key({"loyalty_tier": "Standard"})
+    assert matches_filter({"loyalty_tiers": []}, key)
+    assert matches_filter({"loyalty_tiers": ["gold", "standard"]}, key)
+    assert not matches_filter({"loyalty_tiers": ["silver", "gold", "platinum"]}, key)
+
+
+def test_preferred_tier_reorders_without_dropping():
+    tiers = {"a": [GENERAL_TIER], "b": ["silver"], "c": ["gold"]}
+    fused = [item for item, _ in fuse_rankings([["a", "b", "c"]] * 2, tiers_of=tiers.get, prefer_tier="Silver",
+                                                tier_weight=2.0)]
+    assert fused == ["b", "a", "c"]
+    assert fuse_rankings([["a", "b"]], tiers_of=tiers.get, prefer_tier="Bronze") == \
+        reciprocal_rank_fusion([["a", "b"]])
+
+
+def test_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a", "d"]], k=60)
+    assert [item for item, _ in fused][:2] in (["a", "b"], ["b", "a"])
+    assert [item for item, _ in fused][2:] == ["c", "d"]
+
+
+@pytest.mark.parametrize("tier", ["Standard", "standard", "Silver", "Gold", "Platinum"])
+def test_tier_filter_keeps_the_tiers_own_fees(retriever, tier):
+    results = all_sections(retriever, {"loyalty_tier": tier})
+    assert any(CHECKED_BAGS in text for _, text in results)
+    # General sections are kept for every tier
+    assert any("carry-on" in text.lower() for _, text in results)
+
+
+def test_standard_customers_do_not_get_elite_only_sections(retriever):
+    unfiltered = all_sections(retriever)
+    standard = all_sections(retriever, {"loyalty_tier": "Standard"})
+    elite_only = [text for _, text in unfiltered if loyalty_tiers(text) and "standard" not in loyalty_tiers(text)]
+    assert elite_only
+    assert not any(text in elite_only for _, text in standard)
+
+
+@pytest.mark.parametrize("tier", ["Silver", "Standard"])
+def test_tier_filter_keeps_general_sections_that_name_other_tiers(retriever, tier):
+    headings = {text.splitlines()[0] for _, text in all_sections(retriever, {"loyalty_tier": tier})}
+    assert "SkyWay Airlines Rebooking Policy > Voluntary Changes" in headings
+    assert "SkyWay Airlines Rebooking Policy > Loyalty Member Benefits" in headings
+
+
+def test_unknown_tiers_are_not_filtered(retriever):
+    assert all_sections(retriever, {"loyalty_tier": "Bronze"}) == all_sections(retriever)
+
+
+def test_async_search_applies_the_same_filters(retriever):
+    filters = {"loyalty_tier": "Standard"}
+    query = "what do loyalty members get when they cancel"
+    assert asyncio.run(retriever.aget_relevant_policies(query, filters=filters)) == \
+        retriever.get_relevant_policies(query, filters=filters)
+
+
+def test_vector_only_search_accepts_filters(vector_retriever):
+    results = vector_retriever.get_relevant_policies("silver gold platinum tier benefits", top_k=10,
+                                                     filters={"loyalty_tier": "Standard"})
+    assert results
+    assert all(not loyalty_tiers(text) or "standard" in loyalty_tiers(text) for _, text in results)
+
+
+def test_vector_only_search_prefers_a_tier(vector_retriever):
+    query = "what do loyalty members get when they cancel"
+    plain = vector_retriever.get_relevant_policies(query)
+    preferred = vector_retriever.get_relevant_policies(query, prefer_tier="Silver")
+    assert len(preferred) == len(plain) == 3
+    assert vector_retriever.get_relevant_policies(query, prefer_tier="Bronze") == plain
+def test_chat_retrieves_for_the_customers_tier(chat_app, monkeypatch):
+    seen = []
+    retriever = chat_app.policy_retriever.get()
+    original = retriever.format_for_prompt
+
+    def recording(query, filters=None, prefer_tier=None):
+        seen.append((filters, prefer_tier))
+        return original(query, filters=filters, prefer_tier=prefer_tier)
+
+    monkeypatch.setattr(retriever, "format_for_prompt", recording)
+    chat_app.process_chat("C003", "How much is a checked bag?", [])
+    chat_app.process_chat(None, "How much is a checked bag?", [])
+    assert seen == [(None, "Standard"), (None, None)]
+
+    messages, _ = chat_app.build_chat_messages("C003", "How much is a checked bag?", [])
+    assert any(CHECKED_BAGS in message.content for message in messages)
+
+
+def test_silver_customers_get_the_general_change_fees(chat_app):
+    customer = chat_app.get_customer_details("C002")
+    policy_info = chat_app.retrieve_policy_info("What is the fee to change my non-refundable ticket?", customer)
+    assert "Voluntary Changes" in policy_info and NON_REFUNDABLE_CHANGE in policy_info
+
+
+def test_standard_customers_can_still_read_about_other_tiers(chat_app):
+    customer = chat_app.get_customer_details("C003")
+    policy_info = chat_app.retrieve_policy_info("Do loyalty members get reduced change fees?", customer)
+    assert "Silver members: Reduced change fee of $150" in policy_info
@@ -0,0 +1,121 @@
+import pytest
+
+from intent_router import IntentClassifier, IntentRouter
+
+FLIGHT = {"flight_id": "AA100", "origin": "JFK", "destination": "LAX", "departure": "2025-01-01 09:00",
+          "status": "Delayed", "delay_minutes": 45, "gate": "B12", "terminal": "4"}
+CUSTOMER = {"customer_id": "C001", "name": "Jane Doe", "seat": "14C", "booking_reference": "ABC123",
+            "flight": FLIGHT}
+OTHER_FLIGHT = {"flight_id": "AA200", "origin": "LAX", "destination": "CDG", "departure": "2025-01-01 18:30",
+                "status": "On Time", "gate": "C7", "terminal": "5"}
+FLIGHTS = {flight["flight_id"]: flight for flight in (FLIGHT, OTHER_FLIGHT)}
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier()
+
+
+@pytest.fixture
+def router(classifier):
+    return IntentRouter(lambda customer_id: CUSTOMER if customer_id == "C001" else None, classifier=classifier,
+                        get_flight_status=FLIGHTS.get)
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Is my flight on time?", "status"),
+    ("What's the status of my flight", "status"),
+    ("Where is my gate?", "gate"),
+    ("Which terminal do I go to?", "gate"),
+    ("How long is the delay?", "delay_minutes"),
+    ("what time does my flight leave", "departure"),
+    ("When does my flight depart?", "departure"),
+    ("Is my flight delayed? How long is the delay", None),
+    ("What is my seat?", "seat"),
+    ("What is my booking reference?", "booking_reference"),
+    ("any news on my flight", "status"),
+])
+def test_single_structured_questions_are_answered_from_templates(router, message, intent):
+    result = router.route("C001", message)
+    if intent is None:
+        assert result is None
+        return
+    assert result["intent"] == [intent] and result["routed"] == "template"
+    assert result["response"].startswith("Hi Jane!")
+
+
+@pytest.mark.parametrize("message", [
+    # Complaints
+    "I am stuck at the terminal and nobody helps me, this is awful",
+    "my seat is broken and I want a new one",
+    "this is ridiculous, where is my gate",
+    # Cancellations
+    "my flight got cancelled, what are my options?",
+    "has my flight been cancelled",
+    "is my flight cancelled",
+    # Compound questions
+    "is my flight on time and can I bring a stroller",
+    "what is my seat or can I sit elsewhere",
+    "What is my gate? Also my booking reference",
+    # Requests for action
+    "can you send the gate agent a message about my dog",
+    "I need to change my seat",
+    "please upgrade my seat",
+    # Policy questions and anything without a structured intent
+    "How many bags can I check?",
+    "hello",
+    "I am at the terminal",
+    # Flights other than the booked one
+    "Where is the gate for my connecting flight to Paris?",
+    "is my return flight on time",
+    "what gate is the other flight at",
+])
+def test_everything_else_goes_to_the_llm(router, message):
+    assert router.classify(message) == []
+    assert router.route("C001", message) is None
+
+
+def test_customers_without_a_flight_go_to_the_llm(router):
+    assert router.classify("Where is my gate?") == ["gate"]
+    assert router.route("C999", "Where is my gate?") is None
+    assert router.route(None, "Where is my gate?") is None
+
+
+def test_long_messages_go_to_the_llm(classifier):
+    router = IntentRouter(lambda customer_id: CUSTOMER, classifier=classifier, max_words=5)
+    assert router.route("C001", "Where is my gate?") is not None
+    assert router.route("C001", "Could you please tell me where my gate is") is None
+
+
+def test_stats_count_short_circuited_requests(router):
+    router.route("C001", "Where is my gate?")
+    router.route("C001", "my flight got cancelled, what are my options?")
+    stats = router.stats()
+    assert stats["requests"] == 2 and stats["short_circuited"] == 1
+    assert stats["by_intent"] == {"gate": 1}
+
+
+def test_templates_use_the_customer_record(router):
+    assert "gate B12 in terminal 4" in router.route("C001", "Where is my gate?")["response"]
+    assert "delayed by 45 minutes" in router.route("C001", "How long is the delay?")["response"]
+    assert "14C" in router.route("C001", "What is my seat?")["response"]
+    assert "ABC123" in router.route("C001", "What is my booking reference?")["response"]
+    assert "depart at 2025-01-01 09:00" in router.route("C001", "what time does my flight leave")["response"]
+
+
+def test_named_flights_are_looked_up(router, classifier):
+    assert "Flight AA200 from LAX to CDG" in router.route("C001", "What is the status of flight AA200?")["response"]
+    assert "gate C7" in router.route("C001", "Where is the gate for AA200?")["response"]
+    assert "gate B12" in router.route("C001", "Where is the gate for aa100?")["response"]
+    # Unknown flights, another flight's booking fields and routers without a lookup go to the LLM
+    assert router.route("C001", "What is the status of flight AA999?") is None
+    assert router.route("C001", "What is my seat on AA200?") is None
+    no_lookup = IntentRouter(lambda customer_id: CUSTOMER, classifier=classifier)
+    assert no_lookup.route("C001", "What is the status of flight AA200?") is None
+
+
+def test_chat_answers_about_the_flight_asked_for(chat_app):
+    assert "Flight FL002" in chat_app.route_chat("C001", "What is the status of flight FL002?")["response"]
+    assert chat_app.route_chat("C001", "Where is the gate for my connecting flight to Paris?") is None
+    departure = chat_app.route_chat("C001", "what time does my flight leave")
+    assert departure["intent"] == ["departure"] and "2025-03-04 10:00" in departure["response"]
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import math
+import random
+import time
+import types
+
+import pytest
+
+from batch_chat import is_rate_limit_error
+from llm_backend import MockBackend, MockLLMError, parse_latency, to_chat_messages
+
+QUESTION = [{"role": "system", "content": "You are helpful."}, {"role": "user", "content": "Can I bring my dog?"}]
+
+
+def mock(**settings):
+    defaults = dict(latency="fixed:0", token_ms=0, embedding_latency="fixed:0", error_rate=0, rate_limit_rate=0,
+                    escalation_rate=0, embedding_dim=64, seed=0)
+    return MockBackend(**{**defaults, **settings})
+
+
+@pytest.mark.parametrize("spec, low, high", [
+    ("fixed:25", 25, 25), ("uniform:10:20", 10, 20), ("normal:50:5", 0, 100), ("lognormal:300:0.4", 1, 10000),
+])
+def test_latency_distributions(spec, low, high):
+    sample = parse_latency(spec)
+    rng = random.Random(0)
+    assert all(low <= sample(rng) <= high for _ in range(100))
+
+
+def test_unknown_latency_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        parse_latency("pareto:1")
+
+
+def test_langchain_messages_are_converted():
+    message = types.SimpleNamespace(type="human", content="hi")
+    assert to_chat_messages([message, {"role": "assistant", "content": "hello"}]) == [
+        {"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+
+
+def test_replies_are_deterministic_and_sized():
+    backend = mock(reply_tokens=30)
+    reply = backend.chat(QUESTION)
+    assert reply == mock(reply_tokens=30, seed=1).chat(QUESTION)
+    assert "Can I bring my dog?" in reply
+    assert len(backend.chat(QUESTION, max_tokens=15).split()) < len(reply.split())
+    assert "".join(backend.stream(QUESTION)).strip() == reply
+    assert backend.calls["chat"] == 2 and backend.calls["stream"] == 1
+
+
+def test_json_mode_matches_the_escalation_contract():
+    reply = json.loads(mock(escalation_rate=1).chat(QUESTION, json_mode=True))
+    assert reply["escalate"] is True and reply["summary"]
+    assert "ESCALATE" in reply["response"]
+    assert json.loads(mock().chat(QUESTION, json_mode=True))["escalate"] is False
+
+
+def test_escalation_rate_is_roughly_honored():
+    backend = mock(escalation_rate=0.3)
+    replies = [backend.chat([{"role": "user", "content": f"question {n}"}]) for n in range(500)]
+    rate = sum("ESCALATE" in reply for reply in replies) / len(replies)
+    assert 0.2 < rate < 0.4
+
+
+def test_injected_errors_look_like_api_errors():
+    backend = mock(rate_limit_rate=1)
+    with pytest.raises(MockLLMError) as error:
+        backend.chat(QUESTION)
+    assert error.value.status_code == 429 and is_rate_limit_error(error.value)
+    with pytest.raises(MockLLMError) as error:
+        mock(error_rate=1).embed_query("dog")
+    assert error.value.status_code == 500 and not is_rate_limit_error(error.value)
+    assert backend.calls["errors"] == 1
+
+
+def test_latency_is_time_to_first_token_plus_per_token_time():
+    backend = mock(latency="fixed:50", token_ms=2, reply_tokens=20)
+    started = time.perf_counter()
+    backend.chat(QUESTION)
+    elapsed = time.perf_counter() - started
+    assert 0.05 + 0.02 <= elapsed < 0.5
+
+    async def concurrent():
+        started = time.perf_counter()
+        await asyncio.gather(*(backend.achat(QUESTION) for _ in range(10)))
+        return time.perf_counter() - started
+
+    # achat sleeps on the loop, so concurrent calls overlap
+    assert asyncio.run(concurrent()) < 0.5
+
+
+def test_embeddings_are_normalized_and_share_words():
+    backend = mock()
+    dog, dogs, fees = backend.embed_documents(["bring my dog", "can i bring my dog on board", "baggage fees"])
+    assert len(dog) == 64
+    assert math.isclose(sum(v * v for v in dog), 1.0)
+    similarity = lambda a, b: sum(x * y for x, y in zip(a, b))
+    assert similarity(dog, dogs) > similarity(dog, fees)
+    assert asyncio.run(backend.aembed_query("bring my dog")) == dog
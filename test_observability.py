@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+from observability import (CHAT_ERRORS, CHAT_REQUESTS, MetricsRegistry, current_trace, finish_trace, set_path, span,
+                           start_trace)
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+
+
+def families(text):
+    """Map each HELP/TYPE family to the sample names rendered under it."""
+    result, family = {}, None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            family = line.split()[2]
+            result[family] = {"samples": []}
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name == family
+            result[family]["type"] = kind
+        else:
+            match = SAMPLE_RE.match(line)
+            assert match, line
+            result[family]["samples"].append(match.group(1))
+    return result
+
+
+def test_metadata_names_the_samples_it_describes():
+    registry = MetricsRegistry()
+    registry.counter("requests", "Requests.", ("path",)).inc("llm")
+    registry.histogram("request_seconds", "Latency.", buckets=(0.1, 1.0)).observe(0.5)
+    rendered = families(registry.render())
+
+    assert rendered["requests_total"] == {"samples": ["requests_total"], "type": "counter"}
+    assert rendered["request_seconds"]["type"] == "histogram"
+    assert set(rendered["request_seconds"]["samples"]) == {
+        "request_seconds_bucket", "request_seconds_sum", "request_seconds_count"}
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "retrieval")
+    text = registry.render()
+    assert 'latency_bucket{stage="retrieval",le="0.1"} 1' in text
+    assert 'latency_bucket{stage="retrieval",le="1.0"} 3' in text
+    assert 'latency_bucket{stage="retrieval",le="+Inf"} 4' in text
+    assert 'latency_sum{stage="retrieval"} 6.05' in text
+    assert 'latency_count{stage="retrieval"} 4' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("errors", "Errors.", ("stage",)).inc('bad "quote"\n')
+    assert 'errors_total{stage="bad \\"quote\\"\\n"} 1' in registry.render()
+
+
+def test_registering_a_name_twice_reuses_the_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("requests", "Requests.")
+    assert registry.counter("requests", "Requests.") is first
+
+
+def counter_value(counter, *labels):
+    return dict(counter._values).get(labels, 0)
+
+
+def test_traces_record_the_path_and_the_failing_stage():
+    requests = counter_value(CHAT_REQUESTS, "test", "error")
+    errors = counter_value(CHAT_ERRORS, "test", "retrieval")
+    trace, token = start_trace("test")
+    assert current_trace() is trace
+    with span("customer_lookup"):
+        pass
+    with pytest.raises(KeyError):
+        with span("retrieval"):
+            raise KeyError("missing")
+    set_path("error")
+    finish_trace(trace, token)
+
+    assert current_trace() is None
+    assert set(trace.report()["spans_ms"]) == {"customer_lookup", "retrieval"}
+    assert trace.report()["failed_stage"] == "retrieval"
+    assert counter_value(CHAT_REQUESTS, "test", "error") == requests + 1
+    assert counter_value(CHAT_ERRORS, "test", "retrieval") == errors + 1
+
+
+def test_metrics_endpoint_parses(chat_app):
+    chat_app.app.test_client().post("/api/chat", json={"message": "Can I bring my dog?"})
+    response = chat_app.app.test_client().get("/metrics")
+    rendered = families(response.get_data(as_text=True))
+    assert rendered["chat_requests_total"]["type"] == "counter"
+    assert rendered["chat_requests_total"]["samples"]
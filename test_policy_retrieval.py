@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from policy_retrieval import PolicyRetriever
+
+QUERIES = [
+    "How many checked bags do gold members get?",
+    "Can I get a refund if I cancel?",
+    "I need a wheelchair at the airport",
+    "How do I earn miles?",
+    "My flight was delayed, can I rebook?",
+    "zzz qqq",
+]
+
+
+@pytest.fixture(scope="module")
+def retriever():
+    return PolicyRetriever(os.path.join(os.path.dirname(__file__), "policies"))
+
+
+def scan(retriever, query, top_n=3):
+    """Per-query reference: re-vectorize every chunk and keep each policy's best one."""
+    query_vector = retriever.vectorizer.transform([retriever.expand_query(query)])
+    best = {}
+    for policy_name, content in retriever.policies.items():
+        chunks = retriever.split_into_chunks(content, policy_name)
+        if not chunks:
+            continue
+        scores = (retriever.vectorizer.transform(chunks) @ query_vector.T).toarray().ravel()
+        best[policy_name] = (scores.max(), chunks[int(np.argmax(scores))])
+    ranked = sorted(best.items(), key=lambda item: -item[1][0])[:top_n]
+    return [(policy_name, chunk) for policy_name, (score, chunk) in ranked if score > 0.05]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_precomputed_matrix_matches_a_per_query_scan(retriever, query):
+    assert retriever.get_relevant_policies(query) == scan(retriever, query)
+
+
+def test_batched_queries_match_single_queries(retriever):
+    batched = retriever.get_relevant_policies_many(QUERIES)
+    assert batched == [retriever.get_relevant_policies(query) for query in QUERIES]
+
+
+def test_results_name_each_policy_once(retriever):
+    results = retriever.get_relevant_policies("checked bag fees refund cancellation miles", top_n=5)
+    names = [policy_name for policy_name, _ in results]
+    assert len(names) == len(set(names)) > 1
+    assert results[0][1].startswith("SkyWay Airlines")
+
+
+def test_best_chunks_breaks_ties_to_the_earliest_chunk(retriever):
+    scores = np.zeros((1, len(retriever.chunks)))
+    best_idx, best_scores = retriever.best_chunks(scores)
+    assert best_idx[0].tolist() == retriever.doc_offsets.tolist()
+    assert not best_scores.any()
+
+
+def test_unmatched_queries_format_a_fallback(retriever):
+    assert retriever.format_for_prompt("zzz qqq") == "No specific policy information found for this query."
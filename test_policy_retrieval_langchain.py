@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from embedding_client import EmbeddingClient
+from policy_retrieval_langchain import BackendEmbeddings, PolicyRetrieverLangChain
+
+
+class RecordingEmbeddings(BackendEmbeddings):
+    """Remembers every batch of documents it is asked to embed."""
+
+    def __init__(self, backend):
+        super().__init__(backend, client=EmbeddingClient(backend))
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def embeddings(mock_backend):
+    return RecordingEmbeddings(mock_backend)
+
+
+def open_retriever(policy_dir, embeddings, tmp_path, **kwargs):
+    return PolicyRetrieverLangChain(policy_dir=str(policy_dir), embeddings=embeddings,
+                                    cache_dir=str(tmp_path / "cache"), **kwargs)
+
+
+@pytest.fixture
+def retriever(policy_dir, embeddings, tmp_path, monkeypatch):
+    monkeypatch.setenv("POLICY_REFRESH_INTERVAL_SECONDS", "0")
+    return open_retriever(policy_dir, embeddings, tmp_path)
+
+
+def edit_policy(policy_dir, old, new):
+    path = policy_dir / "baggage_policy.txt"
+    text = path.read_text()
+    assert old in text
+    path.write_text(text.replace(old, new))
+
+
+def test_refresh_embeds_only_changed_chunks(retriever, embeddings, policy_dir):
+    total = retriever.vector_store.index.ntotal
+    embeddings.batches.clear()
+
+    edit_policy(policy_dir, "Gold members: Two checked bags free", "Gold members: Three checked bags free")
+    counts = retriever.refresh()
+
+    assert counts == {"added": 1, "removed": 1, "unchanged": total - 1}
+    assert len(embeddings.batches) == 1 and len(embeddings.batches[0]) == 1
+    assert "Gold members: Three checked bags free" in embeddings.batches[0][0]
+    assert retriever.vector_store.index.ntotal == total
+    assert "Three checked bags free" in retriever.format_for_prompt("gold checked bags")
+
+
+def test_refresh_without_changes_embeds_nothing(retriever, embeddings):
+    embeddings.batches.clear()
+    counts = retriever.refresh()
+    assert counts["added"] == 0 and counts["removed"] == 0
+    assert embeddings.batches == []
+
+
+def test_refresh_reuses_the_on_disk_cache(retriever, embeddings, policy_dir, tmp_path):
+    edit_policy(policy_dir, "Platinum members: Three checked bags free", "Platinum members: Four checked bags free")
+    retriever.refresh()
+    embeddings.batches.clear()
+
+    reopened = open_retriever(policy_dir, embeddings, tmp_path)
+    assert embeddings.batches == []
+    assert reopened.index_key == retriever.index_key
+
+
+def test_queries_pick_up_edited_policies(retriever, embeddings, policy_dir):
+    retriever.refresh_interval = 0.01
+    edit_policy(policy_dir, "Silver members: First checked bag free", "Silver members: First checked bag $10")
+    time.sleep(0.02)
+
+    retriever.format_for_prompt("silver checked bag fee")
+    assert retriever.wait_for_refresh(timeout=10)
+    assert "First checked bag $10" in retriever.format_for_prompt("silver checked bag fee")
+    # Unchanged files are not re-read until the next edit
+    embeddings.batches.clear()
+    time.sleep(0.02)
+    assert retriever.refresh_if_changed() is None
+    assert embeddings.batches == []
+
+
+def test_queries_are_served_from_the_current_index_while_refreshing(retriever, embeddings, policy_dir, monkeypatch):
+    release = threading.Event()
+    embed_documents = embeddings.embed_documents
+
+    def slow_embed_documents(texts):
+        release.wait(10)
+        return embed_documents(texts)
+
+    monkeypatch.setattr(embeddings, "embed_documents", slow_embed_documents)
+    retriever.refresh_interval = 0.01
+    edit_policy(policy_dir, "Silver members: First checked bag free", "Silver members: First checked bag $10")
+    time.sleep(0.02)
+    index_key = retriever.index_key
+
+    started = time.perf_counter()
+    first = retriever.format_for_prompt("silver checked bag fee")
+    second = asyncio.run(retriever.aformat_for_prompt("silver checked bag fee"))
+    assert time.perf_counter() - started < 5
+    assert "First checked bag free" in first and "First checked bag free" in second
+    assert retriever.index_key == index_key and not retriever.wait_for_refresh(timeout=0)
+
+    release.set()
+    assert retriever.wait_for_refresh(timeout=10)
+    assert retriever.index_key != index_key
+    assert "First checked bag $10" in retriever.format_for_prompt("silver checked bag fee")
+
+
+def test_disabled_interval_never_checks(retriever, policy_dir):
+    edit_policy(policy_dir, "Gold members: Two checked bags free", "Gold members: Five checked bags free")
+    assert not retriever.policies_changed()
+    assert "Five checked bags" not in retriever.format_for_prompt("gold checked bags")
+
+
+def test_cached_index_is_loaded_without_embedding(retriever, embeddings, policy_dir, tmp_path):
+    embeddings.batches.clear()
+    reopened = open_retriever(policy_dir, embeddings, tmp_path)
+    assert embeddings.batches == []
+    assert reopened.vector_store.index.ntotal == retriever.vector_store.index.ntotal
+    assert reopened.get_relevant_policies("gold checked bags") == retriever.get_relevant_policies("gold checked bags")
+
+
+def test_index_key_follows_policy_content_and_settings(retriever, embeddings, policy_dir, tmp_path):
+    documents = retriever.load_policies()
+    assert retriever.compute_index_key(documents) == retriever.index_key
+
+    edit_policy(policy_dir, "Gold members: Two checked bags free", "Gold members: Six checked bags free")
+    assert retriever.compute_index_key(retriever.load_policies()) != retriever.index_key
+
+    retriever.section_max_tokens = 200
+    assert retriever.compute_index_key(documents) != retriever.index_key
+
+
+def test_unreadable_cache_is_rebuilt(retriever, embeddings, policy_dir, tmp_path):
+    index_file = tmp_path / "cache" / retriever.index_key / "index.faiss"
+    index_file.write_bytes(b"not an index")
+    embeddings.batches.clear()
+
+    reopened = open_retriever(policy_dir, embeddings, tmp_path)
+    assert embeddings.batches
+    assert reopened.vector_store.index.ntotal == retriever.vector_store.index.ntotal
+
+
+def test_repeated_queries_reuse_the_query_embedding(retriever, mock_backend):
+    embed_calls = mock_backend.calls["embed"]
+    retriever.get_relevant_policies("Can I bring my dog?")
+    retriever.get_relevant_policies("can i bring my dog")
+    assert mock_backend.calls["embed"] == embed_calls + 1
+    assert retriever.query_cache.stats()["hits"] == 1
@@ -0,0 +1,72 @@
+import os
+
+from history_budget import count_tokens
+from policy_sections import index_sections, split_sections
+
+DOCUMENT = """# Baggage Policy
+
+## Carry-on Baggage
+- One carry-on bag
+- One personal item
+
+## Checked Baggage
+### Fees
+- Standard passengers: $30
+
+### Allowance
+Gold members get two bags free.
+"""
+
+
+def test_each_heading_with_a_body_is_one_section():
+    sections = split_sections(DOCUMENT, "baggage")
+    assert [section.heading_path for section in sections] == [
+        ("Baggage Policy", "Carry-on Baggage"),
+        ("Baggage Policy", "Checked Baggage", "Fees"),
+        ("Baggage Policy", "Checked Baggage", "Allowance"),
+    ]
+    assert sections[1].text == "Baggage Policy > Checked Baggage > Fees\n- Standard passengers: $30"
+    assert sections[1].tokens == count_tokens(sections[1].text)
+    assert sections[1].metadata()["heading_path"] == ["Baggage Policy", "Checked Baggage", "Fees"]
+
+
+def test_section_ids_survive_edits_but_chunk_ids_do_not():
+    before = split_sections(DOCUMENT, "baggage")
+    after = split_sections(DOCUMENT.replace("$30", "$35"), "baggage")
+    assert [s.section_id for s in before] == [s.section_id for s in after]
+    assert before[1].chunk_id != after[1].chunk_id
+    assert before[0].chunk_id == after[0].chunk_id
+    # The same text in another document is a different chunk
+    assert split_sections(DOCUMENT, "other")[0].chunk_id != before[0].chunk_id
+
+
+def test_long_sections_are_split_between_list_items():
+    items = "\n".join(f"- Rule {n}: " + "word " * 20 for n in range(20))
+    sections = split_sections(f"# Policy\n## Rules\n{items}", "rules", max_tokens=100)
+    assert len(sections) > 1
+    assert {section.parts for section in sections} == {len(sections)}
+    assert [section.part for section in sections] == list(range(1, len(sections) + 1))
+    assert all(section.text.startswith("Policy > Rules\n- Rule") for section in sections)
+    assert all(section.tokens <= 100 for section in sections)
+    # Every item lands in exactly one part
+    assert sum(section.body.count("- Rule") for section in sections) == 20
+    assert len({section.section_id for section in sections}) == 1
+
+
+def test_repeated_bodies_are_dropped_and_repeated_headings_numbered():
+    text = "# Policy\n## Fees\n- $30\n## Fees\n- $30\n## Fees\n- $40\n"
+    sections = split_sections(text, "fees")
+    assert [section.body for section in sections] == ["- $30", "- $40"]
+    assert sections[0].section_id != sections[1].section_id
+
+
+def test_bundled_policies_index_cleanly():
+    policy_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "policies")
+    policies = {}
+    for name in sorted(os.listdir(policy_dir)):
+        with open(os.path.join(policy_dir, name)) as f:
+            policies[name] = f.read()
+    sections = index_sections(policies)
+    assert len(sections) > len(policies)
+    assert all(chunk_id == section.chunk_id for chunk_id, section in sections.items())
+    assert all(len(section.heading_path) >= 2 for section in sections.values())
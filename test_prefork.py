@@ -0,0 +1,97 @@
+import gc
+import os
+import runpy
+
+import pytest
+
+import prefork
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def hooks(monkeypatch):
+    """Empty hook lists for the test; the collector is unfrozen afterwards."""
+    for name in ("_master_ready_hooks", "_worker_start_hooks", "_reload_hooks"):
+        monkeypatch.setattr(prefork, name, [])
+    calls = []
+    yield calls
+    gc.unfreeze()
+
+
+def test_master_hooks_run_before_state_is_frozen(hooks):
+    prefork.on_master_ready(lambda: hooks.append(("ready", gc.get_freeze_count())))
+    prefork.prepare_master()
+    assert hooks == [("ready", 0)]
+    assert gc.get_freeze_count() > 0
+
+
+def test_worker_hooks_run_in_the_child(hooks):
+    shared = {}
+    prefork.on_master_ready(lambda: shared.update(index="built in master"))
+    prefork.on_worker_start(lambda: shared.update(worker=os.getpid()))
+    prefork.prepare_master()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            prefork.start_worker()
+            os.write(write_fd, f"{shared['index']}|{shared['worker']}".encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    message = os.read(read_fd, 1024).decode()
+    os.waitpid(pid, 0)
+    assert message == f"built in master|{pid}"
+    # The master itself never ran the worker hooks
+    assert "worker" not in shared
+
+
+def test_reload_keeps_going_when_a_hook_fails(hooks, caplog):
+    @prefork.on_reload
+    def broken():
+        raise RuntimeError("policy directory missing")
+
+    prefork.on_reload(lambda: hooks.append(("reload", gc.get_freeze_count())))
+    prefork.on_master_ready(lambda: hooks.append(("ready", gc.get_freeze_count())))
+    prefork.prepare_master()
+    prefork.reload_master()
+
+    # Reload hooks run unfrozen, then the shared state is rebuilt and frozen again
+    assert hooks == [("ready", 0), ("reload", 0), ("ready", 0)]
+    assert gc.get_freeze_count() > 0
+    assert "broken failed" in caplog.text
+
+
+def test_gunicorn_config_wires_the_hooks(hooks, monkeypatch):
+    monkeypatch.setattr(os, "environ", {"PORT": "9000"})
+    config = runpy.run_path(os.path.join(REPO_DIR, "gunicorn.conf.py"))
+    assert config["preload_app"] and config["bind"] == "0.0.0.0:9000"
+    # Workers rely on SIGHUP reloads instead of each re-indexing on its own
+    assert os.environ["POLICY_REFRESH_INTERVAL_SECONDS"] == "0"
+
+    prefork.on_master_ready(lambda: hooks.append("ready"))
+    prefork.on_worker_start(lambda: hooks.append("worker"))
+    prefork.on_reload(lambda: hooks.append("reload"))
+    config["when_ready"](None)
+    config["post_fork"](None, None)
+    config["on_reload"](None)
+    assert hooks == ["ready", "worker", "reload", "ready"]
+
+
+def test_app_reload_reindexes_edited_policies(chat_app, policy_dir):
+    retriever = chat_app.policy_retriever.get()
+    vector_retriever = retriever.vector_retriever
+    original_dir = vector_retriever.policy_dir
+    path = policy_dir / "baggage_policy.txt"
+    path.write_text(path.read_text().replace("Gold members: Two checked bags free",
+                                             "Gold members: Nine checked bags free"))
+    vector_retriever.policy_dir = str(policy_dir)
+    try:
+        chat_app.reload_shared_state()
+        assert "Nine checked bags free" in retriever.format_for_prompt("gold checked bags")
+    finally:
+        vector_retriever.policy_dir = original_dir
+        chat_app.reload_shared_state()
+    assert "Two checked bags free" in retriever.format_for_prompt("gold checked bags")
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from response_cache import (ResponseCache, is_faq_question, mentions_loyalty_tiers, policy_files_signature)
+
+QUESTION = "What is the carry-on size limit?"
+
+
+def test_personal_questions_are_not_cached():
+    assert is_faq_question("Can I bring my dog on board?")
+    assert not is_faq_question("Is my flight delayed?")
+    assert not is_faq_question("What gate do I board at?")
+    assert not is_faq_question("")
+
+
+@pytest.mark.parametrize("text", ["Standard passengers pay $30", "Silver members", "Gold: two bags",
+                                  "Platinum: three checked bags free"])
+def test_every_loyalty_tier_makes_answers_tier_specific(text):
+    assert mentions_loyalty_tiers(text)
+
+
+def test_tier_free_policy_text_is_shared():
+    assert not mentions_loyalty_tiers("Pets under 20 lbs may travel in the cabin.")
+
+
+def test_keys_follow_question_policy_text_and_tier():
+    key = ResponseCache.key(QUESTION, "policy", "Gold")
+    assert key == ResponseCache.key("what is the carry on size limit", "policy", "gold")
+    assert key != ResponseCache.key(QUESTION, "edited policy", "Gold")
+    assert key != ResponseCache.key(QUESTION, "policy", "Platinum")
+
+
+def test_entries_expire_and_are_evicted():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    for name in ("a", "b", "c"):
+        cache.put(name, {"response": name})
+    assert cache.get("a") is None and cache.get("c") == {"response": "c"}
+
+    expiring = ResponseCache(ttl_seconds=0.01)
+    expiring.put("a", {"response": "a"})
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+
+
+def test_results_are_copied():
+    cache = ResponseCache()
+    cache.put("a", {"response": "a"})
+    cache.get("a")["response"] = "changed"
+    assert cache.get("a") == {"response": "a"}
+
+
+def test_policy_edits_invalidate_every_entry(policy_dir):
+    cache = ResponseCache(version=lambda: policy_files_signature(str(policy_dir)), version_check_seconds=0)
+    cache.put("a", {"response": "a"})
+    assert cache.get("a") is not None
+
+    path = policy_dir / "baggage_policy.txt"
+    path.write_text(path.read_text() + "\nEdited.\n")
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+@pytest.fixture
+def cached_app(chat_app, policy_dir, monkeypatch):
+    cache = ResponseCache(version=lambda: policy_files_signature(str(policy_dir)), version_check_seconds=0)
+    monkeypatch.setattr(chat_app, "RESPONSE_CACHE", cache)
+    return chat_app
+
+
+def test_repeated_questions_are_answered_from_the_cache(cached_app, mock_backend):
+    first = cached_app.process_chat("C001", QUESTION, [])
+    second = cached_app.process_chat("C001", QUESTION, [])
+    assert first["cached"] is False and second["cached"] is True
+    assert second["response"] == first["response"]
+    # Follow-up turns depend on the conversation, so they always go to the model
+    assert "cached" not in cached_app.process_chat("C001", QUESTION, [{"role": "user", "content": "Hi"}])
+
+
+def test_async_chat_shares_the_cache(cached_app):
+    first = asyncio.run(cached_app.process_chat_async("C002", QUESTION, []))
+    assert first["cached"] is False
+    assert asyncio.run(cached_app.process_chat_async("C002", QUESTION, []))["cached"] is True
+    assert cached_app.process_chat("C002", QUESTION, [])["cached"] is True
+    assert cached_app.RESPONSE_CACHE.stats()["hits"] == 2
+
+
+def test_edited_policies_are_not_served_from_the_cache(cached_app, policy_dir):
+    cached_app.process_chat("C001", QUESTION, [])
+    path = policy_dir / "baggage_policy.txt"
+    path.write_text(path.read_text() + "\nEdited.\n")
+    assert cached_app.process_chat("C001", QUESTION, [])["cached"] is False
+    assert asyncio.run(cached_app.process_chat_async("C001", QUESTION, []))["cached"] is True
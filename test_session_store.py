@@ -0,0 +1,199 @@
+import time
+import uuid
+
+import pytest
+
+from session_store import (MAX_CACHED_RETRIEVALS, ConversationSession, DiskSessionStore, InMemorySessionStore,
+                           clean_history)
+
+HISTORY = [
+    {"role": "user", "content": "My booking is ABC123"},
+    {"role": "assistant", "content": "Thanks, Jane. How can I help?"},
+]
+
+
+def test_customer_context_is_rebuilt_only_when_details_change():
+    session = ConversationSession("c1", "C001")
+    builds = []
+
+    def build(details):
+        builds.append(details)
+        return f"context for {details['status']}"
+
+    assert session.get_customer_context({"status": "On Time"}, build) == "context for On Time"
+    assert session.get_customer_context({"status": "On Time"}, build) == "context for On Time"
+    assert session.get_customer_context({"status": "Delayed"}, build) == "context for Delayed"
+    assert len(builds) == 2
+
+
+def test_retrievals_are_reused_for_the_same_index_only():
+    session = ConversationSession("c1")
+    calls = []
+
+    def retrieve(message):
+        calls.append(message)
+        return f"policy text {len(calls)}"
+
+    assert session.get_policy_info("Pet policy?", retrieve, "index-1") == "policy text 1"
+    assert session.get_policy_info("pet policy", retrieve, "index-1") == "policy text 1"
+    # The policies were edited and re-indexed: nothing retrieved before is reused
+    assert session.lookup_policy_info("pet policy", "index-2") is None
+    assert session.get_policy_info("pet policy", retrieve, "index-2") == "policy text 2"
+    assert calls == ["Pet policy?", "pet policy"]
+
+
+def test_retrieval_cache_is_bounded():
+    session = ConversationSession("c1")
+    for n in range(MAX_CACHED_RETRIEVALS + 5):
+        session.store_policy_info(f"question {n}", "text", "index-1")
+    assert len(session.retrievals) == MAX_CACHED_RETRIEVALS
+    assert session.lookup_policy_info("question 0", "index-1") is None
+
+
+def test_empty_sessions_adopt_the_client_history():
+    session = ConversationSession("c1", "C001")
+    assert session.sync_history(HISTORY + [{"role": "system", "content": "ignored"}, "junk"])
+    assert session.history == HISTORY
+    assert not session.sync_history([])
+    assert not session.sync_history("not a list")
+
+
+def test_sessions_missing_the_latest_turn_adopt_the_client_history():
+    session = ConversationSession("c1", "C001", history=HISTORY[:], summary="older turns", summarized_count=2)
+    assert not session.sync_history(HISTORY)
+    assert session.summary == "older turns"
+
+    longer = HISTORY + [{"role": "user", "content": "Can I change seats?"},
+                        {"role": "assistant", "content": "Yes, for $25."}]
+    assert session.sync_history(longer)
+    assert session.history == longer and session.message_count == 4
+    # The summarized turns are unchanged, so the summary still covers them
+    assert session.summary == "older turns" and session.summarized_count == 2
+
+
+def test_diverged_histories_keep_the_summary_of_the_shared_turns():
+    session = ConversationSession("c1", "C001")
+    for n in range(30):
+        session.record_turn(f"question {n}", f"answer {n}")
+    client = session.history[:]
+    session.fold_history(40, "summary")
+    # The client never received the last reply, and the session dropped 12 summarized messages
+    session.record_turn("one more", "reply")
+    assert session.message_count == 62 and len(session.history) == 50
+
+    assert session.sync_history(client)
+    assert session.history == client[12:] and session.message_count == 60
+    assert session.summary == "summary" and session.summarized_count == 28
+    assert session.history_marker() == ConversationSession("c2", history=client).history_marker()
+
+    rewritten = client[:20] + [{"role": "user", "content": "something else"}] + client[21:] + [
+        {"role": "user", "content": "next question"}, {"role": "assistant", "content": "next answer"}]
+    assert session.sync_history(rewritten)
+    assert session.history == rewritten and session.summary is None and session.summarized_count == 0
+
+
+def test_record_turn_drops_only_summarized_messages():
+    session = ConversationSession("c1")
+    for n in range(30):
+        session.record_turn(f"question {n}", f"answer {n}")
+    assert len(session.history) == 60
+    session.fold_history(40, "summary")
+    session.record_turn("one more", "reply")
+    assert len(session.history) == 50
+    assert session.summarized_count == 28
+    assert session.unsummarized_history()[-1] == {"role": "assistant", "content": "reply"}
+
+
+def test_clean_history_keeps_only_well_formed_messages():
+    assert clean_history([{"role": "user", "content": "hi", "extra": 1}, {"role": "user", "content": 5}]) == [
+        {"role": "user", "content": "hi"}]
+
+
+def test_memory_store_evicts_and_expires():
+    store = InMemorySessionStore(max_sessions=2, ttl_seconds=60)
+    for conversation_id in ("a", "b", "c"):
+        store.save(ConversationSession(conversation_id))
+    assert store.load("a") is None and store.load("c") is not None
+
+    expiring = InMemorySessionStore(ttl_seconds=0.01)
+    expiring.save(ConversationSession("a"))
+    time.sleep(0.02)
+    assert expiring.load("a") is None
+
+
+def test_disk_store_shares_sessions_between_instances(tmp_path):
+    first, second = DiskSessionStore(str(tmp_path)), DiskSessionStore(str(tmp_path))
+    session = first.load_or_create("conversation", "C001")
+    session.record_turn("hello", "hi there")
+    session.store_policy_info("hello", "policy", "index-1")
+    first.save(session)
+
+    loaded = second.load("conversation")
+    assert loaded.history == session.history
+    assert loaded.lookup_policy_info("hello", "index-1") == "policy"
+
+    loaded.record_turn("bye", "goodbye")
+    time.sleep(0.01)
+    second.save(loaded)
+    assert len(first.load("conversation").history) == 4
+
+
+def post(chat_app, status=200, path="/api/chat", **payload):
+    response = chat_app.app.test_client().post(path, json={"customer_id": "C001", **payload})
+    assert response.status_code == status
+    return response.get_json()
+
+
+def test_unknown_conversations_are_seeded_from_the_client(chat_app):
+    conversation_id = str(uuid.uuid4())
+    result = post(chat_app, conversation_id=conversation_id, message="What about my bags?", chat_history=HISTORY)
+    assert result["prompt_tokens"]["history_messages"] == 2
+    session = chat_app.SESSION_STORE.load(conversation_id)
+    assert session.history[:2] == HISTORY and len(session.history) == 4
+
+    # Later turns use the server's copy even when the client sends nothing
+    result = post(chat_app, conversation_id=conversation_id, message="And pets?")
+    assert result["prompt_tokens"]["history_messages"] == 4
+
+
+def test_clients_send_only_the_new_message_while_the_marker_matches(chat_app):
+    conversation_id = str(uuid.uuid4())
+    first = post(chat_app, conversation_id=conversation_id, message="What about my bags?", history_marker=None)
+    second = post(chat_app, conversation_id=conversation_id, message="And pets?",
+                  history_marker=first["history_marker"])
+    assert second["prompt_tokens"]["history_messages"] == 2
+    assert second["history_marker"] != first["history_marker"]
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_stale_or_missing_sessions_ask_for_the_full_history(chat_app, path):
+    conversation_id = str(uuid.uuid4())
+    first = post(chat_app, conversation_id=conversation_id, message="What about my bags?", history_marker=None)
+    # The client never received this reply
+    post(chat_app, conversation_id=conversation_id, message="And pets?", history_marker=first["history_marker"])
+
+    stale = {"conversation_id": conversation_id, "message": "Thanks", "history_marker": first["history_marker"]}
+    assert post(chat_app, status=409, path=path, **stale) == {"history_required": True,
+                                                              "conversation_id": conversation_id}
+    unknown = {**stale, "conversation_id": str(uuid.uuid4())}
+    assert post(chat_app, status=409, path=path, **unknown)["history_required"]
+
+    client_history = [{"role": "user", "content": "What about my bags?"},
+                      {"role": "assistant", "content": "(lost)"}]
+    post(chat_app, path=path, chat_history=client_history, **stale)
+    assert chat_app.SESSION_STORE.load(conversation_id).history[:2] == client_history
+
+
+def test_edited_policies_are_not_served_from_the_conversation_cache(chat_app, monkeypatch):
+    conversation_id = str(uuid.uuid4())
+    post(chat_app, conversation_id=conversation_id, message="What is the carry-on size limit?")
+    session = chat_app.SESSION_STORE.load(conversation_id)
+    stale = "From Baggage Policy:\nstale text"
+    session.retrievals = {key: stale for key in session.retrievals}
+    assert session.retrievals
+
+    retriever = chat_app.policy_retriever.get()
+    monkeypatch.setattr(retriever.vector_retriever, "index_key", "edited-policies")
+    messages, _ = chat_app.build_chat_messages("C001", "What is the carry-on size limit?", session.history, session)
+    assert not any("stale text" in message.content for message in messages)
+    assert session.retrievals_key == "edited-policies"
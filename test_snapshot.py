@@ -0,0 +1,60 @@
+import pytest
+
+from data_store import DataStore
+from snapshot import SnapshotStore, build_snapshot, open_data_store
+from test_data_store import CUSTOMERS, FLIGHTS
+
+# Rows the JSON files may contain beyond the common case: int ids and a missing flight
+EDGE_CUSTOMERS = CUSTOMERS + [
+    {"customer_id": 42, "name": "Int Id", "email": "int@example.com", "flight_id": "FL002", "loyalty_tier": "Platinum"},
+    {"customer_id": "C005", "name": "No Flight", "flight_id": None, "booking_reference": "NOF123"},
+]
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    build_snapshot(FLIGHTS, EDGE_CUSTOMERS, path)
+    return DataStore(FLIGHTS, EDGE_CUSTOMERS), SnapshotStore(path)
+
+
+CUSTOMER_KEYS = ["C001", "C002", "C003", "C005", "C999", 42, "42", None]
+
+
+@pytest.mark.parametrize("customer_id", CUSTOMER_KEYS)
+def test_customer_details_match_the_in_memory_store(stores, customer_id):
+    data_store, snapshot = stores
+    assert snapshot.get_customer_details(customer_id) == data_store.get_customer_details(customer_id)
+
+
+@pytest.mark.parametrize("flight_id", ["FL001", "FL002", "FL404", None])
+def test_flight_lookups_match_the_in_memory_store(stores, flight_id):
+    data_store, snapshot = stores
+    assert snapshot.get_flight_status(flight_id) == data_store.get_flight_status(flight_id)
+    assert (sorted(c.customer_id for c in snapshot.customers_on_flight(flight_id))
+            == sorted(c.customer_id for c in data_store.customers_on_flight(flight_id)))
+
+
+@pytest.mark.parametrize("method, key", [
+    ("find_by_booking_reference", "abc123"), ("find_by_booking_reference", "NOF123"),
+    ("find_by_booking_reference", None), ("find_by_email", "JANE@example.com"),
+    ("find_by_email", "int@example.com"), ("find_by_email", "nobody@example.com"),
+])
+def test_secondary_lookups_match_the_in_memory_store(stores, method, key):
+    data_store, snapshot = stores
+    expected = getattr(data_store, method)(key)
+    found = getattr(snapshot, method)(key)
+    assert (found.to_dict() if found else None) == (expected.to_dict() if expected else None)
+
+
+def test_open_data_store_prefers_a_fresh_snapshot(tmp_path):
+    (tmp_path / "flights.json").write_text('[{"flight_id": "FL001", "status": "On Time"}]')
+    (tmp_path / "customers.json").write_text('[]')
+    snapshot_path = tmp_path / "snapshot.bin"
+    assert isinstance(open_data_store(tmp_path, snapshot_path), DataStore)
+
+    build_snapshot([{"flight_id": "FL001", "status": "On Time"}], [], snapshot_path)
+    assert isinstance(open_data_store(tmp_path, snapshot_path), SnapshotStore)
+
+    snapshot_path.write_bytes(b"garbage")
+    assert isinstance(open_data_store(tmp_path, snapshot_path), DataStore)
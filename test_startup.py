@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from startup import Deferred, ImportProfiler
+
+
+def test_deferred_builds_once_under_concurrent_first_use():
+    builds = []
+
+    def factory():
+        time.sleep(0.05)
+        builds.append(1)
+        return {"value": 42}
+
+    deferred = Deferred(factory, name="thing")
+    assert not deferred.ready
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(deferred.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+    assert deferred.ready
+
+
+def test_attribute_access_is_forwarded():
+    deferred = Deferred(lambda: "Policy", name="text")
+    assert deferred.lower() == "policy"
+
+
+def test_failed_prewarm_leaves_the_next_get_to_retry():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("embedding API down")
+        return "built"
+
+    deferred = Deferred(factory, name="flaky")
+    deferred.prewarm()
+    deadline = time.monotonic() + 2
+    while not attempts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert deferred.get() == "built"
+    assert len(attempts) == 2
+
+
+def test_import_profiler_records_new_imports():
+    profiler = ImportProfiler().install()
+    try:
+        __import__("wave")
+    finally:
+        profiler.uninstall()
+    assert "wave" in profiler.modules
+    assert profiler.modules["wave"]["self_ms"] <= profiler.modules["wave"]["cumulative_ms"]
+
+
+def test_lazy_startup_defers_heavy_imports():
+    script = ("import sys, app; "
+              "print(app.policy_retriever.ready, sorted(m for m in ('faiss', 'langchain_community', 'sklearn') "
+              "if m in sys.modules))")
+    env = {**os.environ, "STARTUP_MODE": "lazy", "LLM_BACKEND": "mock", "FLIGHT_STATUS_FEED": ""}
+    output = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=120, check=True).stdout
+    assert output.strip().splitlines()[-1] == "False []"
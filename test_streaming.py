@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from llm_backend import MockBackend
+from streaming import EscalationFilter, sse_event
+
+
+def sse_events(body):
+    """Parse a Server-Sent Events body into (event, data) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_sse_event_framing():
+    event = sse_event("token", {"content": "line one\nline two"})
+    assert event == 'event: token\ndata: {"content": "line one\\nline two"}\n\n'
+    assert sse_events(event + sse_event("done", {"ok": True})) == [
+        ("token", {"content": "line one\nline two"}), ("done", {"ok": True})]
+
+
+def run_filter(chunks):
+    escalation_filter = EscalationFilter()
+    forwarded = [escalation_filter.feed(chunk) for chunk in chunks]
+    forwarded.append(escalation_filter.flush())
+    return forwarded, escalation_filter.detected
+
+
+@pytest.mark.parametrize("split", range(1, len("ESCALATE")))
+def test_marker_split_across_chunks_is_removed(split):
+    forwarded, detected = run_filter(["Let me get an agent. ", "ESCALATE"[:split], "ESCALATE"[split:], " Thanks"])
+    assert detected
+    assert "".join(forwarded) == "Let me get an agent.  Thanks"
+
+
+def test_only_possible_marker_prefixes_are_held_back():
+    escalation_filter = EscalationFilter()
+    assert escalation_filter.feed("Your bag is ES") == "Your bag is "
+    assert escalation_filter.feed("SENTIAL") == "ESSENTIAL"
+    assert escalation_filter.feed(" cargo E") == " cargo "
+    assert escalation_filter.flush() == "E"
+    assert not escalation_filter.detected
+
+
+def test_plain_replies_stream_unchanged():
+    forwarded, detected = run_filter(["Hello", " there", "!"])
+    assert forwarded == ["Hello", " there", "!", ""]
+    assert not detected
+
+
+def stream(chat_app, message):
+    client = chat_app.app.test_client()
+    response = client.post("/api/chat/stream", json={"customer_id": "C001", "message": message})
+    assert response.mimetype == "text/event-stream"
+    return sse_events(response.get_data(as_text=True))
+
+
+def test_stream_sends_tokens_then_done(chat_app):
+    events = stream(chat_app, "What is the carry-on size limit?")
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"token"} and len(names) > 2
+    done = events[-1][1]
+    assert done["response"] == "".join(data["content"] for name, data in events if name == "token")
+    assert not done["needs_escalation"]
+
+
+def test_stream_flags_escalation_and_strips_the_marker(chat_app, monkeypatch):
+    monkeypatch.setattr(chat_app, "BACKEND", MockBackend(latency="fixed:0", token_ms=0, escalation_rate=1))
+    events = stream(chat_app, "I want to speak to a manager about my lost luggage")
+    names = [name for name, _ in events]
+    assert names.count("escalation") == 1 and names[-1] == "done"
+    tokens = "".join(data["content"] for name, data in events if name == "token")
+    assert "ESCALATE" not in tokens
+    done = events[-1][1]
+    assert done["needs_escalation"] and done["structured_summary"]
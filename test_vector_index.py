@@ -0,0 +1,98 @@
+import faiss
+import numpy as np
+import pytest
+
+from vector_index import IndexSpec, build_index, default_pq_m, index_nbytes, recall_report
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    # Clustered data, like embeddings of related policy chunks
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    return (centers[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, 32))).astype("float32")
+
+
+# Eight 4-dimension sub-vectors of 4 bits: coarse, but quick to train
+PQ_SPEC = IndexSpec("ivfpq", pq_m=8, pq_bits=4)
+
+
+@pytest.fixture(scope="module")
+def pq_index(vectors):
+    return build_index(vectors, PQ_SPEC)
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(ValueError):
+        IndexSpec("annoy")
+    with pytest.raises(ValueError):
+        IndexSpec("flat", storage="int8")
+
+
+def test_specs_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("VECTOR_INDEX", "ivfpq")
+    monkeypatch.setenv("VECTOR_INDEX_PQ_M", "8")
+    monkeypatch.setenv("VECTOR_INDEX_NPROBE", "4")
+    spec = IndexSpec.from_env()
+    assert spec.kind == "ivfpq" and spec.pq_m == 8 and spec.nprobe == 4
+
+
+def test_cache_settings_leave_out_search_knobs():
+    assert IndexSpec("hnsw", ef_search=16).cache_settings() == IndexSpec("hnsw", ef_search=256).cache_settings()
+    assert IndexSpec("hnsw", hnsw_m=16).cache_settings() != IndexSpec("hnsw", hnsw_m=32).cache_settings()
+    assert IndexSpec("ivf", nprobe=1).cache_settings() == IndexSpec("ivf", nprobe=64).cache_settings()
+
+
+@pytest.mark.parametrize("kind, n, expected", [
+    ("flat", 10, "Flat"),
+    ("ivf", 500, "Flat"),
+    ("ivf", 4000, "IVF102,Flat"),
+    ("ivfpq", 4000, "IVF102,PQ2x6"),
+    ("ivfpq", 1000, "IVF25,PQ2x4"),
+    ("hnsw", 10, "HNSW32"),
+    ("factory:IVF8,SQ8", 10, "IVF8,SQ8"),
+])
+def test_factory_strings_scale_with_the_corpus(kind, n, expected):
+    assert IndexSpec(kind).factory_string(n, 32) == expected
+
+
+def test_float16_storage():
+    assert IndexSpec("flat", storage="float16").factory_string(10, 32) == "SQfp16"
+    assert IndexSpec("hnsw", storage="float16").factory_string(10, 32) == "HNSW32_SQfp16"
+
+
+def test_default_pq_m_divides_the_dimension():
+    assert default_pq_m(1536) == 96
+    assert default_pq_m(64) == 4
+    assert default_pq_m(10) == 1
+
+
+@pytest.mark.parametrize("kind, min_recall", [("flat", 1.0), ("hnsw", 0.95), ("ivf", 0.95)])
+def test_indexes_find_the_true_neighbours(vectors, kind, min_recall):
+    report = recall_report(vectors, IndexSpec(kind), sample_queries=100)
+    assert report["vectors"] == len(vectors)
+    assert report["recall"] >= min_recall
+
+
+def test_product_quantization_trades_recall_for_size(vectors, pq_index):
+    report = recall_report(vectors, PQ_SPEC, index=pq_index, sample_queries=100)
+    assert report["factory"] == "IVF51,PQ8x4"
+    assert report["recall"] >= 0.4
+    assert report["bytes"] < report["exact_bytes"] / 4
+
+
+def test_float16_storage_halves_the_index(vectors):
+    flat = build_index(vectors, IndexSpec("flat"))
+    half = build_index(vectors, IndexSpec("flat", storage="float16"))
+    assert index_nbytes(half) < 0.6 * index_nbytes(flat)
+
+
+def test_search_knobs_are_applied_and_swept(vectors):
+    spec = IndexSpec("ivf", nprobe=3)
+    index = build_index(vectors, spec)
+    assert faiss.extract_index_ivf(index).nprobe == 3
+
+    report = recall_report(vectors, spec, index=index, sweep=[1, 64], sample_queries=100)
+    assert report["sweep"]["nprobe=64"]["recall"] >= report["sweep"]["nprobe=1"]["recall"]
+    # The sweep leaves the configured value in place
+    assert faiss.extract_index_ivf(index).nprobe == 3
@@ -0,0 +1,239 @@
+"""
+FAISS index construction for the policy vector store.
+
+VECTOR_INDEX picks the index type:
+  flat   - exact search (the default)
+  hnsw   - HNSW graph; VECTOR_INDEX_HNSW_M links per node, VECTOR_INDEX_EF_CONSTRUCTION at build
+  ivf    - inverted lists over VECTOR_INDEX_NLIST k-means cells (default about 4 * sqrt(n))
+  ivfpq  - ivf with product-quantized codes: VECTOR_INDEX_PQ_M sub-vectors of VECTOR_INDEX_PQ_BITS bits
+  factory:<string> - any faiss.index_factory description
+
+VECTOR_INDEX_STORAGE=float16 halves the memory of the flat, hnsw and ivf vectors.
+ivfpq stores codes of PQ_M * PQ_BITS / 8 bytes per vector instead of 4 * dim.
+
+Search-time knobs trade recall for latency without a rebuild. VECTOR_INDEX_NPROBE
+sets the IVF cells visited per query, and VECTOR_INDEX_EF_SEARCH the HNSW
+candidate list size. recall_report() measures recall@k against exact search.
+
+Trained indexes (ivf, ivfpq) need enough vectors to learn from. Below
+VECTOR_INDEX_MIN_TRAIN vectors they fall back to exact search, and smaller
+corpora get fewer IVF cells and PQ bits than large ones.
+"""
+import logging
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_KINDS = ("flat", "hnsw", "ivf", "ivfpq")
+
+
+def default_pq_m(dim):
+    """Largest divisor of dim that leaves at least 16 dimensions per sub-vector."""
+    for m in range(max(1, dim // 16), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+class IndexSpec:
+    """Index type, build parameters and search parameters, normally read from the environment."""
+
+    def __init__(self, kind="flat", storage="float32", nlist=None, pq_m=None, pq_bits=8, hnsw_m=32,
+                 ef_construction=80, nprobe=16, ef_search=64, min_train=1000, max_train=200000):
+        if kind.startswith("factory:"):
+            self.factory = kind[len("factory:"):]
+            kind = "factory"
+        elif kind in INDEX_KINDS:
+            self.factory = None
+        else:
+            raise ValueError(f"Unknown VECTOR_INDEX {kind!r}; expected one of {INDEX_KINDS} or factory:<string>")
+        if storage not in ("float32", "float16"):
+            raise ValueError(f"Unknown VECTOR_INDEX_STORAGE {storage!r}")
+        self.kind = kind
+        self.storage = storage
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.min_train = min_train
+        self.max_train = max_train
+
+    @classmethod
+    def from_env(cls):
+        env = os.getenv
+        optional_int = lambda name: int(env(name)) if env(name) else None
+        return cls(
+            kind=env("VECTOR_INDEX", "flat").strip(),
+            storage=env("VECTOR_INDEX_STORAGE", "float32").strip().lower(),
+            nlist=optional_int("VECTOR_INDEX_NLIST"),
+            pq_m=optional_int("VECTOR_INDEX_PQ_M"),
+            pq_bits=int(env("VECTOR_INDEX_PQ_BITS", "8")),
+            hnsw_m=int(env("VECTOR_INDEX_HNSW_M", "32")),
+            ef_construction=int(env("VECTOR_INDEX_EF_CONSTRUCTION", "80")),
+            nprobe=int(env("VECTOR_INDEX_NPROBE", "16")),
+            ef_search=int(env("VECTOR_INDEX_EF_SEARCH", "64")),
+            min_train=int(env("VECTOR_INDEX_MIN_TRAIN", "1000")),
+            max_train=int(env("VECTOR_INDEX_MAX_TRAIN", "200000")),
+        )
+
+    @property
+    def exact(self):
+        """True when updates can be applied in place (add/remove) without retraining."""
+        return self.kind == "flat"
+
+    def cache_settings(self):
+        """Build-time settings, for the index cache key; search-time knobs are left out."""
+        settings = {"kind": self.kind, "storage": self.storage}
+        if self.kind == "factory":
+            settings["factory"] = self.factory
+        if self.kind in ("ivf", "ivfpq"):
+            settings.update(nlist=self.nlist, min_train=self.min_train)
+        if self.kind == "ivfpq":
+            settings.update(pq_m=self.pq_m, pq_bits=self.pq_bits)
+        if self.kind == "hnsw":
+            settings.update(hnsw_m=self.hnsw_m, ef_construction=self.ef_construction)
+        return settings
+
+    def factory_string(self, n, dim):
+        """faiss.index_factory description for n vectors of dim dimensions."""
+        sq = "SQfp16" if self.storage == "float16" else "Flat"
+        if self.kind == "factory":
+            return self.factory
+        if self.kind in ("ivf", "ivfpq") and n < self.min_train:
+            logger.info("%d vectors is too few to train a %s index; using exact search", n, self.kind)
+            return sq
+        if self.kind == "flat":
+            return sq
+        if self.kind == "hnsw":
+            return f"HNSW{self.hnsw_m}" + ("_SQfp16" if self.storage == "float16" else "")
+        # k-means wants at least 39 training points per cell
+        nlist = self.nlist or max(1, min(int(4 * math.sqrt(n)), n // 39))
+        if self.kind == "ivf":
+            return f"IVF{nlist},{sq}"
+        pq_m = self.pq_m or default_pq_m(dim)
+        # Each sub-quantizer has 2**bits centroids, which also want 39 points apiece
+        pq_bits = max(1, min(self.pq_bits, int(math.log2(max(2, n // 39)))))
+        return f"IVF{nlist},PQ{pq_m}x{pq_bits}"
+
+    def configure(self, index):
+        """Apply the search-time knobs to an index built or loaded with this spec."""
+        parameters = faiss.ParameterSpace()
+        if _find(index, faiss.IndexIVF) is not None:
+            parameters.set_index_parameter(index, "nprobe", self.nprobe)
+        if _find(index, faiss.IndexHNSW) is not None:
+            parameters.set_index_parameter(index, "efSearch", self.ef_search)
+        return index
+
+    def describe(self):
+        knobs = {"nprobe": self.nprobe} if self.kind in ("ivf", "ivfpq") else {}
+        if self.kind == "hnsw":
+            knobs["efSearch"] = self.ef_search
+        return {**self.cache_settings(), **knobs}
+
+
+def _find(index, index_type):
+    """Return index, or the index it wraps, if it is an instance of index_type."""
+    while index is not None:
+        index = faiss.downcast_index(index)
+        if isinstance(index, index_type):
+            return index
+        index = getattr(index, "base_index", None) or getattr(index, "index", None)
+    return None
+
+
+def build_index(vectors, spec, seed=1234):
+    """Build, train and fill an L2 index over vectors (an n x dim float32 array)."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    description = spec.factory_string(n, dim)
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if spec.kind == "hnsw":
+        _find(index, faiss.IndexHNSW).hnsw.efConstruction = spec.ef_construction
+    if not index.is_trained:
+        start = time.perf_counter()
+        sample = vectors
+        if n > spec.max_train:
+            rows = np.random.default_rng(seed).choice(n, spec.max_train, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(sample)
+        logger.info("Trained %s on %d vectors in %.1f ms", description, len(sample), (time.perf_counter() - start) * 1000)
+    index.add(vectors)
+    return spec.configure(index)
+
+
+def index_nbytes(index):
+    """Serialized size of the index, a close proxy for its memory use."""
+    nbytes = int(faiss.serialize_index(index).nbytes)
+    ivf = _find(index, faiss.IndexIVF)
+    if ivf is not None and nbytes < ivf.ntotal * ivf.code_size:
+        # Memory-mapped inverted lists are not serialized; count their codes and ids
+        nbytes += ivf.ntotal * (ivf.code_size + 8)
+    return nbytes
+
+
+def recall_at_k(index, exact_index, queries, k=10):
+    """Fraction of each query's true k nearest neighbours that index returns, plus query timings."""
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    k = min(k, exact_index.ntotal)
+    start = time.perf_counter()
+    _, truth = exact_index.search(queries, k)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    seconds = time.perf_counter() - start
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found.tolist(), truth.tolist()))
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall": round(hits / (k * len(queries)), 4) if len(queries) else None,
+        "query_ms": round(seconds * 1000 / max(1, len(queries)), 4),
+        "exact_query_ms": round(exact_seconds * 1000 / max(1, len(queries)), 4),
+    }
+
+
+def recall_report(vectors, spec, queries=None, k=10, sample_queries=200, sweep=None, index=None, seed=1234):
+    """
+    Compare an index built with spec (or the given index over the same vectors)
+    against exact search. queries defaults to a sample of the vectors. sweep lists
+    nprobe or efSearch values to try, showing the recall/latency trade-off.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if queries is None:
+        rows = np.random.default_rng(seed).choice(len(vectors), min(sample_queries, len(vectors)), replace=False)
+        queries = vectors[rows]
+    if index is None:
+        start = time.perf_counter()
+        index = build_index(vectors, spec)
+        build_ms = round((time.perf_counter() - start) * 1000, 1)
+    else:
+        build_ms = None
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+
+    report = {
+        "index": spec.describe(),
+        "factory": spec.factory_string(len(vectors), vectors.shape[1]),
+        "vectors": len(vectors),
+        "build_ms": build_ms,
+        "bytes": index_nbytes(index),
+        "exact_bytes": index_nbytes(exact_index),
+        **recall_at_k(index, exact_index, queries, k),
+    }
+    knob = "nprobe" if _find(index, faiss.IndexIVF) is not None else "efSearch" if _find(index, faiss.IndexHNSW) is not None else None
+    if sweep and knob:
+        parameters = faiss.ParameterSpace()
+        report["sweep"] = {}
+        for value in sweep:
+            parameters.set_index_parameter(index, knob, value)
+            result = recall_at_k(index, exact_index, queries, k)
+            report["sweep"][f"{knob}={value}"] = {"recall": result["recall"], "query_ms": result["query_ms"]}
+        spec.configure(index)
+    return report